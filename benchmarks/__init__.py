@@ -0,0 +1,38 @@
+"""
+性能基准脚本，在独立的测试数据库中运行，不会影响开发数据库：
+    python -m benchmarks.<脚本名>
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup():
+    """初始化Django并创建测试数据库，返回销毁测试数据库的函数"""
+    sys.path.insert(0, BASE_DIR)
+    profile = os.environ.get('MYSITE_PROFILE', 'develop')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings.%s' % profile)
+
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+
+    def teardown():
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    return teardown
+
+
+@contextmanager
+def timer(label):
+    start = time.perf_counter()
+    yield
+    print('%-40s %.2fms' % (label, (time.perf_counter() - start) * 1000))
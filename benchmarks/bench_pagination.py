@@ -0,0 +1,67 @@
+"""
+文章列表分页基准：偏移分页与游标分页，第1页与第5000页的响应时间
+    python -m benchmarks.bench_pagination [--posts 100000] [--page 5000]
+"""
+import argparse
+import time
+
+from benchmarks import setup
+
+
+def create_posts(num):
+    from django.contrib.auth.models import User
+    from blog.models import Category, Post
+
+    user = User.objects.create_user('bench', 'bench@mail.com', 'password')
+    category = Category.objects.create(name='分页', owner=user)
+    for start in range(0, num, 5000):
+        Post.objects.bulk_create([
+            Post(title='文章%d' % i, desc='摘要%d' % i, content='正文', content_html='<p>正文</p>', category=category, owner=user)
+            for i in range(start, min(start + 5000, num))
+        ])
+
+
+def measure(client, params, runs=20):
+    from django.urls import reverse
+
+    client.get(reverse('index'), params)  # 预热（游标分页的文章总数缓存）
+    start = time.perf_counter()
+    for _ in range(runs):
+        response = client.get(reverse('index'), params)
+        assert response.status_code == 200
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--page', type=int, default=5000)
+    args = parser.parse_args()
+
+    teardown = setup()
+    from django.test import Client, override_settings
+    from blog.models import Post
+    from blog.views import IndexView
+
+    try:
+        create_posts(args.posts)
+        per_page = IndexView.paginate_by
+        cursor = Post.objects.order_by('-id').values_list('id', flat=True)[(args.page - 1) * per_page - 1]
+        client = Client()
+        with override_settings(PAGE_CACHE_TIMEOUT=0):
+            with override_settings(POST_LIST_PAGINATION='offset'):
+                offset_first = measure(client, {})
+                offset_deep = measure(client, {'page': args.page})
+            keyset_first = measure(client, {})
+            keyset_deep = measure(client, {'before': cursor, 'page': args.page})
+
+        print('%d 篇文章，每页 %d 篇' % (args.posts, per_page))
+        print('%-10s %12s %12s' % ('mode', 'page 1', 'page %d' % args.page))
+        print('%-10s %10.2fms %10.2fms' % ('offset', offset_first, offset_deep))
+        print('%-10s %10.2fms %10.2fms' % ('keyset', keyset_first, keyset_deep))
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+列表页、详情页每个请求的SQL查询数量：
+    python -m benchmarks.bench_queries
+"""
+from unittest import mock
+
+from benchmarks import setup
+
+
+def create_data(post_count=50):
+    from django.contrib.auth.models import User
+    from blog.models import Category, Post, Tag
+    from config.models import SideBar
+
+    user = User.objects.create_user('bench', 'bench@mail.com', 'password')
+    categories = [Category.objects.create(name='分类%d' % i, is_nav=i < 3, owner=user) for i in range(6)]
+    tags = [Tag.objects.create(name='标签%d' % i, owner=user) for i in range(5)]
+    for display_type, _ in SideBar.SIDE_TYPE:
+        SideBar.objects.create(title='侧边栏%d' % display_type, display_type=display_type, content='<p>html</p>', owner=user)
+
+    posts = []
+    for i in range(post_count):
+        post = Post.objects.create(title='文章%d' % i, content='# 文章%d' % i, category=categories[i % 6], owner=user)
+        post.tag.add(*tags[:i % 3 + 1])
+        posts.append(post)
+    return posts
+
+
+def count_queries(client, url):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    client.get(url)  # 预热缓存
+    with CaptureQueriesContext(connection) as context:
+        client.get(url)
+    return len(context.captured_queries)
+
+
+def main():
+    teardown = setup()
+    from django.test import Client, override_settings
+    from django.urls import reverse
+    from blog.counter import visit_counter
+    from blog.models import Category
+
+    try:
+        with override_settings(VISIT_FLUSH_INTERVAL=60, PAGE_CACHE_TIMEOUT=0):  # 统计渲染页面的查询数，不走整页缓存
+            posts = create_data()
+            client = Client()
+            urls = [
+                ('IndexView', reverse('index')),
+                ('PostDetailView', reverse('post-detail', args=(posts[0].id,))),
+            ]
+            print('%-20s %10s %10s' % ('view', 'before', 'after'))
+            for name, url in urls:
+                with mock.patch.object(Category, 'get_navs', Category.load_navs):
+                    before = count_queries(client, url)
+                after = count_queries(client, url)
+                print('%-20s %10d %10d' % (name, before, after))
+            visit_counter.stop()
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+全文搜索基准：合成文章语料，对比icontains扫描、SQLite FTS5和纯Python索引
+    python -m benchmarks.bench_search [--posts 100000]
+"""
+import argparse
+import random
+import time
+
+from benchmarks import setup, timer
+
+WORDS_CN = ('数据库 索引 缓存 优化 性能 分布式 架构 微服务 容器 部署 前端 后端 算法 网络 安全 测试 '
+            '监控 日志 队列 并发 线程 进程 内存 磁盘 搜索 推荐 存储 协议 框架 设计').split()
+WORDS_EN = ('django python mysql redis nginx docker kubernetes linux react vue golang rust java '
+            'android ios http tcp sql orm api cache queue thread async index search').split()
+QUERIES = ['数据库', '分布式缓存', 'django', 'redis 队列', '微服务架构 docker', 'rust 内存安全']
+
+
+def sentence(rng, length):
+    return ''.join(rng.choice(WORDS_CN) if rng.random() < 0.6 else ' %s ' % rng.choice(WORDS_EN) for _ in range(length))
+
+
+def create_posts(num):
+    from django.contrib.auth.models import User
+    from blog.models import Category, Post
+
+    rng = random.Random(2019)
+    user = User.objects.create_user('bench', 'bench@mail.com', 'password')
+    category = Category.objects.create(name='合成语料', owner=user)
+    batch = []
+    for i in range(num):
+        content = sentence(rng, 40)
+        batch.append(Post(title=sentence(rng, 4), desc=sentence(rng, 8), content=content, content_html=content,
+                          category=category, owner=user))
+        if len(batch) == 5000:
+            Post.objects.bulk_create(batch)
+            batch = []
+    Post.objects.bulk_create(batch)
+
+
+def bench_queries(label, search):
+    for query in QUERIES:
+        start = time.perf_counter()
+        total, ids = search(query)
+        print('  %-12s %-22s hits=%-7d top20 %.2fms' % (label, query, total, (time.perf_counter() - start) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=100000)
+    args = parser.parse_args()
+
+    teardown = setup()
+    from functools import reduce
+    from operator import and_
+    from django.db.models import Q
+    from blog.models import Post
+    from blog.search import PythonSearchBackend, SQLiteFTSBackend
+
+    try:
+        with timer('生成 %d 篇文章' % args.posts):
+            create_posts(args.posts)
+
+        def icontains(query):
+            condition = reduce(and_, [Q(title__icontains=word) | Q(desc__icontains=word) | Q(content__icontains=word)
+                                      for word in query.split()])
+            queryset = Post.objects.filter(condition).values_list('id', flat=True)
+            return queryset.count(), list(queryset[:20])
+
+        backends = [('fts5', SQLiteFTSBackend()), ('python', PythonSearchBackend())]
+        for label, backend in backends:
+            with timer('%s 建立索引' % label):
+                backend.rebuild()
+
+        print('查询（命中数 + 第一页20条）：')
+        bench_queries('icontains', icontains)
+        for label, backend in backends:
+            bench_queries(label, lambda query, backend=backend: (backend.count(query), backend.search(query)))
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
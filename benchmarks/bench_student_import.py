@@ -0,0 +1,86 @@
+"""
+学员批量导入与列表基准：
+1、StudentForm逐行校验 + bulk_create分批写入，与逐行form.save()对比（逐行写入只跑--naive行，按比例折算）；
+2、导入后学员列表第1页、按审核状态过滤、翻到很深的一页的响应时间
+    python -m benchmarks.bench_student_import [--rows 100000] [--batch-size 1000] [--naive 5000]
+"""
+import argparse
+import io
+import time
+
+from benchmarks import setup, timer
+
+
+def make_csv(num):
+    output = io.StringIO()
+    output.write('姓名,性别,专业,Email,QQ,电话,审核状态\n')
+    for i in range(num):
+        output.write('学员%d,%s,专业%d,s%d@mail.com,%d,%d,%s\n' % (
+            i, ('男', '女', '未知')[i % 3], i % 50, i, 100000 + i, 13800000000 + i, ('申请', '通过', '拒绝')[i % 3]))
+    output.seek(0)
+    return output
+
+
+def measure(client, params, runs=20):
+    from django.urls import reverse
+
+    client.get(reverse('student:index'), params)  # 预热（游标分页的总数缓存）
+    start = time.perf_counter()
+    for _ in range(runs):
+        response = client.get(reverse('student:index'), params)
+        assert response.status_code == 200
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--naive', type=int, default=5000, help='逐行写入的行数（结果按比例折算到--rows）')
+    args = parser.parse_args()
+
+    teardown = setup()
+    from django.db import transaction
+    from django.test import Client
+    from student.forms import StudentForm
+    from student.importer import import_students, normalize_row, read_csv
+    from student.models import Student
+    from student.views import IndexView
+
+    try:
+        rows = list(read_csv(make_csv(args.rows)))
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            for row in rows[:args.naive]:
+                form = StudentForm(normalize_row(row))
+                assert form.is_valid(), form.errors
+                form.save()
+            transaction.set_rollback(True)
+        naive = (time.perf_counter() - start) * args.rows / args.naive
+
+        start = time.perf_counter()
+        created, errors = import_students(rows, batch_size=args.batch_size)
+        bulk = time.perf_counter() - start
+        assert created == args.rows and not errors, errors[:5]
+
+        print('%d 名学员（逐行写入按 %d 行折算）' % (args.rows, args.naive))
+        print('%-30s %10.2fs' % ('form.save() per row', naive))
+        print('%-30s %10.2fs' % ('bulk_create batch=%d' % args.batch_size, bulk))
+
+        client = Client()
+        per_page = IndexView().get_paginate_by(None)
+        deep = args.rows // per_page // 2
+        cursor = Student.objects.order_by('-id').values_list('id', flat=True)[(deep - 1) * per_page - 1]
+        with timer('count by status'):
+            Student.objects.filter(status=1).count()
+        print('%-30s %10.2fms' % ('list page 1', measure(client, {})))
+        print('%-30s %10.2fms' % ('list status=1 page 1', measure(client, {'status': 1})))
+        print('%-30s %10.2fms' % ('list page %d (keyset)' % deep, measure(client, {'before': cursor, 'page': deep})))
+        print('%-30s %10.2fms' % ('list page %d (offset)' % deep, measure(client, {'page': deep})))
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
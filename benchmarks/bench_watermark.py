@@ -0,0 +1,103 @@
+"""
+上传图片水印基准：原实现（转RGBA、内存中编码为PNG）与按原格式写回、进程池异步处理的耗时和文件大小
+    python -m benchmarks.bench_watermark [--images 8] [--size 4000x3000]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from benchmarks import setup
+
+TEXT = 'zhangchuzhao.site'
+
+
+def make_samples(directory, num, size):
+    """带噪点的照片类JPEG，大小与手机照片接近"""
+    paths = []
+    for i in range(num):
+        noise = [Image.effect_noise(size, 40 + i * 5).point(lambda v, k=k: (v + k * 60) % 256) for k in range(3)]
+        image = Image.merge('RGB', noise)
+        path = os.path.join(directory, 'sample_%d.jpg' % i)
+        image.save(path, format='JPEG', quality=85)
+        paths.append(path)
+    return paths
+
+
+def legacy_watermark(path):
+    """原WatermarkStorage的处理方式"""
+    with open(path, 'rb') as f:
+        image = Image.open(BytesIO(f.read())).convert('RGBA')
+    draw = ImageDraw.Draw(image)
+    draw.text((image.size[0] / 2, image.size[1] / 2), TEXT, 'red')
+    temp = BytesIO()
+    image.save(temp, format='PNG')
+    return temp.tell()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=8)
+    parser.add_argument('--size', default='4000x3000')
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.split('x'))
+
+    teardown = setup()
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.test import override_settings
+    from mysite import storage as storage_module
+    from mysite.storage import WatermarkStorage, watermark_file
+
+    directory = tempfile.mkdtemp()
+    try:
+        samples = make_samples(directory, args.images, size)
+        original_size = sum(os.path.getsize(path) for path in samples)
+
+        start = time.perf_counter()
+        legacy_size = sum(legacy_watermark(path) for path in samples)
+        legacy_time = time.perf_counter() - start
+
+        copies = []
+        for path in samples:
+            copy = path.replace('.jpg', '_inline.jpg')
+            shutil.copy(path, copy)
+            copies.append(copy)
+        start = time.perf_counter()
+        for path in copies:
+            watermark_file(path, TEXT, 'red')
+        inline_time = time.perf_counter() - start
+        inline_size = sum(os.path.getsize(path) for path in copies)
+
+        storage = WatermarkStorage(location=os.path.join(directory, 'media'))
+        uploads = []
+        for path in samples:
+            with open(path, 'rb') as f:
+                uploads.append(SimpleUploadedFile(os.path.basename(path), f.read(), content_type='image/jpeg'))
+        storage_module.get_executor().submit(int).result()  # 预先启动进程池
+        with override_settings(WATERMARK_ASYNC=True):
+            start = time.perf_counter()
+            for upload in uploads:
+                storage.save(upload.name, upload)
+            request_time = time.perf_counter() - start
+            storage_module.get_executor().shutdown(wait=True)
+            pool_time = time.perf_counter() - start
+
+        print('%d 张 %dx%d JPEG，原图共 %.1fMB' % (args.images, size[0], size[1], original_size / 1024 / 1024))
+        print('%-24s %12s %12s' % ('mode', 'per image', 'output'))
+        print('%-24s %10.1fms %10.1fMB' % ('legacy (RGBA -> PNG)', legacy_time / args.images * 1000,
+                                           legacy_size / 1024 / 1024))
+        print('%-24s %10.1fms %10.1fMB' % ('inline (keep JPEG)', inline_time / args.images * 1000,
+                                           inline_size / 1024 / 1024))
+        print('%-24s %10.1fms %12s' % ('async upload request', request_time / args.images * 1000, '-'))
+        print('%-24s %10.1fms %12s' % ('async pool (wall)', pool_time / args.images * 1000, '-'))
+    finally:
+        shutil.rmtree(directory)
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,7 @@ from django.contrib.admin.models import LogEntry
 from django.urls import reverse
 from django.utils.html import format_html
 
-from .models import Category, Tag, Post
+from .models import Category, Tag, Post, SourceState
 from .adminforms import PostAdminForm
 from mysite.custom_site import custom_site
 from mysite.base_admin import BaseOwnerAdmin
@@ -106,4 +106,12 @@ class PostAdmin(BaseOwnerAdmin):
 
 @admin.register(LogEntry, site=custom_site)
 class LogEntryAdmin(admin.ModelAdmin):
-    list_display = ('object_repr', 'object_id', 'action_flag', 'user', 'change_message')
\ No newline at end of file
+    list_display = ('object_repr', 'object_id', 'action_flag', 'user', 'change_message')
+
+
+@admin.register(SourceState, site=custom_site)
+class SourceStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_status', 'last_run_time', 'fetched', 'created', 'fetch_time', 'run_time',
+                    'total_created', 'high_water')
+    readonly_fields = ('last_run_time', 'last_status', 'last_error', 'fetch_time', 'run_time', 'fetched', 'created',
+                       'runs', 'total_created')
@@ -0,0 +1,47 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+from mysite.cache import FragmentCache
+from .models import Post
+
+feed_cache = FragmentCache('feed', timeout=getattr(settings, 'FEED_CACHE_TIMEOUT', 60 * 60))
+
+
+def post_etag(request, *args, **kwargs):
+    """文章整体版本号 + 域名 + 完整路径（不同的订阅地址、sitemap分片内容不同）"""
+    _, version = Post.get_state()
+    key = '%s:%s:%s' % (version, request.get_host(), request.get_full_path())
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def post_last_modified(request, *args, **kwargs):
+    return Post.get_state()[0]
+
+
+# 客户端带If-None-Match/If-Modified-Since且文章没有变化时直接返回304，不执行视图
+conditional = condition(etag_func=post_etag, last_modified_func=post_last_modified)
+
+
+def cache_body(view):
+    """按ETag缓存200响应的内容，文章变化后ETag改变，旧缓存自然不再使用"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = feed_cache.make_key(post_etag(request, *args, **kwargs))
+        cached = feed_cache.fetch(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            feed_cache.set(key, (response.content, response['Content-Type']))
+        return response
+    return wrapper
+
+
+def conditional_cached(view):
+    return conditional(cache_body(view))
@@ -0,0 +1,204 @@
+import os
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import F
+
+from mysite.counter import BufferedCounter
+from .hll import HyperLogLog
+
+
+class VisitCounter(BufferedCounter):
+    """
+    PV/UV写缓冲（write-behind，见mysite.counter.BufferedCounter）：
+    1、后台线程每隔VISIT_FLUSH_INTERVAL秒把增量合并成每篇文章一条UPDATE语句；
+    2、多进程部署时每个进程各自缓冲，UPDATE使用F()表达式累加，所以进程之间不会互相覆盖；
+    3、UV由UniqueVisitors的sketch在flush时合并得到，与PV在同一个事务中写入。
+    VISIT_FLUSH_INTERVAL为0时退化为同步写入（开发、测试环境使用）。
+    """
+    thread_name = 'visit-counter-flusher'
+    error_message = 'PV/UV增量写入失败，等待下次重试'
+
+    def __init__(self, model=None):
+        self._model = model
+        super().__init__()
+
+    @property
+    def model(self):
+        if self._model is None:
+            from .models import Post
+            self._model = Post
+        return self._model
+
+    @property
+    def interval(self):
+        return getattr(settings, 'VISIT_FLUSH_INTERVAL', 10)
+
+    def incr(self, post_id, pv=0, uv=0):
+        """累加增量；pv、uv都为0时只触发flush（进程内的UV sketch有新访客）"""
+        self._check_fork()
+        if pv or uv:
+            with self._lock:
+                counts = self._pending[post_id]
+                counts[0] += pv
+                counts[1] += uv
+
+        if self.interval > 0:
+            self.start()
+        else:
+            self.flush()
+
+    def pending(self, post_id):
+        """返回尚未写入数据库的(pv, uv)增量"""
+        with self._lock:
+            counts = self._pending.get(post_id, (0, 0))
+            return tuple(counts)
+
+    def reset(self):
+        self._pending = defaultdict(lambda: [0, 0])  # {post_id: [pv, uv]}
+
+    def take(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: [0, 0])
+        sketches = unique_visitors.take()
+        return (pending, sketches) if pending or sketches else None
+
+    def restore(self, pending):
+        pending, sketches = pending
+        with self._lock:
+            for post_id, (pv, uv) in pending.items():
+                counts = self._pending[post_id]
+                counts[0] += pv
+                counts[1] += uv
+        unique_visitors.restore(sketches)
+
+    def write(self, pending):
+        """进程内的UV sketch合并到数据库，合并得到的UV增量与缓冲区的增量一起写入，返回更新的文章数"""
+        pending, sketches = pending
+        updates = defaultdict(lambda: [0, 0])
+        for post_id, uv in unique_visitors.merge(sketches).items():
+            updates[post_id][1] += uv
+        for post_id, (pv, uv) in pending.items():
+            updates[post_id][0] += pv
+            updates[post_id][1] += uv
+        for post_id in sorted(updates):  # 固定加锁顺序，避免多进程flush时死锁
+            pv, uv = updates[post_id]
+            fields = {}
+            if pv:
+                fields['pv'] = F('pv') + pv
+            if uv:
+                fields['uv'] = F('uv') + uv
+            if fields:
+                self.model.objects.filter(pk=post_id).update(**fields)
+        return len(updates)
+
+
+class UniqueVisitors:
+    """
+    每篇文章每天一个HyperLogLog sketch，代替每个访客一个uv:<uid>:<date>:<path>的缓存key：
+    1、请求线程只在进程内的sketch上记录访客，不读写缓存和数据库；
+    2、VisitCounter.flush时在事务中把进程内的sketch与数据库中的（blog.models.VisitorSketch）按寄存器取max合并，
+       合并前先锁定这一行（select_for_update），多个进程同时合并时不会互相覆盖；
+    3、数据库中同时记录已经累加到Post.uv的估计值，合并后只把估计值的增量计入Post.uv，
+       所以无论有多少个进程，一天内Post.uv的增量总和等于当天独立访客数的估计值。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sketches = {}  # {(post_id, day): HyperLogLog} 上次flush之后的访客
+        self._pid = os.getpid()
+        self._pruned = None  # 上次清理过期sketch的日期
+
+    @property
+    def error_rate(self):
+        return getattr(settings, 'UV_ERROR_RATE', 0.02)
+
+    @property
+    def keep_days(self):
+        return getattr(settings, 'UV_SKETCH_DAYS', 31)
+
+    def add(self, post_id, uid, day=None):
+        """记录一次访问，进程内的sketch有变化（可能是新访客）时返回True"""
+        self._check_fork()
+        key = (post_id, day or date.today())
+        with self._lock:
+            sketch = self._sketches.get(key)
+            if sketch is None:
+                sketch = self._sketches[key] = HyperLogLog(self.error_rate)
+            return sketch.add(uid)
+
+    def take(self):
+        """取出进程内的全部sketch"""
+        self._check_fork()
+        with self._lock:
+            sketches, self._sketches = self._sketches, {}
+        return sketches
+
+    def restore(self, sketches):
+        """合并失败时把sketch放回，等待下次flush"""
+        with self._lock:
+            for key, sketch in sketches.items():
+                current = self._sketches.get(key)
+                self._sketches[key] = sketch if current is None else HyperLogLog.union([current, sketch])
+
+    def merge(self, sketches):
+        """
+        在调用方的事务中把sketches合并到数据库，返回{post_id: 应该累加到Post.uv的增量}；
+        UV_ERROR_RATE调整过时按较低的精度合并
+        """
+        from .models import VisitorSketch
+
+        deltas = defaultdict(int)
+        for (post_id, day), sketch in sorted(sketches.items()):  # 固定加锁顺序
+            row = VisitorSketch.objects.select_for_update().filter(post_id=post_id, day=day).first()
+            if row is None:
+                row = VisitorSketch(post_id=post_id, day=day, credited=0)
+            else:
+                sketch = HyperLogLog.union([HyperLogLog.from_bytes(row.registers), sketch])
+            delta = max(sketch.count() - row.credited, 0)
+            row.registers = sketch.to_bytes()
+            row.credited += delta
+            row.save()
+            if delta:
+                deltas[post_id] += delta
+        self.prune()
+        return deltas
+
+    def prune(self):
+        """每个进程每天清理一次超过UV_SKETCH_DAYS天的sketch"""
+        from .models import VisitorSketch
+
+        today = date.today()
+        if self._pruned != today:
+            VisitorSketch.objects.filter(day__lt=today - timedelta(days=self.keep_days)).delete()
+            self._pruned = today
+
+    def sketch(self, post_id, day):
+        """数据库中（已经flush的）某一天的sketch"""
+        from .models import VisitorSketch
+
+        registers = VisitorSketch.objects.filter(post_id=post_id, day=day).values_list('registers', flat=True).first()
+        return HyperLogLog(self.error_rate) if registers is None else HyperLogLog.from_bytes(registers)
+
+    def count(self, post_id, start, end=None):
+        """合并[start, end]每天已经flush的sketch，得到这段时间（如一周、一个月）的独立访客数"""
+        from .models import VisitorSketch
+
+        rows = VisitorSketch.objects.filter(post_id=post_id, day__range=(start, end or start))
+        sketches = [HyperLogLog.from_bytes(registers) for registers in rows.values_list('registers', flat=True)]
+        if not sketches:
+            return 0
+        return HyperLogLog.union(sketches).count()
+
+    def _check_fork(self):
+        """fork出的子进程丢弃父进程的sketch（由父进程flush）"""
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._sketches = {}
+            self._pid = os.getpid()
+
+
+visit_counter = VisitCounter()
+unique_visitors = UniqueVisitors()
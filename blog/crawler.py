@@ -0,0 +1,227 @@
+import logging
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Category, CrawlJobStatus, Post, SourceState, Tag
+from .render import content_hash, render_content
+from .search import get_backend
+from .sources import CrawlError, get_sources
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def fetch_all(sources, states):
+    """并发请求多个数据源，返回{数据源名称: FetchResult或CrawlError}"""
+    results = {}
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=max(len(sources), 1)) as executor:
+        futures = {source.name: executor.submit(source.fetch, session, states.get(source.name))
+                   for source in sources}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except CrawlError as e:
+                logger.error(e)
+                results[name] = e
+    return results
+
+
+def gen_post_list(items, categories, user, tag):
+    """
+    批量入库：一次IN查询去重，bulk_create文章和文章-标签关联，返回{分类名称: 新增文章数}。
+    bulk_create不会触发post_save，渲染、搜索索引、页面缓存需要在这里处理。
+    """
+    unique = {}
+    for item in items:
+        unique.setdefault(item.title, item)  # 同一批次内的重复标题只保留一条
+    if not unique:
+        return {}
+
+    existing = set(Post.objects.filter(title__in=list(unique)).values_list('title', flat=True))
+    for title in existing:
+        logger.debug('平台：%s 分类：%s 文章：%s 已存在', user.username, unique[title].category, title)
+
+    posts = []
+    for title, item in unique.items():
+        if title in existing:
+            continue
+        url = item.url or reverse('index')
+        content = "原文地址：[%s](%s)" % (title, url)
+        posts.append(Post(title=title, desc=url, content=content, content_html=render_content(content),
+                          content_hash=content_hash(content), category=categories[item.category], owner=user))
+    if not posts:
+        return {}
+
+    with transaction.atomic():
+        Post.objects.bulk_create(posts)
+        if any(post.pk is None for post in posts):  # 只有部分数据库（如PostgreSQL）会回填主键
+            ids = dict(Post.objects.filter(title__in=[post.title for post in posts], owner=user)
+                       .values_list('title', 'id'))
+            for post in posts:
+                post.pk = post.id = ids[post.title]
+        Through = Post.tag.through
+        Through.objects.bulk_create([Through(post_id=post.id, tag_id=tag.id) for post in posts])
+
+    posts_created(posts)
+    return Counter(post.category.name for post in posts)
+
+
+def posts_created(posts):
+    from config.models import SideBar
+    from .signals import purge_posts
+
+    Post.touch_state()
+    backend = get_backend()
+    for post in posts:
+        backend.index(post)
+    purge_posts([(post.id, post.category_id, post.owner_id) for post in posts])
+    SideBar.invalidate(SideBar.DISPLAY_LATEST, SideBar.DISPLAY_HOT)
+
+
+class Ingestion:
+    """
+    一次爬取需要的分类、用户、标签、数据源状态各查询一次；
+    每个数据源只写入发布时间不早于high-water mark的条目，没有发布时间的条目仍按标题去重
+    """
+
+    def __init__(self, sources):
+        self.sources = sources
+        names = {name for source in sources for name in source.category_names()}
+        self.categories = {category.name: category for category in Category.objects.filter(name__in=names)}
+        self.users = User.objects.in_bulk({source.username for source in sources}, field_name='username')
+        self.tags = {tag.name: tag for tag in Tag.objects.filter(name__in={source.tag for source in sources})}
+        self.states = SourceState.objects.in_bulk([source.name for source in sources], field_name='name')
+
+    def check(self, source):
+        if not source.category_names():  # 条目没有分类，无法入库
+            raise CrawlError('%s 没有配置分类（category）' % source.name)
+        missing = set(source.category_names()) - set(self.categories)
+        if missing:
+            raise CrawlError('分类不存在：%s' % '、'.join(sorted(missing)))
+        if source.username not in self.users or source.tag not in self.tags:
+            raise CrawlError('用户"%s"或标签"%s"不存在' % (source.username, source.tag))
+
+    def ingest(self, source, result, start):
+        """写入一个数据源的抓取结果并更新它的状态和指标，返回{分类名称: 新增文章数}"""
+        state = self.states.get(source.name) or SourceState(name=source.name)
+        state.last_run_time = timezone.now()
+        state.runs += 1
+        try:
+            if isinstance(result, CrawlError):
+                raise result
+            self.check(source)
+            items = [item for item in result.items
+                     if state.high_water is None or item.published is None or item.published >= state.high_water]
+            created = gen_post_list(items, self.categories, self.users[source.username], self.tags[source.tag])
+        except CrawlError as e:
+            state.last_status, state.last_error = SourceState.STATUS_ERROR, str(e)[:1024]
+            state.fetched = state.created = 0
+            raise
+        else:
+            dates = [item.published for item in items if item.published]
+            if state.high_water:
+                dates.append(state.high_water)
+            state.high_water = max(dates, default=None)
+            state.etag, state.last_modified = result.etag[:255], result.last_modified[:64]
+            state.last_status = SourceState.STATUS_NOT_MODIFIED if result.not_modified else SourceState.STATUS_OK
+            state.last_error = ''
+            state.fetch_time = result.fetch_time
+            state.fetched = len(result.items)
+            state.created = sum(created.values())
+            state.total_created += state.created
+            return created
+        finally:
+            state.run_time = time.time() - start
+            state.save()
+            self.states[source.name] = state
+
+    def run(self):
+        """返回({分类名称: 新增文章数}, [错误信息])"""
+        start = time.time()
+        totals = Counter({name: 0 for source in self.sources for name in source.category_names()})
+        errors = []
+        results = fetch_all(self.sources, self.states)
+        for source in self.sources:
+            try:
+                totals.update(self.ingest(source, results[source.name], start))
+            except CrawlError as e:
+                errors.append(str(e))
+        return totals, errors
+
+
+class CrawlJob:
+    """
+    爬取任务：在后台线程执行，状态保存在数据库中（CrawlJobStatus），页面通过crawl-status接口轮询，
+    轮询请求落到哪个进程都能查到；超过KEEP_DAYS天的任务记录在启动新任务时清理
+    """
+    KEEP_DAYS = 1
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCESS = 'success'
+    FAILED = 'failed'
+
+    def __init__(self, job_id=None, names=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.names = names
+
+    @classmethod
+    def get_status(cls, job_id):
+        job = CrawlJobStatus.objects.filter(job_id=job_id).first()
+        return job.to_dict() if job else None
+
+    def set_status(self, status, num=-1, msg=''):
+        CrawlJobStatus.objects.update_or_create(job_id=self.id, defaults={'status': status, 'num': num, 'msg': msg[:1024]})
+
+    def start(self):
+        CrawlJobStatus.objects.filter(created_time__lt=timezone.now() - timedelta(days=self.KEEP_DAYS)).delete()
+        self.set_status(self.PENDING, msg='等待爬取')
+        if getattr(settings, 'CRAWL_ASYNC', True):
+            get_executor().submit(self.run)
+        else:
+            self.run()
+        return self.id
+
+    def run(self):
+        self.set_status(self.RUNNING, msg='正在爬取')
+        try:
+            num, msg = self.crawl()
+        except CrawlError as e:
+            self.set_status(self.FAILED, msg=str(e))
+        except Exception:
+            logger.exception('爬取任务 %s 执行失败', self.id)
+            self.set_status(self.FAILED, msg='程序处理出现异常，请联系管理员查看错误日志，谢谢！')
+        else:
+            self.set_status(self.SUCCESS, num=num, msg=msg)
+        finally:
+            if getattr(settings, 'CRAWL_ASYNC', True):
+                close_old_connections()
+
+    def crawl(self):
+        sources = get_sources(self.names)
+        totals, errors = Ingestion(sources).run()
+        if errors and len(errors) == len(sources):
+            raise CrawlError('；'.join(errors))
+        msg = '，'.join('%s文章 %d 篇' % (name, num) for name, num in totals.items())
+        if errors:
+            msg += '（部分数据源失败：%s）' % '；'.join(errors)
+        return sum(totals.values()), msg
+
+
+def get_executor():
+    """同一进程内的爬取任务依次执行"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='crawl-job')
+    return _executor
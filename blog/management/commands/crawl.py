@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.crawler import Ingestion
+from blog.models import SourceState
+from blog.sources import CrawlError, get_sources
+
+
+class Command(BaseCommand):
+    help = '爬取文章，不指定数据源时爬取全部数据源'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='*', help='数据源名称（settings.CRAWL_SOURCES）')
+        parser.add_argument('--stats', action='store_true', help='只输出各数据源最近一次运行的指标')
+
+    def handle(self, *args, **options):
+        try:
+            sources = get_sources(options['sources'])
+        except CrawlError as e:
+            raise CommandError(e)
+
+        if not options['stats']:
+            totals, errors = Ingestion(sources).run()
+            for error in errors:
+                self.stderr.write(error)
+            self.stdout.write(self.style.SUCCESS('共新增文章 %d 篇' % sum(totals.values())))
+
+        states = SourceState.objects.in_bulk([source.name for source in sources], field_name='name')
+        for source in sources:
+            state = states.get(source.name)
+            if state is None:
+                self.stdout.write('%s: 尚未运行' % source.name)
+                continue
+            self.stdout.write(
+                '{name}: {status} 获取 {fetched} 条，新增 {created} 篇，请求 {fetch_time}s，'
+                '总耗时 {run_time}s，{throughput} 条/s，累计新增 {total_created} 篇'.format(**state.metrics())
+            )
@@ -0,0 +1,53 @@
+import glob
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+from config.models import SideBar
+
+
+class Command(BaseCommand):
+    help = '清理DedupStorage中不再被任何文章（以及HTML侧边栏）引用的文件及其多尺寸副本'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='只清理修改时间早于N小时前的文件（编辑器中刚上传、文章还没保存的图片不会被清理）')
+        parser.add_argument('--dry-run', action='store_true', help='只输出将要删除的文件')
+
+    def handle(self, *args, **options):
+        blob_dir = getattr(settings, 'DEDUP_STORAGE_DIR', 'blobs')
+        blob_re = re.compile(r'%s/[0-9a-f]{2}/([0-9a-f]{64})' % re.escape(blob_dir))
+        referenced = set()
+        for queryset in (Post.objects.values_list('content', flat=True),
+                         SideBar.objects.values_list('content', flat=True)):
+            for content in queryset.iterator():
+                referenced.update(blob_re.findall(content or ''))
+
+        deadline = time.time() - options['min_age'] * 60 * 60
+        root = os.path.join(settings.MEDIA_ROOT, blob_dir)
+        removed = freed = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                digest = os.path.splitext(filename)[0]
+                if digest in referenced or os.path.getmtime(path) > deadline:
+                    continue
+                name = os.path.relpath(path, settings.MEDIA_ROOT)
+                derivatives = glob.glob(glob.escape(os.path.join(
+                    settings.MEDIA_ROOT, getattr(settings, 'IMAGE_DERIVATIVE_DIR', 'derivatives'), os.path.splitext(name)[0]
+                )) + '-*w.*')
+                for file_path in [path] + derivatives:
+                    self.stdout.write(('将删除：%s' if options['dry_run'] else '删除：%s') % file_path)
+                    freed += os.path.getsize(file_path)
+                    removed += 1
+                    if not options['dry_run']:
+                        os.remove(file_path)
+
+        action = '可删除' if options['dry_run'] else '已删除'
+        self.stdout.write(self.style.SUCCESS(
+            '引用中的文件 %d 个，%s文件 %d 个，共 %.1fKB' % (len(referenced), action, removed, freed / 1024)
+        ))
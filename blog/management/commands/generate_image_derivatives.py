@@ -0,0 +1,35 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mysite.images import generate_derivatives_safely, iter_images
+
+
+class Command(BaseCommand):
+    help = '为已上传的图片补充生成多尺寸副本（已有且不早于原图的副本会跳过），多进程并行处理'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', help='MEDIA_ROOT下的目录，可以指定多个，'
+                            '默认为DedupStorage的目录和CKEDITOR_UPLOAD_PATH（启用DedupStorage之前的上传）')
+        parser.add_argument('--workers', type=int, default=None, help='处理进程数，默认为CPU核数')
+        parser.add_argument('--force', action='store_true', help='重新生成全部副本')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or os.cpu_count() or 1
+        start = time.time()
+        paths = options['path'] or [getattr(settings, 'DEDUP_STORAGE_DIR', 'blobs'), settings.CKEDITOR_UPLOAD_PATH]
+        images = [image for path in paths for image in iter_images(settings.MEDIA_ROOT, path)]
+        generate = partial(generate_derivatives_safely, settings.MEDIA_ROOT, force=options['force'])
+        if workers == 1:
+            num = sum(map(generate, images))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+                num = sum(executor.map(generate, images, chunksize=8))
+        self.stdout.write(self.style.SUCCESS(
+            '共检查图片 %d 张，生成副本 %d 个，耗时 %.2fs' % (len(images), num, time.time() - start)
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.search import get_backend
+
+
+class Command(BaseCommand):
+    help = '重建文章全文索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的文章数')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        start = time.time()
+        num = backend.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            '%s: 共索引文章 %d 篇，耗时 %.2fs' % (backend.__class__.__name__, num, time.time() - start)
+        ))
@@ -0,0 +1,62 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+from blog.page_cache import page_cache
+from blog.render import content_hash, render_markdown
+
+
+def render_batch(contents):
+    return [render_markdown(content) for content in contents]
+
+
+class Command(BaseCommand):
+    help = '重新渲染全部文章的html（升级markdown库后使用），多进程并行渲染，分批写入'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='渲染进程数，默认为CPU核数')
+        parser.add_argument('--batch-size', type=int, default=200, help='每批渲染、写入的文章数')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        workers = options['workers'] or os.cpu_count() or 1
+        start = time.time()
+        num = 0
+        posts = Post.objects.filter(is_md=True).only('id', 'content', 'is_md').order_by('id')
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # 渲染在子进程中完成，主进程按提交顺序逐批写库；最多保留workers*2批在途，避免一次读入全部文章
+            pending = []
+            for batch in self.batches(posts.iterator(chunk_size=batch_size), batch_size):
+                pending.append((batch, executor.submit(render_batch, [post.content for post in batch])))
+                if len(pending) >= workers * 2:
+                    num += self.save(*pending.pop(0))
+            for batch, future in pending:
+                num += self.save(batch, future)
+        Post.touch_state()
+        if num:
+            page_cache.purge_all()  # bulk_update不发送post_save信号，整页缓存中还是旧的html
+
+        self.stdout.write(self.style.SUCCESS('共重新渲染文章 %d 篇，耗时 %.2fs' % (num, time.time() - start)))
+
+    @staticmethod
+    def batches(iterable, size):
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def save(batch, future):
+        for post, html in zip(batch, future.result()):
+            post.content_html = html
+            post.content_hash = content_hash(post.content, post.is_md)
+            post.feed_item = ''  # RSS条目在下次输出订阅时重新生成
+        Post.objects.bulk_update(batch, ['content_html', 'content_hash', 'feed_item'])
+        return len(batch)
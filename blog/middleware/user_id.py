@@ -12,7 +12,8 @@ class UserIDMiddleware:
         uid = self.generate_uid(request)
         request.uid = uid
         response = self.get_response(request)
-        response.set_cookie(USER_KEY, uid, max_age=TEN_YEARS, httponly=True)  # httponly只有服务端能访问
+        if request.COOKIES.get(USER_KEY) != uid:  # 只在新用户时设置cookie，带Set-Cookie的响应无法被下游（CDN、代理）缓存
+            response.set_cookie(USER_KEY, uid, max_age=TEN_YEARS, httponly=True)  # httponly只有服务端能访问
         return response
 
     def generate_uid(self, request):
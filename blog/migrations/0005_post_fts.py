@@ -0,0 +1,59 @@
+import re
+
+from django.db import migrations
+
+# 分词规则复制自blog.search.tokenizer（迁移不依赖应用代码，之后修改分词时可以用rebuild_search_index重建）
+TOKEN_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿]+|[0-9a-zA-Z]+(?:[._+#-][0-9a-zA-Z]+)*[+#]*')
+CJK_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿]')
+
+
+def tokenize(text):
+    tokens = []
+    for match in TOKEN_RE.finditer(text or ''):
+        word = match.group()
+        if CJK_RE.match(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+CREATE_SQL = '''CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_fts USING fts5(title, summary, body, tokenize="unicode61 tokenchars '.+#-'")'''
+
+
+def create_fts_table(apps, schema_editor):
+    """只有SQLite（且编译了FTS5）才创建全文索引表，其他情况搜索自动使用纯Python索引"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_SQL)
+        except connection.Database.OperationalError:
+            return
+
+        Post = apps.get_model('blog', 'Post')
+        rows = [
+            [post['id']] + [' '.join(tokenize(post[field])) for field in ('title', 'desc', 'content')]
+            for post in Post.objects.filter(status=1).values('id', 'title', 'desc', 'content')
+        ]
+        cursor.executemany('INSERT INTO blog_post_fts (rowid, title, summary, body) VALUES (%s, %s, %s, %s)', rows)
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS blog_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_post_is_md'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
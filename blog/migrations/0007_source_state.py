@@ -0,0 +1,36 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_post_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='数据源')),
+                ('etag', models.CharField(blank=True, max_length=255, verbose_name='ETag')),
+                ('last_modified', models.CharField(blank=True, max_length=64, verbose_name='Last-Modified')),
+                ('high_water', models.DateTimeField(blank=True, null=True, verbose_name='已入库条目的最新发布时间')),
+                ('last_run_time', models.DateTimeField(blank=True, null=True, verbose_name='最近运行时间')),
+                ('last_status', models.CharField(blank=True, choices=[('ok', '成功'), ('not_modified', '未更新'), ('error', '失败')], max_length=16, verbose_name='最近运行结果')),
+                ('last_error', models.CharField(blank=True, max_length=1024, verbose_name='最近错误')),
+                ('fetch_time', models.FloatField(default=0, verbose_name='请求耗时(s)')),
+                ('run_time', models.FloatField(default=0, verbose_name='总耗时(s)')),
+                ('fetched', models.PositiveIntegerField(default=0, verbose_name='获取条目数')),
+                ('created', models.PositiveIntegerField(default=0, verbose_name='新增文章数')),
+                ('runs', models.PositiveIntegerField(default=0, verbose_name='运行次数')),
+                ('total_created', models.PositiveIntegerField(default=0, verbose_name='累计新增文章数')),
+            ],
+            options={
+                'verbose_name': '数据源状态',
+                'verbose_name_plural': '数据源状态',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_created_time(apps, schema_editor):
+    """已有文章的更新时间取创建时间"""
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.update(updated_time=models.F('created_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_source_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='更新时间'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_time, migrations.RunPython.noop),
+    ]
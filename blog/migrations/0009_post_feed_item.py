@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_post_updated_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='feed_item',
+            field=models.TextField(blank=True, editable=False, verbose_name='RSS条目XML'),
+        ),
+    ]
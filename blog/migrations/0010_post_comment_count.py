@@ -0,0 +1,46 @@
+# Generated by Django 2.2.28 on 2026-10-18 22:40
+
+import re
+from urllib.parse import urlsplit
+
+from django.db import migrations, models
+
+# 文章详情页的路径（与当时mysite/urls.py中的post-detail一致），迁移不依赖运行时的URLconf
+POST_DETAIL_RE = re.compile(r'^/post/(?P<post_id>\d+).html$')
+
+
+def target_post_id(target):
+    """评论目标是文章详情页时返回文章id（comment.models.target_post_id在迁移时的副本）"""
+    match = POST_DETAIL_RE.match(urlsplit(target or '').path or '/')
+    return int(match.group('post_id')) if match else None
+
+
+def count_comments(apps, schema_editor):
+    """按评论目标统计已有文章的正常评论数"""
+    Comment = apps.get_model('comment', 'Comment')
+    Post = apps.get_model('blog', 'Post')
+    counts = {}
+    rows = Comment.objects.filter(status=1).values_list('target').annotate(num=models.Count('id')).order_by()
+    for target, num in rows:
+        post_id = target_post_id(target)
+        if post_id:
+            counts[post_id] = counts.get(post_id, 0) + num
+    for post_id, num in counts.items():
+        Post.objects.filter(pk=post_id).update(comment_count=num)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_post_feed_item'),
+        ('comment', '0003_comment_target_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='评论数'),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
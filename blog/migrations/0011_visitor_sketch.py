@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_id', models.PositiveIntegerField(verbose_name='文章ID')),
+                ('day', models.DateField(verbose_name='日期')),
+                ('registers', models.BinaryField(verbose_name='HyperLogLog寄存器')),
+                ('credited', models.PositiveIntegerField(default=0, verbose_name='已计入UV')),
+            ],
+            options={
+                'verbose_name': '独立访客统计',
+                'verbose_name_plural': '独立访客统计',
+                'unique_together': {('post_id', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_visitor_sketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlJobStatus',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_id', models.CharField(max_length=32, unique=True, verbose_name='任务ID')),
+                ('status', models.CharField(max_length=16, verbose_name='状态')),
+                ('num', models.IntegerField(default=-1, verbose_name='新增文章数')),
+                ('msg', models.CharField(blank=True, max_length=1024, verbose_name='结果')),
+                ('created_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '爬取任务',
+                'verbose_name_plural': '爬取任务',
+            },
+        ),
+    ]
@@ -1,8 +1,13 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
 from django.utils.functional import cached_property
 
-import mistune
+from . import render
 
 
 # Create your models here.
@@ -37,7 +42,7 @@ class Category(models.Model):
     #     }
 
     @classmethod
-    def get_navs(cls):
+    def load_navs(cls):
         categories = cls.objects.filter(status=cls.STATUS_NORMAL)
         nav_categories = []
         normal_categories = []
@@ -52,6 +57,35 @@ class Category(models.Model):
             'categories': normal_categories,
         }
 
+    NAVS_VERSION_KEY = 'category:navs:version'
+    _navs_snapshot = (None, None)  # (version, navs) 进程内的导航快照
+
+    @classmethod
+    def get_navs(cls):
+        """
+        导航数据保存在进程内，缓存中只存放版本号：
+        分类保存或删除时更新版本号（blog.signals），版本号一致时直接使用快照，不查询数据库；
+        版本号NAVS_VERSION_TIMEOUT秒后过期，进程内缓存（LocMemCache）无法通知其他进程时，其他进程最多这么久后重新加载
+        """
+        version = cache.get(cls.NAVS_VERSION_KEY)
+        if version is None:
+            cache.add(cls.NAVS_VERSION_KEY, uuid.uuid4().hex, cls.navs_timeout())
+            version = cache.get(cls.NAVS_VERSION_KEY)
+
+        snapshot_version, navs = cls._navs_snapshot
+        if navs is None or snapshot_version != version:
+            navs = cls.load_navs()
+            cls._navs_snapshot = (version, navs)
+        return dict(navs)
+
+    @classmethod
+    def invalidate_navs(cls):
+        cache.set(cls.NAVS_VERSION_KEY, uuid.uuid4().hex, cls.navs_timeout())
+
+    @staticmethod
+    def navs_timeout():
+        return getattr(settings, 'NAVS_VERSION_TIMEOUT', 5 * 60)
+
 
 class Tag(models.Model):
     STATUS_NORMAL = 1
@@ -73,6 +107,14 @@ class Tag(models.Model):
         return self.name
 
 
+class PostQuerySet(models.QuerySet):
+    HEAVY_FIELDS = ('content', 'content_html', 'feed_item')
+
+    def for_list(self):
+        """列表类页面（列表页、侧边栏、sitemap等）不展示正文，延迟加载正文等大文本字段"""
+        return self.defer(*self.HEAVY_FIELDS)
+
+
 class Post(models.Model):
     STATUS_NORMAL = 1
     STATUS_DELETE = 0
@@ -87,6 +129,8 @@ class Post(models.Model):
     desc = models.CharField(max_length=1024, blank=True, verbose_name='摘要')
     content = models.TextField(verbose_name='正文', help_text='正文必须为MarkDown格式')
     content_html = models.TextField(verbose_name='正文html代码', blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False, verbose_name='正文哈希')
+    feed_item = models.TextField(blank=True, editable=False, verbose_name='RSS条目XML')
     is_md = models.BooleanField(default=True, verbose_name='Markdown语法')
     status = models.PositiveIntegerField(choices=STATUS_ITEMS, default=STATUS_NORMAL, verbose_name='状态')
     category = models.ForeignKey(Category, verbose_name='分类', on_delete=models.CASCADE)
@@ -94,7 +138,11 @@ class Post(models.Model):
     owner = models.ForeignKey(User, verbose_name='作者', on_delete=models.CASCADE)
     pv = models.PositiveIntegerField(default=1)
     uv = models.PositiveIntegerField(default=1)
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='评论数')  # 正常状态的评论数，由blog.signals增量维护
     created_time = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_time = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name = verbose_name_plural = '文章'
@@ -104,14 +152,92 @@ class Post(models.Model):
         return self.title
 
     def save(self, *args, **kwargs):
-        if self.is_md:
-            self.content_html = mistune.markdown(self.content)  # 因为博文需要修改更新，所以生成markdown格式需要另外保存
-        else:
-            self.content_html = self.content
+        render_later = False
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'content', 'is_md'} & set(update_fields):
+            render_later = self.render_content()
+            if update_fields is not None:  # 渲染结果也需要写入数据库
+                kwargs['update_fields'] = update_fields = set(update_fields) | {'content_html', 'content_hash'}
+        if update_fields is None:
+            self.render_feed_item()
+        elif self.FEED_FIELDS & set(update_fields):
+            self.render_feed_item()
+            kwargs['update_fields'] = set(update_fields) | {'feed_item'}
         super().save(*args, **kwargs)
+        if render_later:
+            render.render_later(self.pk, self.content_hash, self.content)
+
+    def render_content(self):
+        """
+        因为博文需要修改更新，所以生成markdown格式需要另外保存；
+        正文没有变化（哈希相同）时不重新渲染，大文章先保存占位内容，返回True表示需要在后台渲染
+        """
+        content_hash = render.content_hash(self.content, self.is_md)
+        if content_hash == self.content_hash and self.content_html:
+            return False
+
+        self.content_hash = content_hash
+        if self.is_md and render.is_large(self.content):
+            self.content_html = self.content_html or render.placeholder(self.content)
+            return True
+
+        self.content_html = render.render_content(self.content, self.is_md)
+        return False
+
+    FEED_FIELDS = {'title', 'desc', 'content_html'}  # RSS条目用到的字段
+
+    def render_feed_item(self):
+        """
+        预先生成RSS的<item>片段，输出订阅时直接拼接；
+        链接中需要域名，新文章还没有id，这时留空，第一次输出订阅时再生成（blog.rss.fill_feed_items）
+        """
+        from .rss import render_feed_item  # rss模块依赖models
+        self.feed_item = render_feed_item(self) if self.pk else ''
+
+    STATE_KEY = 'post:state'
+
+    @classmethod
+    def get_state(cls):
+        """
+        正常文章整体的(最后修改时间, 版本号)，用于RSS、sitemap的ETag/Last-Modified和缓存key：
+        文章、标签变化时由blog.signals调用touch_state更新；缓存中没有时生成新的版本号，最后修改时间取当前时间。
+        不按数据库中的最后修改时间生成：删除最新的文章后最后修改时间会倒退，客户端会一直收到304。
+        缓存POST_STATE_TIMEOUT秒后过期，进程内缓存（LocMemCache）中其他进程的旧版本号最多保留这么久，
+        过期后客户端和按版本号缓存的内容（RSS、sitemap）重新获取、生成一次
+        """
+        state = cache.get(cls.STATE_KEY)
+        if state is None:
+            state = (timezone.now(), uuid.uuid4().hex)
+            cache.add(cls.STATE_KEY, state, cls.state_timeout())
+            state = cache.get(cls.STATE_KEY) or state
+        return state
+
+    @classmethod
+    def touch_state(cls):
+        """事务提交前其他请求可能读到旧数据并按新版本号缓存，提交后再更新一次版本号"""
+        cls._set_state()
+        transaction.on_commit(cls._set_state)
+
+    @classmethod
+    def _set_state(cls):
+        cache.set(cls.STATE_KEY, (timezone.now(), uuid.uuid4().hex), cls.state_timeout())
+
+    @staticmethod
+    def state_timeout():
+        return getattr(settings, 'POST_STATE_TIMEOUT', 5 * 60)
+
+    @classmethod
+    def incr_comment_count(cls, post_id, delta):
+        """F表达式增量更新评论数，并发评论不会互相覆盖；减少时不会减到负数"""
+        posts = cls.objects.filter(pk=post_id)
+        if delta < 0:
+            posts = posts.filter(comment_count__gte=-delta)
+        return posts.update(comment_count=models.F('comment_count') + delta)
 
     @cached_property  # 作用是帮我们把返回的数据绑到实例上，不要每次访问时都去执行tags函数  TODO(Devin):与内在property的异同
     def tags(self):
+        if 'tag' in getattr(self, '_prefetched_objects_cache', {}):  # 已通过prefetch_related('tag')批量查询时不再查询
+            return ','.join(tag.name for tag in self.tag.all())
         return ','.join(self.tag.values_list('name', flat=True))  # TODO(Devin): 多对多关联的获取
 
     @staticmethod
@@ -122,7 +248,7 @@ class Post(models.Model):
             tag = None
             post_list = []
         else:
-            post_list = tag.post_set.filter(status=Post.STATUS_NORMAL).select_related('owner', 'category')
+            post_list = tag.post_set.for_list().filter(status=Post.STATUS_NORMAL).select_related('owner', 'category').prefetch_related('tag')
 
         return post_list, tag
 
@@ -134,21 +260,105 @@ class Post(models.Model):
             category = None
             post_list = []
         else:
-            post_list = category.post_set.filter(status=Post.STATUS_NORMAL).select_related('owner', 'category')
+            post_list = category.post_set.for_list().filter(status=Post.STATUS_NORMAL).select_related('owner', 'category').prefetch_related('tag')
 
         return post_list, category
 
     @classmethod
     def all_posts(cls):
-        return cls.objects.filter(status=cls.STATUS_NORMAL)
+        """列表页会展示作者、分类和标签，一次性查出，避免每篇文章各查一次（N+1）"""
+        return cls.objects.for_list().filter(status=cls.STATUS_NORMAL).select_related('owner', 'category').prefetch_related('tag')
 
     @classmethod
     def latest_posts(cls):
-        return cls.objects.filter(status=cls.STATUS_NORMAL)[:5]
+        return cls.objects.for_list().filter(status=cls.STATUS_NORMAL)[:5]
 
     @classmethod
     def hot_posts(cls):
         return cls.objects.filter(status=cls.STATUS_NORMAL).order_by('-pv').only('id', 'title')[:5]
 
 
+class VisitorSketch(models.Model):
+    """
+    每篇文章每天独立访客的HyperLogLog寄存器（blog.counter.UniqueVisitors），
+    各进程flush时合并进来；credited为已经累加到Post.uv的估计值
+    """
+    post_id = models.PositiveIntegerField(verbose_name='文章ID')
+    day = models.DateField(verbose_name='日期')
+    registers = models.BinaryField(verbose_name='HyperLogLog寄存器')
+    credited = models.PositiveIntegerField(default=0, verbose_name='已计入UV')
+
+    class Meta:
+        verbose_name = verbose_name_plural = '独立访客统计'
+        unique_together = ('post_id', 'day')
+
+
+class SourceState(models.Model):
+    """
+    爬取数据源的增量状态和最近一次运行指标：
+    ETag、Last-Modified用于条件请求（未变化时服务器返回304），high_water为已入库条目的最新发布时间
+    """
+    STATUS_OK = 'ok'
+    STATUS_NOT_MODIFIED = 'not_modified'
+    STATUS_ERROR = 'error'
+    STATUS_ITEMS = (
+        (STATUS_OK, '成功'),
+        (STATUS_NOT_MODIFIED, '未更新'),
+        (STATUS_ERROR, '失败'),
+    )
+
+    name = models.CharField(max_length=50, unique=True, verbose_name='数据源')
+    etag = models.CharField(max_length=255, blank=True, verbose_name='ETag')
+    last_modified = models.CharField(max_length=64, blank=True, verbose_name='Last-Modified')
+    high_water = models.DateTimeField(null=True, blank=True, verbose_name='已入库条目的最新发布时间')
+    last_run_time = models.DateTimeField(null=True, blank=True, verbose_name='最近运行时间')
+    last_status = models.CharField(max_length=16, choices=STATUS_ITEMS, blank=True, verbose_name='最近运行结果')
+    last_error = models.CharField(max_length=1024, blank=True, verbose_name='最近错误')
+    fetch_time = models.FloatField(default=0, verbose_name='请求耗时(s)')
+    run_time = models.FloatField(default=0, verbose_name='总耗时(s)')
+    fetched = models.PositiveIntegerField(default=0, verbose_name='获取条目数')
+    created = models.PositiveIntegerField(default=0, verbose_name='新增文章数')
+    runs = models.PositiveIntegerField(default=0, verbose_name='运行次数')
+    total_created = models.PositiveIntegerField(default=0, verbose_name='累计新增文章数')
+
+    class Meta:
+        verbose_name = verbose_name_plural = '数据源状态'
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def throughput(self):
+        """最近一次运行每秒处理的条目数"""
+        return self.fetched / self.run_time if self.run_time else 0.0
+
+    def metrics(self):
+        return {
+            'name': self.name,
+            'status': self.last_status,
+            'error': self.last_error,
+            'last_run_time': self.last_run_time.isoformat() if self.last_run_time else None,
+            'fetch_time': round(self.fetch_time, 3),
+            'run_time': round(self.run_time, 3),
+            'fetched': self.fetched,
+            'created': self.created,
+            'throughput': round(self.throughput, 1),
+            'runs': self.runs,
+            'total_created': self.total_created,
+        }
+
+
+class CrawlJobStatus(models.Model):
+    """爬取任务（blog.crawler.CrawlJob）的状态，保存在数据库中，任何一个进程都可以查询"""
+    job_id = models.CharField(max_length=32, unique=True, verbose_name='任务ID')
+    status = models.CharField(max_length=16, verbose_name='状态')
+    num = models.IntegerField(default=-1, verbose_name='新增文章数')
+    msg = models.CharField(max_length=1024, blank=True, verbose_name='结果')
+    created_time = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_time = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = verbose_name_plural = '爬取任务'
 
+    def to_dict(self):
+        return {'job_id': self.job_id, 'status': self.status, 'num': self.num, 'msg': self.msg}
@@ -0,0 +1,110 @@
+import hashlib
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from mysite.cache import FragmentCache
+
+CSRF_TOKEN_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+CSRF_PLACEHOLDER = '__PAGE_CACHE_CSRF_TOKEN__'
+
+
+class PageCache(FragmentCache):
+    """
+    匿名用户的整页缓存：
+    1、key由主题、路径、查询参数组成，并带上全局版本号和路径版本号；
+    2、清除某个路径时删除该路径的版本号，这个路径下所有查询参数（如分页?page=2）的缓存同时失效；
+    3、导航、侧边栏这类每个页面都有的内容变化时更新全局版本号，清除全部页面；
+    4、页面中的csrf token缓存前替换为占位符，命中时换成当前请求的token。
+    """
+    VERSION_KEY = 'page:version'
+    PATH_VERSION_KEY = 'page:version:%s'
+
+    @property
+    def page_timeout(self):
+        """PAGE_CACHE_TIMEOUT为0时关闭整页缓存"""
+        return getattr(settings, 'PAGE_CACHE_TIMEOUT', 10 * 60)
+
+    @property
+    def version_timeout(self):
+        """版本号的过期时间，过期后生成新的版本号，相当于清除；进程内缓存无法通知其他进程时，其他进程最多这么久后看到变化"""
+        return getattr(settings, 'PAGE_CACHE_VERSION_TIMEOUT', 10 * 60)
+
+    @property
+    def enabled(self):
+        return bool(self.page_timeout)
+
+    def _version(self, key):
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, self.version_timeout)
+            version = cache.get(key)
+        return version
+
+    def get_key(self, request):
+        path = request.path
+        versions = cache.get_many([self.VERSION_KEY, self.PATH_VERSION_KEY % path])
+        global_version = versions.get(self.VERSION_KEY) or self._version(self.VERSION_KEY)
+        path_version = versions.get(self.PATH_VERSION_KEY % path) or self._version(self.PATH_VERSION_KEY % path)
+        query = hashlib.md5(request.META.get('QUERY_STRING', '').encode('utf-8')).hexdigest()
+        return self.make_key(settings.THEME, global_version, path_version, path, query)
+
+    def get(self, request, key):
+        content = self.fetch(key)
+        if content is not None and CSRF_PLACEHOLDER in content:
+            content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+        return content
+
+    def set(self, key, content):
+        """key需要在渲染之前生成：渲染期间页面被清除时，旧版本的key不会再被读取"""
+        match = CSRF_TOKEN_RE.search(content)
+        if match:
+            content = content.replace(match.group(1), CSRF_PLACEHOLDER)
+        cache.set(key, content, self.page_timeout)
+
+    def purge(self, *paths):
+        self.delete_many(self.PATH_VERSION_KEY % path for path in paths)
+
+    def purge_all(self):
+        cache.set(self.VERSION_KEY, uuid.uuid4().hex, self.version_timeout)
+
+
+page_cache = PageCache('page')
+
+
+class PageCacheMixin:
+    """
+    匿名用户的GET请求优先返回缓存的页面，命中时调用page_cache_hit（如详情页在这里统计PV/UV）
+    """
+    page_cache_enabled = True
+
+    def is_page_cacheable(self, request):
+        return (self.page_cache_enabled and page_cache.enabled and request.method in ('GET', 'HEAD')
+                and not request.user.is_authenticated)
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_page_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = page_cache.get_key(request)
+        content = page_cache.get(request, key)
+        if content is not None:
+            self.page_cache_hit(request, *args, **kwargs)
+            response = HttpResponse(content)
+            response['X-Page-Cache'] = 'HIT'
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            if hasattr(response, 'render'):
+                response.render()
+            page_cache.set(key, response.content.decode(response.charset))
+            response['X-Page-Cache'] = 'MISS'
+        return response
+
+    def page_cache_hit(self, request, *args, **kwargs):
+        pass
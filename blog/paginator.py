@@ -0,0 +1,124 @@
+import hashlib
+import math
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.http import urlencode
+
+
+class KeysetPaginator:
+    """
+    游标（keyset）分页：按id倒序，用上一页最后一条的id作为游标（WHERE id < 游标），
+    不需要OFFSET，也不需要每次COUNT(*)，翻到很深的页面耗时也基本不变。
+    总数只用于展示"Page X of Y"，按查询语句缓存，是近似值。
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset.order_by('-id')
+        self.per_page = per_page
+
+    @cached_property
+    def count(self):
+        key = 'post_count:%s' % hashlib.md5(str(self.queryset.query).encode('utf-8')).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = self.queryset.count()
+            cache.set(key, count, getattr(settings, 'POST_COUNT_CACHE_TIMEOUT', 5 * 60))
+        return count
+
+    @property
+    def num_pages(self):
+        return max(math.ceil(self.count / self.per_page), 1)
+
+    def page(self, before=None, after=None, number=1):
+        """before: 查询比游标更旧的一页；after: 查询比游标更新的一页"""
+        size = self.per_page
+        if after is not None:
+            rows = list(self.queryset.filter(id__gt=after).reverse()[:size + 1])
+            has_previous, has_next = len(rows) > size, True
+            rows = rows[:size][::-1]
+        else:
+            queryset = self.queryset if before is None else self.queryset.filter(id__lt=before)
+            rows = list(queryset[:size + 1])
+            has_previous, has_next = before is not None, len(rows) > size
+            rows = rows[:size]
+        return KeysetPage(rows, number, self, has_next, has_previous)
+
+
+class KeysetPage(Sequence):
+    is_keyset = True
+
+    def __init__(self, object_list, number, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1 if self.number else None
+
+    def previous_page_number(self):
+        return max(self.number - 1, 1) if self.number else None
+
+    def next_query(self):
+        """更旧一页的查询参数"""
+        params = {'before': self.object_list[-1].id}
+        if self.number:
+            params['page'] = self.next_page_number()
+        return urlencode(params)
+
+    def previous_query(self):
+        """更新一页的查询参数"""
+        params = {'after': self.object_list[0].id}
+        if self.number:
+            params['page'] = self.previous_page_number()
+        return urlencode(params)
+
+
+class KeysetPaginationMixin:
+    """
+    ListView使用游标分页；请求中没有游标但带有page=N（N>1，如旧链接）时仍然使用原来的偏移分页
+    """
+    pagination_mode = None  # 'keyset'或'offset'，为None时使用POST_LIST_PAGINATION
+
+    def get_pagination_mode(self):
+        return self.pagination_mode or getattr(settings, 'POST_LIST_PAGINATION', 'keyset')
+
+    @staticmethod
+    def _int_param(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def paginate_queryset(self, queryset, page_size):
+        params = self.request.GET
+        before = self._int_param(params.get('before'))
+        after = self._int_param(params.get('after'))
+        number = self._int_param(params.get('page'))
+        if self.get_pagination_mode() != 'keyset' or (before is None and after is None and (number or 1) > 1):
+            return super().paginate_queryset(queryset, page_size)
+
+        if before is None and after is None:
+            number = 1
+        paginator = KeysetPaginator(queryset, page_size)
+        page = paginator.page(before=before, after=after, number=number)
+        return paginator, page, page.object_list, page.has_other_pages()
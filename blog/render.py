@@ -0,0 +1,78 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import mistune
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils.html import escape, linebreaks
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def content_hash(content, is_md=True):
+    return hashlib.sha256(('%d:%s' % (is_md, content)).encode('utf-8')).hexdigest()
+
+
+def render_markdown(content):
+    return mistune.markdown(content)
+
+
+def render_content(content, is_md=True):
+    """
+    正文转html，按正文哈希缓存渲染结果（不同文章正文相同也共用）；
+    缓存key带上mistune版本号，升级后自动使用新的渲染结果
+    """
+    if not is_md:
+        return content
+
+    key = 'markdown:%s:%s' % (mistune.__version__, content_hash(content))
+    html = cache.get(key)
+    if html is None:
+        html = render_markdown(content)
+        cache.set(key, html, getattr(settings, 'MARKDOWN_CACHE_TIMEOUT', 7 * 24 * 60 * 60))
+    return html
+
+
+def is_large(content):
+    threshold = getattr(settings, 'MARKDOWN_ASYNC_THRESHOLD', 0)
+    return bool(threshold) and len(content) >= threshold
+
+
+def placeholder(content):
+    """异步渲染完成前展示的内容"""
+    return linebreaks(escape(content))
+
+
+def render_later(post_id, expected_hash, content):
+    """事务提交后在后台线程渲染，保存时管理后台不需要等待大文章渲染完成"""
+    transaction.on_commit(lambda: get_executor().submit(_render_post, post_id, expected_hash, content))
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'MARKDOWN_RENDER_WORKERS', 2),
+                                       thread_name_prefix='markdown-render')
+    return _executor
+
+
+def _render_post(post_id, expected_hash, content):
+    from .models import Post
+    from .page_cache import page_cache
+
+    try:
+        html = render_content(content)
+        # 渲染期间文章可能又被修改，只有正文哈希没变时才写入；RSS条目随正文更新，下次输出订阅时重新生成；
+        # update()不发送post_save信号，需要自己清除详情页的整页缓存，否则匿名用户一直看到渲染前的占位内容
+        if Post.objects.filter(pk=post_id, content_hash=expected_hash).update(content_html=html, feed_item=''):
+            Post.touch_state()
+            page_cache.purge(reverse('post-detail', args=(post_id,)))
+    except Exception:
+        logger.exception('文章 %s 渲染失败', post_id)
+    finally:
+        connection.close()
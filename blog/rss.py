@@ -1,8 +1,19 @@
-from django.contrib.syndication.views import Feed
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.sites.shortcuts import get_current_site
+from django.contrib.syndication.views import Feed, add_domain
+from django.shortcuts import get_object_or_404
 from django.utils.feedgenerator import Rss201rev2Feed
 from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from .conditional import conditional_cached
+from .models import Category, Post, Tag
 
-from .models import Post
+# 预先生成的条目中链接的域名部分，输出时替换为当前请求的域名
+BASE_URL_PLACEHOLDER = '__FEED_BASE_URL__'
 
 
 class ExtendRSSFeed(Rss201rev2Feed):
@@ -11,26 +22,100 @@ class ExtendRSSFeed(Rss201rev2Feed):
         handler.addQuickElement('content:html', item['content_html'])
 
 
+class PrecomputedRSSFeed(ExtendRSSFeed):
+    """条目使用文章上预先生成的XML片段（Post.feed_item），输出时只做字符串拼接"""
+    fragments = ()
+    base_url = ''
+
+    def write_items(self, handler):
+        for fragment in self.fragments:
+            handler.ignorableWhitespace(fragment.replace(BASE_URL_PLACEHOLDER, self.base_url))  # 原样输出，不再转义
+
+
+def render_feed_item(post):
+    link = BASE_URL_PLACEHOLDER + reverse('post-detail', args=[post.pk])
+    feed = ExtendRSSFeed(title='', link='', description='')
+    feed.add_item(title=post.title, link=link, description=post.desc, unique_id=link, content_html=post.content_html)
+    output = StringIO()
+    feed.write_items(SimplerXMLGenerator(output, 'utf-8'))
+    return output.getvalue()
+
+
+def fill_feed_items(posts):
+    """返回文章的条目片段，还没有生成的（新文章、正文重新渲染后）补充生成并批量保存"""
+    posts = list(posts)
+    missing = [post.id for post in posts if not post.feed_item]
+    if missing:
+        rendered = list(Post.objects.filter(id__in=missing).only('id', 'title', 'desc', 'content_html'))
+        for post in rendered:
+            post.feed_item = render_feed_item(post)
+        Post.objects.bulk_update(rendered, ['feed_item'])
+        fragments = {post.id: post.feed_item for post in rendered}
+        for post in posts:
+            post.feed_item = post.feed_item or fragments.get(post.id, '')
+    return [post.feed_item for post in posts]
+
+
 class LatestPostFeed(Feed):
-    feed_type = ExtendRSSFeed
+    """
+    全站最新文章，条目数默认RSS_ITEM_COUNT，可以通过?count=N指定（不超过RSS_MAX_ITEM_COUNT）；
+    每篇文章的<item>预先生成保存在Post.feed_item，输出订阅时只查询这一个字段
+    """
+    feed_type = PrecomputedRSSFeed
     title = 'Tech Daily System'
     link = '/rss/'
     description = 'Tech Daily is a blog system power by django.'
 
+    @method_decorator(conditional_cached)
+    def __call__(self, request, *args, **kwargs):
+        return super().__call__(request, *args, **kwargs)
+
     def items(self):
-        return Post.objects.filter(status=Post.STATUS_NORMAL)[:5]
+        return []  # 条目由get_feed按预先生成的片段拼接
+
+    def posts(self, obj):
+        return Post.objects.filter(status=Post.STATUS_NORMAL)
+
+    @staticmethod
+    def item_count(request):
+        default = getattr(settings, 'RSS_ITEM_COUNT', 5)
+        try:
+            count = int(request.GET.get('count', default))
+        except ValueError:
+            count = default
+        return min(max(count, 1), getattr(settings, 'RSS_MAX_ITEM_COUNT', 50))
+
+    def get_feed(self, obj, request):
+        feed = super().get_feed(obj, request)
+        posts = self.posts(obj).only('id', 'feed_item')[:self.item_count(request)]
+        feed.fragments = fill_feed_items(posts)
+        feed.base_url = add_domain(get_current_site(request).domain, '', request.is_secure())
+        return feed
+
+
+class CategoryFeed(LatestPostFeed):
+    def get_object(self, request, category_id):
+        return get_object_or_404(Category, pk=category_id, status=Category.STATUS_NORMAL)
+
+    def title(self, obj):
+        return '%s - %s' % (obj.name, LatestPostFeed.title)
+
+    def link(self, obj):
+        return reverse('category-list', args=(obj.id,))
+
+    def posts(self, obj):
+        return obj.post_set.filter(status=Post.STATUS_NORMAL)
 
-    def item_title(self, item):
-        return item.title
 
-    def item_description(self, item):
-        return item.desc
+class TagFeed(LatestPostFeed):
+    def get_object(self, request, tag_id):
+        return get_object_or_404(Tag, pk=tag_id, status=Tag.STATUS_NORMAL)
 
-    def item_link(self, item):
-        return reverse('post-detail', args=[item.pk])
+    def title(self, obj):
+        return '%s - %s' % (obj.name, LatestPostFeed.title)
 
-    def item_extra_kwargs(self, item):
-        return {'content_html': self.item_content_html(item)}
+    def link(self, obj):
+        return reverse('tag-list', args=(obj.id,))
 
-    def item_content_html(self, item):
-        return item.content_html
+    def posts(self, obj):
+        return obj.post_set.filter(status=Post.STATUS_NORMAL)
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .backends import PythonSearchBackend, SQLiteFTSBackend
+from .tokenizer import tokenize
+
+_backend = None
+
+
+def get_backend():
+    """
+    SEARCH_BACKEND为空时自动选择：SQLite且存在FTS5索引表时使用SQLiteFTSBackend，否则使用纯Python索引
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif SQLiteFTSBackend.is_available():
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = PythonSearchBackend()
+    return _backend
+
+
+class SearchResults:
+    """
+    搜索结果，供Paginator分页使用：count()返回命中总数，切片时才查询这一页的文章，并按相关度排序
+    """
+
+    def __init__(self, keyword, queryset, backend=None):
+        self.keyword = keyword
+        self.queryset = queryset
+        self.backend = backend or get_backend()
+        self.model = queryset.model
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.keyword)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            return self[k:k + 1][0]
+        start = k.start or 0
+        stop = self.count() if k.stop is None else k.stop
+        post_ids = self.backend.search(self.keyword, offset=start, limit=max(stop - start, 0))
+        posts = self.queryset.in_bulk(post_ids)
+        return [posts[post_id] for post_id in post_ids if post_id in posts]
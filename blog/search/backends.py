@@ -0,0 +1,292 @@
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .tokenizer import tokenize
+
+# 标题、摘要、正文的权重
+FIELD_WEIGHTS = (('title', 10), ('desc', 5), ('content', 1))
+
+
+def index_fields(post):
+    if isinstance(post, dict):
+        return [post[field] for field, _ in FIELD_WEIGHTS]
+    return [getattr(post, field) for field, _ in FIELD_WEIGHTS]
+
+
+def searchable_posts():
+    """需要建立索引的文章：只索引正常状态的文章"""
+    from blog.models import Post
+    return Post.objects.filter(status=Post.STATUS_NORMAL).values('id', 'title', 'desc', 'content').order_by('id')
+
+
+class BaseSearchBackend:
+    def index(self, post):
+        """新增或更新一篇文章的索引，非正常状态的文章从索引中移除"""
+        from blog.models import Post
+        if post.status != Post.STATUS_NORMAL:
+            self.remove(post.id)
+        else:
+            self.update(post.id, index_fields(post))
+
+    def update(self, post_id, fields):
+        raise NotImplementedError
+
+    def remove(self, post_id):
+        raise NotImplementedError
+
+    def rebuild(self, batch_size=1000):
+        """重建全部索引，返回索引的文章数"""
+        raise NotImplementedError
+
+    def start_loading(self):
+        """第一次搜索时调用，需要加载到内存的索引在后台线程加载"""
+
+    def search(self, query, offset=0, limit=20):
+        """返回按相关度排序的文章id列表"""
+        raise NotImplementedError
+
+    def count(self, query):
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    SQLite FTS5全文索引（表由blog/migrations/0005_post_fts创建）：
+    写入前先用tokenize分词再以空格拼接，FTS5只需按空格切分，中文因此也能检索；排序使用FTS5内置的bm25()。
+    """
+    TABLE = 'blog_post_fts'
+
+    @classmethod
+    def is_available(cls):
+        if connection.vendor != 'sqlite':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [cls.TABLE])
+            return cursor.fetchone() is not None
+
+    @staticmethod
+    def make_row(post_id, fields):
+        return [post_id] + [' '.join(tokenize(value)) for value in fields]
+
+    @staticmethod
+    def make_query(query):
+        tokens = tokenize(query)
+        return ' '.join('"%s"' % token for token in tokens)  # 多个词之间为AND关系
+
+    def update(self, post_id, fields):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % self.TABLE, [post_id])
+            cursor.execute('INSERT INTO %s (rowid, title, summary, body) VALUES (%%s, %%s, %%s, %%s)' % self.TABLE,
+                           self.make_row(post_id, fields))
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % self.TABLE, [post_id])
+
+    def rebuild(self, batch_size=1000):
+        sql = 'INSERT INTO %s (rowid, title, summary, body) VALUES (%%s, %%s, %%s, %%s)' % self.TABLE
+        num = 0
+        with transaction.atomic(), connection.cursor() as cursor:  # 重建期间的搜索仍然使用旧的索引
+            cursor.execute('DELETE FROM %s' % self.TABLE)
+            batch = []
+            for post in searchable_posts().iterator(chunk_size=batch_size):
+                batch.append(self.make_row(post['id'], index_fields(post)))
+                if len(batch) >= batch_size:
+                    cursor.executemany(sql, batch)
+                    num += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+                num += len(batch)
+            cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (self.TABLE, self.TABLE))
+        return num
+
+    def search(self, query, offset=0, limit=20):
+        match = self.make_query(query)
+        if not match:
+            return []
+        weights = ', '.join(str(float(weight)) for _, weight in FIELD_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM {table} WHERE {table} MATCH %s ORDER BY bm25({table}, {weights}) LIMIT %s OFFSET %s'
+                .format(table=self.TABLE, weights=weights),
+                [match, limit, offset]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self, query):
+        match = self.make_query(query)
+        if not match:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM {table} WHERE {table} MATCH %s'.format(table=self.TABLE), [match])
+            return cursor.fetchone()[0]
+
+
+class PythonSearchBackend(BaseSearchBackend):
+    """
+    纯Python倒排索引，数据库不支持FTS5时使用：
+    1、索引保存在进程内存中，第一次搜索时（start_loading）在后台线程从数据库加载，之后由信号增量维护；
+       加载完成之前搜索退化为标题、摘要的icontains查询，不会在请求中等待加载（10万篇文章约17秒）；
+       不在进程启动时加载：gunicorn等preload后fork出的子进程不会继承父进程的线程，数据库连接也不能共用；
+    2、多进程部署时其他进程的修改不会同步，需要定期rebuild（或重启）；
+    3、词频按字段权重加权后使用BM25排序。
+    """
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._loader = None  # 后台加载线程
+        self._changed = None  # 加载期间由信号修改过的文章id，加载完成后重新索引
+        self._postings = defaultdict(dict)  # {token: {post_id: weighted_tf}}
+        self._doc_tokens = {}  # {post_id: [token, ...]}，删除、更新时使用
+        self._doc_lengths = {}  # {post_id: length}
+        self._total_length = 0
+        self._generation = 0  # 索引每次变化加一，用于判断查询缓存是否过期
+        self._last_result = (None, None, None)  # (query, generation, ranked)，分页时count和search共用一次计算
+        self._pid = os.getpid()
+
+    def _add(self, post_id, fields):
+        counter = Counter()
+        for value, (_, weight) in zip(fields, FIELD_WEIGHTS):
+            for token in tokenize(value):
+                counter[token] += weight
+        length = sum(counter.values())
+        for token, tf in counter.items():
+            self._postings[token][post_id] = tf
+        self._doc_tokens[post_id] = list(counter)
+        self._doc_lengths[post_id] = length
+        self._total_length += length
+        self._generation += 1
+
+    def _remove(self, post_id):
+        for token in self._doc_tokens.pop(post_id, ()):
+            postings = self._postings[token]
+            postings.pop(post_id, None)
+            if not postings:
+                del self._postings[token]
+        self._total_length -= self._doc_lengths.pop(post_id, 0)
+        self._generation += 1
+
+    def update(self, post_id, fields):
+        with self._lock:
+            self._mark_changed(post_id)
+            if self._loaded:  # 还没加载时不需要维护，加载时会读取最新数据
+                self._remove(post_id)
+                self._add(post_id, fields)
+
+    def remove(self, post_id):
+        with self._lock:
+            self._mark_changed(post_id)
+            if self._loaded:
+                self._remove(post_id)
+
+    def _mark_changed(self, post_id):
+        """正在加载（rebuild）时记录修改过的文章，加载完成后按数据库中的最新数据重新索引"""
+        if self._changed is not None:
+            self._changed.add(post_id)
+
+    def rebuild(self, batch_size=1000):
+        """在新的索引上加载，完成后替换，加载期间搜索和信号不需要等待"""
+        with self._lock:
+            if self._changed is None:
+                self._changed = set()
+        index = type(self)()
+        for post in searchable_posts().iterator(chunk_size=batch_size):
+            index._add(post['id'], index_fields(post))
+
+        with self._lock:
+            self._postings = index._postings
+            self._doc_tokens = index._doc_tokens
+            self._doc_lengths = index._doc_lengths
+            self._total_length = index._total_length
+            self._generation += 1
+            changed, self._changed = self._changed, None
+            if changed:
+                posts = {post['id']: post for post in searchable_posts().filter(id__in=changed)}
+                for post_id in changed:
+                    self._remove(post_id)
+                    if post_id in posts:
+                        self._add(post_id, index_fields(posts[post_id]))
+            self._loaded = True
+            return len(self._doc_lengths)
+
+    def start_loading(self):
+        self._check_fork()
+        with self._lock:
+            if self._loaded or (self._loader is not None and self._loader.is_alive()):
+                return
+            self._changed = set()
+            self._loader = threading.Thread(target=self._load, name='search-index-loader', daemon=True)
+            self._loader.start()
+
+    def _load(self):
+        try:
+            self.rebuild()
+        finally:
+            connection.close()  # 后台线程使用的数据库连接
+
+    def _check_fork(self):
+        """fork出的子进程中父进程的加载线程不存在，锁可能处于被持有的状态，没有加载完成时重新加载"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.RLock()
+            self._loader = None
+            if not self._loaded:
+                self._changed = None
+
+    def _fallback(self, query):
+        """索引加载完成之前的搜索：标题、摘要包含每个词，按id倒序"""
+        condition = Q()
+        for token in set(tokenize(query)):
+            condition &= Q(title__icontains=token) | Q(desc__icontains=token)
+        if not condition:
+            return []
+        return list(searchable_posts().filter(condition).order_by('-id').values_list('id', flat=True))
+
+    def _rank(self, query):
+        if not self._loaded:
+            self.start_loading()
+            return self._fallback(query)
+        with self._lock:
+            last_query, generation, ranked = self._last_result
+            if last_query == query and generation == self._generation:
+                return ranked
+
+            scores = self._score(set(tokenize(query)))
+            ranked = sorted(scores, key=lambda post_id: (-scores[post_id], -post_id))
+            self._last_result = (query, self._generation, ranked)
+            return ranked
+
+    def _score(self, tokens):
+        postings = [self._postings.get(token, {}) for token in tokens]
+        if not postings:
+            return {}
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])  # 从最短的倒排表开始求交集
+
+        total = len(self._doc_lengths)
+        avg_length = self._total_length / total if total else 0
+        scores = {}
+        for post_id in candidates:
+            norm = self.K1 * (1 - self.B + self.B * self._doc_lengths[post_id] / avg_length)
+            score = 0.0
+            for posting in postings:
+                tf = posting[post_id]
+                idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+                score += idf * tf * (self.K1 + 1) / (tf + norm)
+            scores[post_id] = score
+        return scores
+
+    def search(self, query, offset=0, limit=20):
+        return self._rank(query)[offset:offset + limit]
+
+    def count(self, query):
+        return len(self._rank(query))
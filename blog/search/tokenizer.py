@@ -0,0 +1,25 @@
+import re
+
+# 连续的中日韩字符，或连续的字母数字
+TOKEN_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿]+|[0-9a-zA-Z]+(?:[._+#-][0-9a-zA-Z]+)*[+#]*')
+CJK_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿]')
+
+
+def tokenize(text):
+    """
+    分词：
+    1、英文、数字按单词切分并转为小写（保留c++、c#、node.js这类写法）；
+    2、中文不依赖词典，按二元组（bigram）切分，如"数据库" -> "数据"、"据库"，单个汉字保留为一个词；
+    文档和查询使用同样的切分方式，查询的每个词都命中即为匹配。
+    """
+    tokens = []
+    for match in TOKEN_RE.finditer(text or ''):
+        word = match.group()
+        if CJK_RE.match(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+    return tokens
@@ -0,0 +1,154 @@
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from comment.models import Comment
+from config.models import Link, SideBar
+from .models import Category, Post, Tag
+from .page_cache import page_cache
+from .search import get_backend
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_navs(sender, **kwargs):
+    Category.invalidate_navs()
+
+
+@receiver([post_save, post_delete], sender=Post)
+@receiver(m2m_changed, sender=Post.tag.through)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Category)  # 分类、标签的订阅标题
+def touch_post_state(sender, update_fields=None, action=None, **kwargs):
+    """RSS、sitemap的ETag和缓存依赖文章整体版本号；只更新pv/uv、渲染结果等字段时不需要更新"""
+    if update_fields and not set(update_fields) & {'title', 'desc', 'content', 'status', 'category'}:
+        return
+    if action and not action.startswith('post_'):
+        return
+    Post.touch_state()
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not set(update_fields) & {'title', 'desc', 'content', 'status'}:
+        return
+    get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_index(sender, instance, **kwargs):
+    get_backend().remove(instance.id)
+
+
+# 整页缓存的清除规则：
+# 1、导航/底部分类、侧边栏出现在每个页面，分类、侧边栏、友链变化，或者变化的内容展示在侧边栏中时，清除全部页面；
+# 2、否则只清除受影响的页面：首页、文章详情、文章所在的分类、标签、作者页面。
+def sidebar_shown(*display_types):
+    return SideBar.objects.filter(status=SideBar.STATUS_SHOW, display_type__in=display_types).exists()
+
+
+def post_paths(category_id, owner_id, tag_ids=(), post_id=None):
+    paths = [
+        reverse('index'),
+        reverse('category-list', args=(category_id,)),
+        reverse('author', args=(owner_id,)),
+    ]
+    paths.extend(reverse('tag-list', args=(tag_id,)) for tag_id in tag_ids)
+    if post_id:
+        paths.append(reverse('post-detail', args=(post_id,)))
+    return paths
+
+
+def purge_posts(posts):
+    """posts为(id, category_id, owner_id)列表"""
+    if sidebar_shown(SideBar.DISPLAY_LATEST, SideBar.DISPLAY_HOT):
+        page_cache.purge_all()
+        return
+
+    tag_ids = {}
+    through = Post.tag.through.objects.filter(post_id__in=[post[0] for post in posts])
+    for post_id, tag_id in through.values_list('post_id', 'tag_id'):
+        tag_ids.setdefault(post_id, []).append(tag_id)
+    paths = set()
+    for post_id, category_id, owner_id in posts:
+        paths.update(post_paths(category_id, owner_id, tag_ids.get(post_id, ()), post_id))
+    page_cache.purge(*paths)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_location(sender, instance, **kwargs):
+    """保存前记录原来的分类和作者，文章移动分类后原分类页面也需要清除"""
+    instance._page_cache_origin = None
+    if instance.pk:
+        instance._page_cache_origin = Post.objects.filter(pk=instance.pk).values_list('category_id', 'owner_id').first()
+
+
+@receiver([post_save, pre_delete], sender=Post)  # 删除前文章的标签还在，标签页面也能清除
+def purge_post_pages(sender, instance, **kwargs):
+    posts = [(instance.id, instance.category_id, instance.owner_id)]
+    origin = getattr(instance, '_page_cache_origin', None)
+    if origin and origin != (instance.category_id, instance.owner_id):
+        posts.append((instance.id,) + origin)
+    purge_posts(posts)
+
+
+@receiver(m2m_changed, sender=Post.tag.through)
+def purge_post_tag_pages(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if isinstance(instance, Post):
+        tag_ids = pk_set or instance.tag.values_list('id', flat=True)
+        page_cache.purge(*post_paths(instance.category_id, instance.owner_id, tag_ids, instance.id))
+    else:  # 从标签一侧修改（tag.post_set.add/remove/clear）
+        posts = instance.post_set.all() if pk_set is None else Post.objects.filter(pk__in=pk_set)
+        page_cache.purge(reverse('tag-list', args=(instance.id,)))
+        purge_posts(list(posts.values_list('id', 'category_id', 'owner_id')))
+
+
+@receiver([post_save, pre_delete], sender=Tag)
+def purge_tag_pages(sender, instance, **kwargs):
+    page_cache.purge(reverse('tag-list', args=(instance.id,)))
+    purge_posts(list(instance.post_set.values_list('id', 'category_id', 'owner_id')))
+
+
+@receiver(post_init, sender=Comment)
+def remember_comment_status(sender, instance, **kwargs):
+    """记录加载时这条评论是否计入了文章评论数，保存时据此计算增量"""
+    instance._counted = instance.pk is not None and instance.__dict__.get('status') == Comment.STATUS_NORMAL
+
+
+def count_comment(instance, counted):
+    """新增、删除正常评论或修改评论状态时增量更新Post.comment_count"""
+    delta = int(counted) - int(instance._counted)
+    instance._counted = counted
+    instance._comment_count_delta = delta
+    post_id = instance.post_id
+    if delta and post_id:
+        Post.incr_comment_count(post_id, delta)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, **kwargs):
+    count_comment(instance, instance.status == Comment.STATUS_NORMAL)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    count_comment(instance, False)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def purge_comment_pages(sender, instance, **kwargs):
+    if sidebar_shown(SideBar.DISPLAY_COMMENT):
+        page_cache.purge_all()
+        return
+    page_cache.purge(instance.target)
+    post_id = instance.post_id
+    if getattr(instance, '_comment_count_delta', 0) and post_id:  # 列表页展示评论数
+        purge_posts(list(Post.objects.filter(pk=post_id).values_list('id', 'category_id', 'owner_id')))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SideBar)
+@receiver([post_save, post_delete], sender=Link)
+def purge_all_pages(sender, **kwargs):
+    page_cache.purge_all()
@@ -1,19 +1,124 @@
+from xml.sax.saxutils import escape
+
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.urls import reverse
 
-from .models import Post
+from mysite.cache import FragmentCache
+from .conditional import conditional
+from .models import Post, Tag
+
+sitemap_cache = FragmentCache('sitemap', timeout=getattr(settings, 'SITEMAP_CACHE_TIMEOUT', 60 * 60))
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
 
 
 class PostSitemap(Sitemap):
+    """
+    文章sitemap，按id升序分片（每片limit篇），新文章只会追加到最后一片：
+    1、/sitemap.xml为sitemap索引，/sitemap-<N>.xml为第N片；
+    2、每片先只查询这一片的文章id，再按batch_size分批查询文章并批量预取标签，边查询边输出（StreamingHttpResponse）；
+    3、输出完成后整片缓存，缓存key带文章整体版本号（Post.get_state），文章、标签变化后所有分片和索引同时失效；
+    4、客户端带ETag/Last-Modified条件请求且文章没有变化时返回304（blog.conditional）。
+    """
     changefreq = 'always'
     priority = 1.0
     protocol = 'https'
+    batch_size = 500
+
+    @property
+    def limit(self):
+        """每片的文章数，每次读取配置"""
+        return getattr(settings, 'SITEMAP_SHARD_SIZE', 2000)
 
     def items(self):
-        return Post.objects.filter(status=Post.STATUS_NORMAL)
+        return Post.objects.for_list().filter(status=Post.STATUS_NORMAL).order_by('id')
 
     def lastmod(self, obj):
-        return obj.created_time
+        return obj.updated_time
 
     def location(self, obj):
         return reverse('post-detail', args=[obj.pk])
+
+    def shard_ids(self, page):
+        start = (page - 1) * self.limit
+        return list(self.items().values_list('id', flat=True)[start:start + self.limit])
+
+    def iter_shard(self, ids):
+        tags = Prefetch('tag', queryset=Tag.objects.only('id', 'name'))
+        for start in range(0, len(ids), self.batch_size):
+            batch = ids[start:start + self.batch_size]
+            yield from self.items().filter(id__in=batch).prefetch_related(tags)
+
+    def render_url(self, domain, post):
+        lastmod = self.lastmod(post)
+        parts = [
+            '<url><loc>%s</loc>' % escape('%s://%s%s' % (self.protocol, domain, self.location(post))),
+            '<lastmod>%s</lastmod>' % lastmod.strftime('%Y-%m-%d') if lastmod else '',
+            '<changefreq>%s</changefreq><priority>%s</priority>' % (self.changefreq, self.priority),
+            '<news:news><news:publication_date>%s</news:publication_date>' % post.created_time.strftime('%Y-%m-%d'),
+        ]
+        if post.tags:
+            parts.append('<news:keywords>%s</news:keywords>' % escape(post.tags))
+        parts.append('</news:news></url>\n')
+        return ''.join(parts)
+
+    def stream_shard(self, domain, ids):
+        yield XML_HEADER
+        yield ('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+               'xmlns:news="http://www.google.com/schemas/sitemap-news/0.9">\n')
+        chunk = []
+        for post in self.iter_shard(ids):
+            chunk.append(self.render_url(domain, post))
+            if len(chunk) >= self.batch_size:
+                yield ''.join(chunk)
+                chunk = []
+        chunk.append('</urlset>\n')
+        yield ''.join(chunk)
+
+    def render_index(self, domain):
+        count = self.items().count()
+        pages = max((count + self.limit - 1) // self.limit, 1)
+        parts = [XML_HEADER, '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+        for page in range(1, pages + 1):
+            parts.append('<sitemap><loc>%s</loc></sitemap>\n' % escape('%s://%s%s' % (
+                self.protocol, domain, reverse('sitemap-section', args=(page,)))))
+        parts.append('</sitemapindex>\n')
+        return ''.join(parts)
+
+
+def cache_stream(key, chunks):
+    """边输出边收集，完整输出后写入缓存（客户端中途断开时不缓存）"""
+    content = []
+    for chunk in chunks:
+        content.append(chunk)
+        yield chunk
+    sitemap_cache.set(key, ''.join(content))
+
+
+@conditional
+def sitemap_index(request):
+    sitemap = PostSitemap()
+    domain = request.get_host()
+    key = sitemap_cache.make_key(Post.get_state()[1], domain, 'index')
+    content = sitemap_cache.get_or_set(key, lambda: sitemap.render_index(domain))
+    return HttpResponse(content, content_type='application/xml')
+
+
+@conditional
+def sitemap_section(request, page):
+    if page < 1:  # <int:page>可以是0，切片不支持负数下标
+        raise Http404('sitemap分片 %s 不存在' % page)
+    sitemap = PostSitemap()
+    domain = request.get_host()
+    key = sitemap_cache.make_key(Post.get_state()[1], domain, page)
+    content = sitemap_cache.fetch(key)
+    if content is not None:
+        return HttpResponse(content, content_type='application/xml')
+
+    ids = sitemap.shard_ids(page)
+    if not ids and page > 1:
+        raise Http404('sitemap分片 %s 不存在' % page)
+    return StreamingHttpResponse(cache_stream(key, sitemap.stream_shard(domain, ids)), content_type='application/xml')
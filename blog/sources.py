@@ -0,0 +1,231 @@
+"""
+爬取数据源适配器：每种上游格式一个适配器类，用register注册，
+settings.CRAWL_SOURCES按名称配置数据源实例，例如：
+
+    CRAWL_SOURCES = {
+        'gank': {'adapter': 'gank', 'url': 'http://gank.io/api/today'},
+        'readhub': {'adapter': 'feed', 'url': 'https://readhub.cn/rss', 'category': '资讯'},
+    }
+"""
+import email.utils
+import time
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from json import JSONDecodeError
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+Item = namedtuple('Item', 'title url category published')
+FetchResult = namedtuple('FetchResult', 'items etag last_modified fetch_time not_modified')
+
+DEFAULT_USERNAME = '干货集中营'
+DEFAULT_TAG = '第三方'
+DEFAULT_TITLE = '我是个标题'
+
+adapters = {}
+
+
+class CrawlError(Exception):
+    pass
+
+
+def register(name):
+    def decorator(cls):
+        cls.adapter = name
+        adapters[name] = cls
+        return cls
+    return decorator
+
+
+def get_sources(names=None):
+    """按名称返回配置的数据源实例，names为空时返回全部"""
+    config = getattr(settings, 'CRAWL_SOURCES', {})
+    names = list(names or config)
+    unknown = [name for name in names if name not in config]
+    if unknown:
+        raise CrawlError('未配置的数据源：%s' % '、'.join(unknown))
+
+    sources = []
+    for name in names:
+        options = dict(config[name])
+        adapter = options.pop('adapter')
+        if adapter not in adapters:
+            raise CrawlError('数据源 %s 的适配器 %s 不存在' % (name, adapter))
+        sources.append(adapters[adapter](name, **options))
+    return sources
+
+
+def parse_date(value):
+    """ISO 8601（JSON、Atom）或RFC 822（RSS）格式的时间，无法解析时返回None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        published = parse_datetime(value)
+    except ValueError:
+        published = None
+    if published is None:
+        try:
+            published = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if timezone.is_naive(published):
+        published = timezone.make_aware(published, timezone.utc)
+    return published
+
+
+class BaseSource:
+    """
+    数据源基类：fetch发送条件请求（带上次的ETag、Last-Modified），失败时退避重试，
+    parse把响应解析为Item列表，子类只需实现parse
+    """
+    adapter = None
+
+    def __init__(self, name, url, username=DEFAULT_USERNAME, tag=DEFAULT_TAG, category=None):
+        self.name = name
+        self.url = url
+        self.username = username
+        self.tag = tag
+        self.category = category
+
+    def category_names(self):
+        return [self.category] if self.category else []
+
+    def conditional_headers(self, state):
+        headers = {}
+        if state is not None and state.etag:
+            headers['If-None-Match'] = state.etag
+        if state is not None and state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+        return headers
+
+    def request(self, session, headers):
+        """请求失败（网络异常、5xx）时按0.5s、1s、2s...退避重试"""
+        timeout = getattr(settings, 'CRAWL_TIMEOUT', 10)
+        retries = getattr(settings, 'CRAWL_RETRIES', 2)
+        for attempt in range(retries + 1):
+            try:
+                response = session.get(self.url, headers=headers, timeout=timeout)
+                if response.status_code >= 500:
+                    raise requests.exceptions.HTTPError('服务器错误，状态码：%s' % response.status_code)
+                return response
+            except requests.exceptions.RequestException as e:
+                if attempt == retries:
+                    raise CrawlError('%s 文章获取失败，Request Exception: %s' % (self.name, e))
+                time.sleep(0.5 * 2 ** attempt)
+
+    def fetch(self, session, state=None):
+        start = time.time()
+        headers = self.conditional_headers(state)
+        response = self.request(session, headers)
+        fetch_time = time.time() - start
+        if response.status_code == 304:
+            if not headers:  # 没有发送条件请求，服务器不应该返回304
+                raise CrawlError('%s 服务器返回304，但请求中没有ETag/Last-Modified' % self.name)
+            return FetchResult([], state.etag, state.last_modified, fetch_time, True)
+        if response.status_code >= 400:
+            raise CrawlError('%s 请求失败，状态码：%s' % (self.name, response.status_code))
+        return FetchResult(self.parse(response), response.headers.get('ETag', ''),
+                           response.headers.get('Last-Modified', ''), fetch_time, False)
+
+    def parse(self, response):
+        raise NotImplementedError
+
+    def load_json(self, response):
+        try:
+            return response.json()
+        except (JSONDecodeError, ValueError):
+            raise CrawlError('%s 服务器响应异常，状态码：%s, 响应内容：%s'
+                             % (self.name, response.status_code, response.text[:200]))
+
+
+@register('json')
+class JsonSource(BaseSource):
+    """
+    通用JSON接口：items_key为条目列表所在的路径（用.分隔），各字段名可配置
+    """
+
+    def __init__(self, name, url, items_key='', title_field='title', url_field='url', published_field='',
+                 **options):
+        super().__init__(name, url, **options)
+        self.items_key = items_key
+        self.title_field = title_field
+        self.url_field = url_field
+        self.published_field = published_field
+
+    def make_item(self, data, category):
+        return Item(
+            title=data.get(self.title_field) or DEFAULT_TITLE,
+            url=data.get(self.url_field, ''),
+            category=category,
+            published=parse_date(data.get(self.published_field)) if self.published_field else None,
+        )
+
+    def parse(self, response):
+        data = self.load_json(response)
+        for key in filter(None, self.items_key.split('.')):
+            data = data.get(key, {}) if isinstance(data, dict) else {}
+        return [self.make_item(item, self.category) for item in data or []]
+
+
+@register('gank')
+class GankSource(JsonSource):
+    """干货集中营：结果按分类分组，只收录配置的分类"""
+    CATEGORIES = ('Android', 'iOS', '前端')
+
+    def __init__(self, name, url, categories=CATEGORIES, **options):
+        options.setdefault('title_field', 'desc')
+        options.setdefault('published_field', 'publishedAt')
+        super().__init__(name, url, **options)
+        self.categories = tuple(categories)
+
+    def category_names(self):
+        return list(self.categories)
+
+    def parse(self, response):
+        data = self.load_json(response)
+        if data.get('error'):
+            raise CrawlError('干货集中营API返回数据错误！')
+        results = data.get('results', {})
+        return [self.make_item(item, category) for category in self.categories
+                for item in results.get(category, [])]
+
+
+@register('feed')
+class FeedSource(BaseSource):
+    """RSS 2.0或Atom订阅"""
+    ATOM = '{http://www.w3.org/2005/Atom}'
+
+    def parse(self, response):
+        try:
+            root = ET.fromstring(response.content)
+        except ET.ParseError as e:
+            raise CrawlError('%s 订阅解析失败：%s' % (self.name, e))
+
+        if root.tag == self.ATOM + 'feed':
+            return [self.parse_entry(entry) for entry in root.iter(self.ATOM + 'entry')]
+        return [self.parse_item(item) for item in root.iter('item')]
+
+    def parse_item(self, item):
+        return Item(
+            title=(item.findtext('title') or DEFAULT_TITLE).strip(),
+            url=(item.findtext('link') or '').strip(),
+            category=self.category,
+            published=parse_date(item.findtext('pubDate')),
+        )
+
+    def parse_entry(self, entry):
+        url = ''
+        for link in entry.iter(self.ATOM + 'link'):
+            if link.get('rel', 'alternate') == 'alternate':
+                url = link.get('href', '')
+                break
+        return Item(
+            title=(entry.findtext(self.ATOM + 'title') or DEFAULT_TITLE).strip(),
+            url=url,
+            category=self.category,
+            published=parse_date(entry.findtext(self.ATOM + 'published') or entry.findtext(self.ATOM + 'updated')),
+        )
@@ -0,0 +1,58 @@
+import hashlib
+import re
+from urllib.parse import unquote
+
+from django import template
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from mysite.cache import FragmentCache
+from mysite.images import find_derivatives
+
+
+register = template.Library()
+
+# 改写结果按正文缓存，详情页渲染时不再逐张图片打开原图、检查副本文件；之后才生成的副本在缓存过期后生效
+srcset_cache = FragmentCache('srcset', timeout=getattr(settings, 'IMAGE_SRCSET_CACHE_TIMEOUT', 60 * 60))
+
+IMG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+SRC_RE = re.compile(r'\ssrc="([^"]+)"', re.IGNORECASE)
+
+
+def make_srcset(items):
+    return ', '.join('%s %dw' % (url, width) for width, url in items)
+
+
+def rewrite_img(match):
+    tag = match.group(0)
+    src = SRC_RE.search(tag)
+    if 'srcset=' in tag or not src or not src.group(1).startswith(settings.MEDIA_URL):
+        return tag
+
+    url = src.group(1)
+    image_format, width, derivatives = find_derivatives(settings.MEDIA_ROOT, unquote(url[len(settings.MEDIA_URL):]))
+    if not derivatives:
+        return tag
+
+    sizes = getattr(settings, 'IMAGE_SRCSET_SIZES', '100vw')
+    attrs = ''
+    if image_format in derivatives:
+        attrs = ' srcset="%s" sizes="%s"' % (make_srcset(derivatives[image_format] + [(width, url)]), sizes)
+    tag = tag[:src.end()] + attrs + tag[src.end():]
+    if 'WEBP' in derivatives and image_format != 'WEBP':
+        tag = '<picture><source type="image/webp" srcset="%s" sizes="%s">%s</picture>' % (
+            make_srcset(derivatives['WEBP']), sizes, tag)
+    return tag
+
+
+@register.filter
+def srcset(html):
+    """
+    正文中上传的图片改为响应式图片：按已生成的多尺寸副本添加srcset、sizes，有WebP副本时外面再包一层picture
+    使用方式：{% load responsive_images %} {{ post.content_html|srcset }}
+    """
+    html = html or ''
+    if '<img' not in html and '<IMG' not in html:
+        return mark_safe(html)
+    key = srcset_cache.make_key(hashlib.md5(html.encode('utf-8')).hexdigest())
+    return mark_safe(srcset_cache.get_or_set(key, lambda: IMG_RE.sub(rewrite_img, html)))
@@ -1,3 +1,1136 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import render
+from .counter import UniqueVisitors, VisitCounter, unique_visitors, visit_counter
+from .crawler import CrawlJob
+from .hll import HyperLogLog
+from .templatetags.responsive_images import srcset
+from comment.models import Comment
+from mysite.images import generate_derivatives
+from mysite.storage import DedupStorage, WatermarkStorage
+from config.models import SideBar
+from .models import Category, CrawlJobStatus, Post, SourceState, Tag, VisitorSketch
+from .search import PythonSearchBackend, SQLiteFTSBackend, get_backend, tokenize
+
 
 # Create your tests here.
+def create_post(title='test', **kwargs):
+    owner = User.objects.get_or_create(username='tester')[0]
+    kwargs.setdefault('category', Category.objects.get_or_create(name='Python', owner=owner)[0])
+    kwargs.setdefault('content', '# %s' % title)
+    return Post.objects.create(title=title, owner=owner, **kwargs)
+
+
+class VisitCounterTestCase(TestCase):
+    def setUp(self):
+        self.post = create_post()
+
+    def test_flush_merges_increments(self):
+        counter = VisitCounter()
+        with override_settings(VISIT_FLUSH_INTERVAL=60), mock.patch.object(counter, 'start'):
+            for _ in range(10):
+                counter.incr(self.post.id, pv=1)
+            counter.incr(self.post.id, uv=1)
+        self.assertEqual(counter.pending(self.post.id), (10, 1))
+
+        with self.assertNumQueries(3):  # SAVEPOINT + UPDATE + RELEASE
+            self.assertEqual(counter.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.pv, self.post.uv), (11, 2))
+        self.assertEqual(counter.pending(self.post.id), (0, 0))
+
+    def test_no_increments_lost_across_buffers(self):
+        """同一进程内的多个VisitCounter缓冲区，多线程并发累加后分别flush（F()累加，互不覆盖）"""
+        workers = [VisitCounter() for _ in range(4)]
+        hits = 500
+
+        def visit(counter):
+            for _ in range(hits):
+                counter.incr(self.post.id, pv=1, uv=1)
+
+        with override_settings(VISIT_FLUSH_INTERVAL=60):
+            with mock.patch.object(VisitCounter, 'start'):
+                threads = [threading.Thread(target=visit, args=(counter,)) for counter in workers for _ in range(2)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+        for counter in workers:
+            counter.stop()
+
+        self.post.refresh_from_db()
+        expected = 1 + len(workers) * 2 * hits
+        self.assertEqual((self.post.pv, self.post.uv), (expected, expected))
+
+    def test_forked_worker_discards_parent_buffer(self):
+        """fork出的子进程（pid变化）丢弃父进程的缓冲，只由父进程flush，增量不会重复写入"""
+        counter = VisitCounter()
+        with override_settings(VISIT_FLUSH_INTERVAL=60), mock.patch.object(counter, 'start'):
+            counter.incr(self.post.id, pv=3)
+            counter._pid = os.getpid()
+            with mock.patch('blog.counter.os.getpid', return_value=counter._pid + 1):
+                self.assertEqual(counter.pending(self.post.id), (3, 0))
+                counter.incr(self.post.id, pv=1)
+                self.assertEqual(counter.pending(self.post.id), (1, 0))
+                self.assertIsNone(counter._thread)
+
+    def test_failed_flush_keeps_increments(self):
+        counter = VisitCounter()
+        with override_settings(VISIT_FLUSH_INTERVAL=60), mock.patch.object(counter, 'start'):
+            counter.incr(self.post.id, pv=2)
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=DatabaseError), \
+                self.assertLogs('blog.counter', 'ERROR'):
+            self.assertEqual(counter.flush(), 0)
+        self.assertEqual(counter.pending(self.post.id), (2, 0))
+
+        counter.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.pv, 3)
+
+
+def visit_in_worker(counter, post_id, database, hits):
+    """fork出的worker进程：改用文件数据库，累加后flush，缓冲区清空时正常退出"""
+    db = connections['default']
+    db.settings_dict = dict(db.settings_dict, NAME=database)
+    db.connection = None  # 内存数据库在fork后不共享，继承的连接不能再使用
+    for _ in range(hits):
+        counter.incr(post_id, pv=1, uv=1)
+    counter.flush()
+    sys.exit(0 if counter.pending(post_id) == (0, 0) else 1)
+
+
+class VisitCounterMultiProcessTestCase(TransactionTestCase):
+    """多个worker进程各自缓冲，同时flush到同一个数据库，增量不丢失也不重复"""
+
+    def setUp(self):
+        self.post = create_post()
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, 'db.sqlite3')
+        connection.ensure_connection()
+        target = sqlite3.connect(self.database)
+        connection.connection.backup(target)  # 测试数据库在内存中，复制一份供多个进程共用
+        target.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_workers_flush_to_same_database(self):
+        counter = VisitCounter()
+        workers, hits = 4, 200
+        with override_settings(VISIT_FLUSH_INTERVAL=60):
+            counter.incr(self.post.id, pv=5)  # 父进程的缓冲，fork出的worker应当丢弃
+            context = multiprocessing.get_context('fork')
+            processes = [context.Process(target=visit_in_worker, args=(counter, self.post.id, self.database, hits))
+                         for _ in range(workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join(30)
+        self.assertEqual([process.exitcode for process in processes], [0] * workers)
+
+        with closing(sqlite3.connect(self.database)) as db:
+            pv, uv = db.execute('SELECT pv, uv FROM blog_post WHERE id = %d' % self.post.id).fetchone()
+        expected = 1 + workers * hits
+        self.assertEqual((pv, uv), (expected, expected))
+        self.assertEqual(counter.pending(self.post.id), (5, 0))
+        counter.stop()
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class PostListQueriesTestCase(TestCase):
+    """列表页渲染的查询数量不随文章数量增长"""
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='tester')
+        self.tag = Tag.objects.create(name='Django', owner=self.owner)
+
+    def create_posts(self, count):
+        categories = [Category.objects.create(name='分类%d' % i, owner=self.owner) for i in range(3)]
+        for i in range(count):
+            post = Post.objects.create(title='post %d' % i, content='content', category=categories[i % 3], owner=self.owner)
+            post.tag.add(self.tag, Tag.objects.create(name='tag %d' % i, owner=self.owner))
+        return categories[0]
+
+    def assert_queries(self, num, url):
+        self.client.get(url)  # 预热导航、侧边栏缓存
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_views(self):
+        for count in (3, 30):
+            with self.subTest(count=count):
+                category = self.create_posts(count)
+                self.assert_queries(3, reverse('index'))  # 游标分页，文章总数已缓存
+                if count > 20:
+                    self.assert_queries(4, reverse('index') + '?page=2')  # 旧链接使用偏移分页
+                self.assert_queries(5, reverse('search') + '?keyword=post')  # 全文索引计数、分页各一次
+                self.assert_queries(4, reverse('author', args=(self.owner.id,)))
+                self.assert_queries(4, reverse('category-list', args=(category.id,)))
+                self.assert_queries(4, reverse('tag-list', args=(self.tag.id,)))
+                Post.objects.all().delete()
+
+
+class DeferredContentTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.post = create_post('long post', content='long content ' * 1000)
+
+    def test_list_pages_defer_content(self):
+        self.assertEqual(Post.all_posts()[0].get_deferred_fields(), {'content', 'content_html', 'feed_item'})
+        self.assertEqual(Post.latest_posts()[0].get_deferred_fields(), {'content', 'content_html', 'feed_item'})
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, 'long content')
+
+    def test_detail_and_feed_load_content(self):
+        response = self.client.get(reverse('post-detail', args=(self.post.id,)))
+        self.assertContains(response, 'long content')
+        response = self.client.get('/rss/')
+        self.assertContains(response, 'long content')
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.django = create_post('Django数据库优化', desc='ORM查询', content='使用select_related减少查询')
+        self.mysql = create_post('MySQL索引', desc='数据库索引原理', content='B+树')
+        self.draft = create_post('数据库草稿', status=Post.STATUS_DRAFT)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Django数据库 C++'), ['django', '数据', '据库', 'c++'])
+        self.assertEqual(tokenize('树'), ['树'])
+
+    def assert_backend(self, backend):
+        self.assertEqual(backend.search('数据库'), [self.django.id, self.mysql.id])  # 标题命中排在前面
+        self.assertEqual(backend.count('数据库'), 2)
+        self.assertEqual(backend.search('数据库', offset=1, limit=1), [self.mysql.id])
+        self.assertEqual(backend.search('select_related'), [self.django.id])
+        self.assertEqual(backend.search('数据库 django'), [self.django.id])
+        self.assertEqual(backend.search('不存在'), [])
+
+        self.mysql.status = Post.STATUS_DELETE
+        self.mysql.save()
+        backend.index(self.mysql)
+        self.assertEqual(backend.search('数据库'), [self.django.id])
+
+    def test_sqlite_backend(self):
+        self.assertTrue(SQLiteFTSBackend.is_available())
+        self.assertIsInstance(get_backend(), SQLiteFTSBackend)
+        self.assert_backend(SQLiteFTSBackend())
+
+    def test_sqlite_backend_rebuild(self):
+        backend = SQLiteFTSBackend()
+        self.assertEqual(backend.rebuild(batch_size=1), 2)
+        self.assert_backend(backend)
+
+    def test_sqlite_backend_rebuild_atomic(self):
+        """重建失败时回滚，不会留下空的索引"""
+        from .search import backends
+        backend = SQLiteFTSBackend()
+        backend.rebuild()
+        real = backends.searchable_posts
+
+        def broken():
+            yield next(iter(real()))
+            raise DatabaseError
+
+        with mock.patch.object(backends, 'searchable_posts', lambda: mock.Mock(iterator=lambda chunk_size: broken())):
+            with self.assertRaises(DatabaseError):
+                backend.rebuild(batch_size=1)
+        self.assertEqual(backend.count('数据库'), 2)
+
+    def test_python_backend_forked(self):
+        """fork出的子进程不使用父进程的加载线程，第一次搜索时重新开始加载"""
+        backend = PythonSearchBackend()
+        with mock.patch('threading.Thread.start'):
+            backend.start_loading()
+            loader, child = backend._loader, backend._pid + 1
+            with mock.patch('blog.search.backends.os.getpid', return_value=child):
+                backend.search('数据库')
+        self.assertIsNot(backend._loader, loader)
+        self.assertEqual(backend._pid, child)
+
+    def test_python_backend(self):
+        backend = PythonSearchBackend()
+        self.assertEqual(backend.rebuild(), 2)
+        self.assert_backend(backend)
+
+    def test_python_backend_not_loaded(self):
+        """索引加载完成之前不在请求中加载，搜索退化为数据库查询"""
+        backend = PythonSearchBackend()
+        with mock.patch.object(backend, 'start_loading') as start_loading:
+            self.assertEqual(backend.search('数据库'), [self.mysql.id, self.django.id])
+            self.assertEqual(backend.count('select_related'), 0)  # 不搜索正文
+        start_loading.assert_called()
+        self.assertFalse(backend._loaded)
+
+    def test_python_backend_changes_during_rebuild(self):
+        """加载读取数据之后文章被修改（信号更新索引），替换索引后按最新数据重新索引这篇文章"""
+        from .search import backends
+        backend = PythonSearchBackend()
+        real = backends.searchable_posts
+
+        def load_then_edit():
+            yield from real()
+            self.mysql.title = 'Redis缓存'
+            self.mysql.desc = ''
+            self.mysql.save()
+            backend.index(self.mysql)
+
+        calls = [mock.Mock(iterator=lambda chunk_size: load_then_edit())]
+        with mock.patch.object(backends, 'searchable_posts', lambda: calls.pop() if calls else real()):
+            backend.rebuild()
+        self.assertEqual(backend.search('数据库'), [self.django.id])
+        self.assertEqual(backend.search('redis'), [self.mysql.id])
+
+    def test_search_view(self):
+        for i in range(25):
+            create_post('Python数据库 %d' % i)
+        response = self.client.get(reverse('search'), {'keyword': '数据库', 'page': 2})
+        self.assertEqual(response.context['paginator'].count, 27)
+        self.assertEqual(len(response.context['post_list']), 7)
+        self.assertContains(response, 'keyword=%E6%95%B0%E6%8D%AE%E5%BA%93')
+
+
+class RenderContentTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_skip_render_when_content_unchanged(self):
+        post = create_post(content='# title')
+        self.assertEqual(post.content_html.strip(), '<h1>title</h1>')
+        with mock.patch('blog.render.render_markdown') as render_markdown:
+            post.status = Post.STATUS_DRAFT
+            post.save()
+            post.save(update_fields=['status'])
+            create_post('same content', content='# title')  # 正文相同的其他文章共用渲染缓存
+        render_markdown.assert_not_called()
+
+        post.content = '# changed'
+        post.save()
+        self.assertEqual(post.content_html.strip(), '<h1>changed</h1>')
+
+    def test_update_fields_saves_rendered_html(self):
+        post = create_post(content='# a')
+        post.content = '# b'
+        post.save(update_fields=['content'])
+        post = Post.objects.get(pk=post.pk)
+        self.assertEqual(post.content_html.strip(), '<h1>b</h1>')
+        self.assertEqual(post.content_hash, render.content_hash('# b'))
+
+    @override_settings(MARKDOWN_ASYNC_THRESHOLD=100)
+    def test_render_large_post_later(self):
+        content = '**large** ' * 20
+        with mock.patch('blog.render.render_later') as render_later:
+            post = create_post(content=content)
+        self.assertNotIn('<strong>', post.content_html)
+        render_later.assert_called_once_with(post.id, post.content_hash, content)
+
+        with mock.patch('blog.render.connection'):
+            render._render_post(post.id, 'outdated', content)
+            post.refresh_from_db()
+            self.assertNotIn('<strong>', post.content_html)
+            render._render_post(post.id, post.content_hash, content)
+        post.refresh_from_db()
+        self.assertIn('<strong>large</strong>', post.content_html)
+
+    @override_settings(MARKDOWN_ASYNC_THRESHOLD=100)
+    def test_render_later_purges_page_cache(self):
+        """后台渲染完成后清除详情页的整页缓存，匿名用户不会一直看到占位内容"""
+        content = '**large** ' * 20
+        with mock.patch('blog.render.render_later'):
+            post = create_post(content=content)
+        url = reverse('post-detail', args=(post.id,))
+        self.assertNotContains(self.client.get(url), '<strong>large</strong>')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+
+        with mock.patch('blog.render.connection'):
+            render._render_post(post.id, post.content_hash, content)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, '<strong>large</strong>')
+
+    def test_rerender_posts_command(self):
+        posts = [create_post('post %d' % i, content='*%d*' % i) for i in range(5)]
+        url = reverse('post-detail', args=(posts[0].id,))
+        Post.objects.update(content_html='', content_hash='')
+        self.assertNotContains(self.client.get(url), '<em>0</em>')  # 缓存渲染前的页面
+        call_command('rerender_posts', workers=2, batch_size=2, stdout=mock.MagicMock())
+        for post in posts:
+            post.refresh_from_db()
+            self.assertIn('<em>', post.content_html)
+            self.assertEqual(post.content_hash, render.content_hash(post.content))
+        self.assertContains(self.client.get(url), '<em>0</em>')
+
+
+class PageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.post = create_post('cached post')
+        self.tag = Tag.objects.create(name='Django', owner=self.post.owner)
+        self.post.tag.add(self.tag)
+        self.detail_url = reverse('post-detail', args=(self.post.id,))
+
+    def get(self, url, cache_status, **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get('X-Page-Cache'), cache_status)
+        return response
+
+    @override_settings(VISIT_FLUSH_INTERVAL=60)
+    def test_anonymous_pages_cached(self):
+        with mock.patch.object(VisitCounter, 'start'):  # PV/UV缓冲在进程内，命中整页缓存时不查询数据库
+            for url in (reverse('index'), reverse('tag-list', args=(self.tag.id,)), self.detail_url):
+                self.get(url, 'MISS')
+                with self.assertNumQueries(0):
+                    self.get(url, 'HIT')
+        self.get(reverse('index'), 'MISS', data={'page': 1})
+        visit_counter.flush()
+
+    @override_settings(PAGE_CACHE_VERSION_TIMEOUT=120)
+    def test_versions_expire(self):
+        """版本号有过期时间：其他进程清除页面后（当前进程的缓存没有被更新），过期后重新生成"""
+        from .page_cache import page_cache
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add, mock.patch.object(cache, 'set') as set_:
+            self.get(self.detail_url, 'MISS')
+            page_cache.purge_all()
+        self.assertEqual({call[0][2] for call in add.call_args_list if call[0][0].startswith('page:version')}, {120})
+        set_.assert_any_call(page_cache.VERSION_KEY, mock.ANY, 120)
+
+    def test_logged_in_and_search_not_cached(self):
+        self.get(reverse('search'), None, data={'keyword': 'cached'})
+        self.client.force_login(self.post.owner)
+        self.get(reverse('index'), None)
+
+    def test_purge_affected_pages(self):
+        other = create_post('other post', category=Category.objects.create(name='Go', owner=self.post.owner))
+        other_url = reverse('post-detail', args=(other.id,))
+        for url in (reverse('index'), self.detail_url, other_url):
+            self.get(url, 'MISS')
+
+        self.post.title = 'new title'
+        self.post.save()
+        self.assertContains(self.get(self.detail_url, 'MISS'), 'new title')
+        self.assertContains(self.get(reverse('index'), 'MISS'), 'new title')
+        self.get(other_url, 'HIT')
+
+        Comment.objects.create(target=other_url, nickname='reader', website='https://a.com', email='a@a.com', content='nice')
+        self.get(other_url, 'MISS')
+        self.get(self.detail_url, 'HIT')
+
+        Category.objects.create(name='Rust', owner=self.post.owner)
+        self.get(self.detail_url, 'MISS')
+
+    def test_purge_all_when_sidebar_shows_posts(self):
+        SideBar.objects.create(title='最新文章', display_type=SideBar.DISPLAY_LATEST, owner=self.post.owner)
+        self.get(self.detail_url, 'MISS')
+        create_post('brand new')
+        self.assertContains(self.get(self.detail_url, 'MISS'), 'brand new')
+
+    def test_tag_change_purges_tag_page(self):
+        tag_url = reverse('tag-list', args=(self.tag.id,))
+        self.get(tag_url, 'MISS')
+        self.post.tag.remove(self.tag)
+        self.assertNotContains(self.get(tag_url, 'MISS'), 'cached post')
+
+    def test_cached_hit_counts_visit_and_csrf(self):
+        self.get(self.detail_url, 'MISS')
+        self.client.cookies.clear()
+        response = self.get(self.detail_url, 'HIT')
+        self.assertIn('csrftoken', response.cookies)
+        self.assertContains(response, 'name="csrfmiddlewaretoken" value="')
+        self.assertNotContains(response, 'PAGE_CACHE_CSRF_TOKEN')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.pv, self.post.uv), (3, 3))
+
+    def test_uid_cookie_set_only_once(self):
+        response = self.client.get(reverse('index'))
+        self.assertIn('uid', response.cookies)
+        response = self.client.get(reverse('index'))
+        self.assertNotIn('uid', response.cookies)
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.posts = [create_post('post %d' % i) for i in range(45)][::-1]  # 按id倒序
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('index'), params)
+        return response.context['page_obj'], response
+
+    def test_older_and_newer_links(self):
+        page, response = self.get_page()
+        self.assertEqual(list(page), self.posts[:20])
+        self.assertFalse(page.has_previous())
+        self.assertContains(response, '?before=%d&amp;page=2' % self.posts[19].id)
+        self.assertContains(response, 'Page 1 of 3.')
+
+        page, _ = self.get_page(before=self.posts[39].id, page=3)
+        self.assertEqual(list(page), self.posts[40:])
+        self.assertTrue(page.has_previous())
+        self.assertFalse(page.has_next())
+
+        page, response = self.get_page(after=self.posts[40].id, page=2)
+        self.assertEqual(list(page), self.posts[20:40])
+        self.assertTrue(page.has_previous())
+        self.assertTrue(page.has_next())
+        self.assertContains(response, '?after=%d&amp;page=1' % self.posts[20].id)
+
+        page, _ = self.get_page(after=self.posts[20].id)
+        self.assertEqual(list(page), self.posts[:20])
+        self.assertFalse(page.has_previous())
+        self.assertIsNone(page.number)
+
+    def test_approximate_count_cached(self):
+        self.get_page()
+        create_post('new post')
+        page, _ = self.get_page()
+        self.assertEqual(page.paginator.count, 45)
+
+    def test_legacy_page_param_uses_offset(self):
+        page, _ = self.get_page(page=2)
+        self.assertEqual(list(page), self.posts[20:40])
+        self.assertFalse(getattr(page, 'is_keyset', False))
+
+    @override_settings(POST_LIST_PAGINATION='offset')
+    def test_offset_mode_setting(self):
+        page, _ = self.get_page()
+        self.assertEqual(list(page), self.posts[:20])
+        self.assertFalse(getattr(page, 'is_keyset', False))
+
+
+class CategoryNavsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='tester')
+        Category.objects.create(name='Python', is_nav=True, owner=self.owner)
+
+    def test_navs_cached_until_category_changes(self):
+        self.assertEqual([cate.name for cate in Category.get_navs()['navs']], ['Python'])
+        with self.assertNumQueries(0):
+            Category.get_navs()
+
+        Category.objects.create(name='Django', owner=self.owner)
+        with self.assertNumQueries(1):
+            navs = Category.get_navs()
+        self.assertEqual([cate.name for cate in navs['categories']], ['Django'])
+
+    def test_navs_reloaded_when_version_evicted(self):
+        Category.get_navs()
+        cache.clear()
+        with self.assertNumQueries(1):
+            Category.get_navs()
+
+    @override_settings(NAVS_VERSION_TIMEOUT=120)
+    def test_version_expires(self):
+        """版本号有过期时间，其他进程的快照不会一直不更新"""
+        cache.delete(Category.NAVS_VERSION_KEY)
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add, mock.patch.object(cache, 'set') as set_:
+            Category.get_navs()
+            Category.invalidate_navs()
+        add.assert_called_once_with(Category.NAVS_VERSION_KEY, mock.ANY, 120)
+        set_.assert_called_once_with(Category.NAVS_VERSION_KEY, mock.ANY, 120)
+
+
+class HyperLogLogTestCase(TestCase):
+    def test_estimate_within_error_bound(self):
+        hll = HyperLogLog(error_rate=0.02)
+        self.assertEqual(len(hll.registers), 4096)
+        for i in range(50000):
+            hll.add('user-%d' % i)
+        self.assertAlmostEqual(hll.count(), 50000, delta=50000 * hll.error_rate * 3)
+
+    def test_duplicates_do_not_change_registers(self):
+        hll = HyperLogLog()
+        self.assertTrue(hll.add('uid'))
+        self.assertFalse(hll.add('uid'))
+        self.assertEqual(hll.count(), 1)
+
+    def test_union_with_different_precisions(self):
+        fine, coarse = HyperLogLog(error_rate=0.01), HyperLogLog(error_rate=0.02)
+        for i in range(5000):
+            fine.add('user-%d' % i)
+            coarse.add('user-%d' % i)
+        self.assertEqual(fine.fold(coarse.p).registers, coarse.registers)
+        merged = HyperLogLog.union([fine, coarse])
+        self.assertEqual((merged.p, merged.registers), (coarse.p, coarse.registers))
+
+    def test_merge_and_serialize(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        for i in range(3000):
+            first.add('user-%d' % i)
+            second.add('user-%d' % (i + 1500))
+        merged = HyperLogLog.union([first, second])
+        self.assertAlmostEqual(merged.count(), 4500, delta=4500 * merged.error_rate * 3)
+        self.assertEqual(HyperLogLog.from_bytes(merged.to_bytes()).registers, merged.registers)
+        with self.assertRaises(ValueError):
+            first.merge(HyperLogLog(error_rate=0.01))
+
+
+class UniqueVisitorsTestCase(TestCase):
+    def setUp(self):
+        self.post = create_post()
+        unique_visitors.take()
+
+    def test_daily_and_weekly_uniques(self):
+        monday = date(2019, 9, 2)
+        for offset in range(7):
+            for i in range(200):
+                unique_visitors.add(self.post.id, 'user-%d' % (i + offset * 100), monday + timedelta(days=offset))
+        VisitCounter().flush()
+        self.post.refresh_from_db()
+        uv = self.post.uv
+        self.assertAlmostEqual(uv - 1, 1400, delta=70)
+
+        unique_visitors.add(self.post.id, 'user-0', monday)  # 重复访客合并后寄存器不变，不再计入UV
+        VisitCounter().flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.uv, uv)
+        self.assertAlmostEqual(unique_visitors.count(self.post.id, monday), 200, delta=10)
+        self.assertAlmostEqual(unique_visitors.count(self.post.id, monday, monday + timedelta(days=6)), 800, delta=40)
+
+    def test_workers_merge_instead_of_adding_estimates(self):
+        """两个进程的访客有一半重叠，合并后只计入并集的估计值"""
+        workers = [UniqueVisitors(), UniqueVisitors()]
+        today = date.today()
+        for i in range(1000):
+            workers[0].add(self.post.id, 'user-%d' % i)
+            workers[1].add(self.post.id, 'user-%d' % (i + 500))
+        credited = 0
+        for worker in workers:
+            with transaction.atomic():
+                credited += worker.merge(worker.take())[self.post.id]
+        self.assertAlmostEqual(credited, 1500, delta=75)
+        self.assertEqual(VisitorSketch.objects.get(post_id=self.post.id, day=today).credited, credited)
+        self.assertAlmostEqual(unique_visitors.count(self.post.id, today), 1500, delta=75)
+
+    def test_failed_flush_keeps_sketch(self):
+        unique_visitors.add(self.post.id, 'user-1')
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=DatabaseError), \
+                self.assertLogs('blog.counter', 'ERROR'):
+            self.assertEqual(VisitCounter().flush(), 0)
+        self.assertFalse(VisitorSketch.objects.exists())
+        self.assertEqual(VisitCounter().flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.uv, 2)
+
+    def test_error_rate_changed(self):
+        today = date.today()
+        for i in range(300):
+            unique_visitors.add(self.post.id, 'user-%d' % i)
+        VisitCounter().flush()
+        with override_settings(UV_ERROR_RATE=0.01):
+            for i in range(300, 600):
+                unique_visitors.add(self.post.id, 'user-%d' % i)
+            VisitCounter().flush()
+        self.assertAlmostEqual(unique_visitors.count(self.post.id, today), 600, delta=30)
+        self.assertEqual(unique_visitors.sketch(self.post.id, today).p, HyperLogLog.precision_for(0.02))
+
+    def test_prune_old_sketches(self):
+        old = date.today() - timedelta(days=60)
+        unique_visitors.add(self.post.id, 'user-1', old)
+        unique_visitors._pruned = None
+        VisitCounter().flush()
+        self.assertFalse(VisitorSketch.objects.filter(day=old).exists())
+
+
+@override_settings(VISIT_FLUSH_INTERVAL=0)
+class PostDetailViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.post = create_post()
+
+    def test_visit_counted_once_per_user(self):
+        url = reverse('post-detail', args=(self.post.id,))
+        self.client.get(url)
+        self.client.get(url)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.pv, self.post.uv), (2, 2))
+
+
+class GankHandler(BaseHTTPRequestHandler):
+    results = {}
+    feed = ''
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/broken':
+            self.send_response(500)
+            self.end_headers()
+            return
+        if self.path == '/not-modified':
+            self.send_response(304)
+            self.end_headers()
+            return
+        if self.path == '/rss':
+            body, content_type = self.feed.encode('utf-8'), 'application/rss+xml'
+        else:
+            body, content_type = json.dumps({'error': False, 'results': self.results}).encode('utf-8'), 'application/json'
+        etag = '"%s"' % hash(body)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+RSS = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>test</title>
+<item><title>RSS 1</title><link>https://example.com/rss/1</link><pubDate>Mon, 02 Sep 2019 08:00:00 GMT</pubDate></item>
+<item><title>RSS 2</title><link>https://example.com/rss/2</link><pubDate>Tue, 03 Sep 2019 08:00:00 GMT</pubDate></item>
+</channel></rss>"""
+
+
+@override_settings(CRAWL_ASYNC=False, CRAWL_RETRIES=0, PAGE_CACHE_TIMEOUT=0)
+class CrawlTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(('127.0.0.1', 0), GankHandler)
+        cls.base_url = 'http://127.0.0.1:%s' % cls.server.server_port
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username='干货集中营')
+        for name in ('Android', 'iOS', '前端', '资讯'):
+            Category.objects.create(name=name, owner=user)
+        self.tag = Tag.objects.create(name='第三方', owner=user)
+        create_post('已存在的文章')
+        GankHandler.results = {
+            'Android': [{'desc': 'Android %d' % i, 'url': 'https://example.com/%d' % i,
+                         'publishedAt': '2019-09-0%dT03:00:00.000Z' % (i + 1)} for i in range(5)],
+            'iOS': [{'desc': 'iOS', 'url': 'https://example.com/ios'}] * 2,
+            '前端': [{'desc': '已存在的文章', 'url': 'https://example.com/old'}],
+        }
+        GankHandler.feed = RSS
+        GankHandler.requests = []
+        self.sources = {
+            'gank': {'adapter': 'gank', 'url': self.base_url + '/api/today'},
+            'rss': {'adapter': 'feed', 'url': self.base_url + '/rss', 'category': '资讯'},
+            'broken': {'adapter': 'gank', 'url': self.base_url + '/broken'},
+            'bogus': {'adapter': 'gank', 'url': self.base_url + '/not-modified'},
+        }
+
+    def crawl(self, *names):
+        with override_settings(CRAWL_SOURCES=self.sources):
+            job = CrawlJob(names=names)
+            job.start()
+        return CrawlJob.get_status(job.id)
+
+    def test_crawl_creates_posts_in_bulk(self):
+        status = self.crawl('gank', 'rss')
+        self.assertEqual((status['status'], status['num']), (CrawlJob.SUCCESS, 8))
+        self.assertEqual(Post.objects.filter(tag=self.tag).count(), 8)
+        self.assertEqual(Post.objects.filter(category__name='资讯').count(), 2)
+        post = Post.objects.get(title='Android 0')
+        self.assertIn('https://example.com/0', post.content_html)
+        self.assertEqual(get_backend().count('Android'), 5)
+
+        # 内容未变化时服务器返回304，不再检查标题
+        self.assertEqual(self.crawl('gank', 'rss')['num'], 0)
+        self.assertEqual(SourceState.objects.get(name='gank').last_status, SourceState.STATUS_NOT_MODIFIED)
+        self.assertEqual(dict(GankHandler.requests)['/rss'], SourceState.objects.get(name='rss').etag)
+        self.assertEqual(Post.objects.count(), 9)
+
+    def test_high_water_mark(self):
+        self.crawl('gank')
+        state = SourceState.objects.get(name='gank')
+        self.assertEqual(state.high_water.day, 5)
+        self.assertEqual((state.fetched, state.created, state.total_created), (8, 6, 6))
+
+        Post.objects.filter(title__startswith='Android').delete()
+        GankHandler.results['Android'].append({'desc': 'Android new', 'url': 'https://example.com/new',
+                                               'publishedAt': '2019-09-06T03:00:00.000Z'})
+        status = self.crawl('gank')
+        # 早于high-water mark的条目即使已被删除也不会重新写入
+        self.assertEqual(status['num'], 2)
+        self.assertEqual(set(Post.objects.filter(title__startswith='Android').values_list('title', flat=True)),
+                         {'Android 4', 'Android new'})
+
+    def test_crawl_status_view(self):
+        with override_settings(CRAWL_SOURCES={'gank': self.sources['gank']}):
+            data = self.client.get(reverse('crawl')).json()
+        self.assertEqual(data['status'], CrawlJob.SUCCESS)
+        response = self.client.get(reverse('crawl-status', args=(data['job_id'],)))
+        self.assertEqual(response.json()['num'], 6)
+        self.assertEqual(self.client.get(reverse('crawl-status', args=('missing',))).status_code, 404)
+
+    def test_status_shared_across_processes(self):
+        """任务状态保存在数据库中，清空（其他进程看不到的）缓存后仍然可以查询"""
+        job = CrawlJob()
+        job.set_status(CrawlJob.RUNNING, msg='正在爬取')
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('crawl-status', args=(job.id,))).json()['status'], CrawlJob.RUNNING)
+
+        CrawlJobStatus.objects.filter(job_id=job.id).update(created_time=timezone.now() - timedelta(days=2))
+        with override_settings(CRAWL_SOURCES={}):
+            CrawlJob(names=[]).start()
+        self.assertIsNone(CrawlJob.get_status(job.id))
+
+    def test_failed_source(self):
+        with self.assertLogs('blog.crawler', 'ERROR'):
+            status = self.crawl('broken', 'gank')
+        self.assertEqual((status['status'], status['num']), (CrawlJob.SUCCESS, 6))
+        self.assertEqual(SourceState.objects.get(name='broken').last_status, SourceState.STATUS_ERROR)
+
+        with self.assertLogs('blog.crawler', 'ERROR'):
+            self.assertEqual(self.crawl('broken')['status'], CrawlJob.FAILED)
+        self.assertEqual(self.crawl('unknown')['status'], CrawlJob.FAILED)
+
+    def test_not_modified_without_state(self):
+        """没有保存过ETag/Last-Modified时服务器返回304，作为这个数据源的错误处理，不影响其他数据源"""
+        with self.assertLogs('blog.crawler', 'ERROR'):
+            status = self.crawl('bogus', 'gank')
+        self.assertEqual((status['status'], status['num']), (CrawlJob.SUCCESS, 6))
+        state = SourceState.objects.get(name='bogus')
+        self.assertEqual(state.last_status, SourceState.STATUS_ERROR)
+        self.assertIn('304', state.last_error)
+
+    def test_source_without_category(self):
+        """订阅没有配置分类时作为这个数据源的错误处理，不影响其他数据源"""
+        self.sources['rss'] = {'adapter': 'feed', 'url': self.base_url + '/rss'}
+        status = self.crawl('rss', 'gank')
+        self.assertEqual((status['status'], status['num']), (CrawlJob.SUCCESS, 6))
+        self.assertIn('没有配置分类', SourceState.objects.get(name='rss').last_error)
+
+    def test_command(self):
+        out = StringIO()
+        with override_settings(CRAWL_SOURCES=self.sources):
+            call_command('crawl', 'rss', stdout=out)
+            call_command('crawl', 'rss', '--stats', stdout=out)
+        self.assertIn('共新增文章 2 篇', out.getvalue())
+        self.assertEqual(out.getvalue().count('rss: ok'), 2)
+
+
+@override_settings(WATERMARK_ASYNC=False)
+class WatermarkStorageTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_settings.enable()
+        self.storage = WatermarkStorage()
+
+    def tearDown(self):
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload(self, name, image_format, content_type, mode='RGB', size=(400, 300)):
+        buffer = BytesIO()
+        Image.new(mode, size, 'white').save(buffer, format=image_format, quality=75)
+        return self.storage.save(name, SimpleUploadedFile(name, buffer.getvalue(), content_type=content_type))
+
+    def test_keeps_jpeg_format_and_quality(self):
+        name = self.upload('photo.jpg', 'JPEG', 'image/jpeg')
+        with Image.open(self.storage.path(name)) as image:
+            self.assertEqual(image.format, 'JPEG')
+            original = Image.new('RGB', (400, 300), 'white')
+            buffer = BytesIO()
+            original.save(buffer, format='JPEG', quality=75)
+            self.assertEqual(image.quantization, Image.open(buffer).quantization)
+            self.assertNotEqual(image.convert('RGB').getcolors(), original.getcolors())
+
+    def test_palette_png(self):
+        name = self.upload('icon.png', 'PNG', 'image/png', mode='P')
+        with Image.open(self.storage.path(name)) as image:
+            self.assertEqual(image.format, 'PNG')
+            self.assertGreater(len(image.convert('RGB').getcolors()), 1)
+
+    def test_non_image_untouched(self):
+        name = self.storage.save('a.txt', SimpleUploadedFile('a.txt', b'text', content_type='text/plain'))
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'text')
+
+    @override_settings(IMAGE_DERIVATIVE_WIDTHS=(480, 960, 1440), IMAGE_DERIVATIVE_WEBP=True, MEDIA_URL='/media/')
+    def test_derivatives_and_srcset(self):
+        name = self.upload('article_images/wide.jpg', 'JPEG', 'image/jpeg', size=(1000, 500))
+        derivatives = os.path.join(self.media_root, 'derivatives', 'article_images')
+        self.assertEqual(sorted(os.listdir(derivatives)),
+                         ['wide-480w.jpg', 'wide-480w.webp', 'wide-960w.jpg', 'wide-960w.webp'])
+        with Image.open(os.path.join(derivatives, 'wide-480w.jpg')) as image:
+            self.assertEqual(image.size, (480, 240))
+        self.assertEqual(generate_derivatives(self.media_root, name), 0)  # 已生成的副本不再重复生成
+
+        html = str(srcset('<p><img alt="" src="/media/%s" /><img src="https://example.com/a.jpg" /></p>' % name))
+        self.assertIn('<picture><source type="image/webp" '
+                      'srcset="/media/derivatives/article_images/wide-480w.webp 480w, '
+                      '/media/derivatives/article_images/wide-960w.webp 960w"', html)
+        self.assertIn('srcset="/media/derivatives/article_images/wide-480w.jpg 480w, '
+                      '/media/derivatives/article_images/wide-960w.jpg 960w, /media/%s 1000w"' % name, html)
+        self.assertIn('<img src="https://example.com/a.jpg" />', html)
+
+        with mock.patch('mysite.images.Image.open') as image_open:  # 同样的正文不再打开原图、检查副本
+            self.assertEqual(str(srcset('<p><img alt="" src="/media/%s" /><img src="https://example.com/a.jpg" /></p>'
+                                        % name)), html)
+        image_open.assert_not_called()
+
+    @override_settings(IMAGE_DERIVATIVE_WIDTHS=(480,), IMAGE_DERIVATIVE_WEBP=False)
+    def test_backfill_command(self):
+        """默认处理DedupStorage的目录和启用之前的上传目录"""
+        for name in ('article_images/old.png', 'blobs/ab/abc.png'):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path))
+            Image.new('RGB', (800, 600), 'white').save(path)
+        out = StringIO()
+        call_command('generate_image_derivatives', '--workers', '1', stdout=out)
+        call_command('generate_image_derivatives', '--workers', '1', stdout=out)
+        self.assertIn('生成副本 2 个', out.getvalue())
+        self.assertIn('生成副本 0 个', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'derivatives', 'article_images', 'old-480w.png')))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'derivatives', 'blobs', 'ab', 'abc-480w.png')))
+
+
+@override_settings(WATERMARK_ASYNC=False, IMAGE_DERIVATIVE_WIDTHS=(480,), IMAGE_DERIVATIVE_WEBP=False)
+class DedupStorageTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_settings.enable()
+        self.storage = DedupStorage()
+
+    def tearDown(self):
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload(self, name, color='white'):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), color).save(buffer, format='JPEG')
+        return self.storage.save(name, SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg'))
+
+    def test_same_content_stored_once(self):
+        first = self.upload('article_images/2019/09/02/a.JPG')
+        second = self.upload('article_images/2019/09/03/b.jpg')
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertNotEqual(self.upload('c.jpg', color='black'), first)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'blobs'))), 2)
+
+        name = self.storage.save('a.txt', SimpleUploadedFile('a.txt', b'text', content_type='text/plain'))
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'text')
+
+    def test_gc_media(self):
+        used = self.upload('used.jpg')
+        unused = self.upload('unused.jpg', color='black')
+        fresh = self.upload('fresh.jpg', color='blue')
+        create_post(content='<img src="/media/%s" />' % used, is_md=False)
+        old = time.time() - 2 * 60 * 60
+        for name in (used, unused):
+            os.utime(self.storage.path(name), (old, old))
+
+        out = StringIO()
+        call_command('gc_media', '--min-age', '1', stdout=out)
+        self.assertTrue(self.storage.exists(used))
+        self.assertTrue(self.storage.exists(fresh))
+        self.assertFalse(self.storage.exists(unused))
+        derivatives = os.listdir(os.path.dirname(self.storage.path(
+            os.path.join('derivatives', os.path.splitext(unused)[0]))))
+        self.assertNotIn(os.path.basename(os.path.splitext(unused)[0]) + '-480w.jpg', derivatives)
+        self.assertIn('已删除文件 2 个', out.getvalue())
+
+    def test_reupload_protects_old_blob_from_gc(self):
+        """旧的未引用文件被重新上传（还没有保存到文章中）时更新修改时间，gc_media不会删除"""
+        name = self.upload('old.jpg')
+        old = time.time() - 2 * 60 * 60
+        os.utime(self.storage.path(name), (old, old))
+        self.assertEqual(self.upload('again.jpg'), name)
+        call_command('gc_media', '--min-age', '1', stdout=StringIO())
+        self.assertTrue(self.storage.exists(name))
+
+    def test_max_length(self):
+        with self.assertRaises(SuspiciousFileOperation):
+            self.storage.save('a.txt', SimpleUploadedFile('a.txt', b'text'), max_length=50)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'blobs')), [])  # 临时文件已删除
+
+
+@override_settings(SITEMAP_SHARD_SIZE=3)
+class SitemapTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        tag = Tag.objects.create(name='Django', owner=User.objects.get_or_create(username='tester')[0])
+        for i in range(7):
+            create_post('sitemap %d' % i).tag.add(tag)
+
+    def get_shard(self, page):
+        response = self.client.get(reverse('sitemap-section', args=(page,)))
+        if response.streaming:
+            return b''.join(response.streaming_content).decode('utf-8')
+        return response.content.decode('utf-8')
+
+    def test_index(self):
+        content = self.client.get(reverse('sitemap')).content.decode('utf-8')
+        self.assertEqual(content.count('<sitemap>'), 3)
+        self.assertIn(reverse('sitemap-section', args=(3,)), content)
+
+    def test_shard_queries_and_cache(self):
+        with self.assertNumQueries(3):  # 文章id、文章、标签
+            content = self.get_shard(1)
+        self.assertEqual(content.count('<url>'), 3)
+        self.assertEqual(content.count('<news:keywords>Django</news:keywords>'), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_shard(1), content)
+
+        post = Post.objects.order_by('id').first()
+        post.status = Post.STATUS_DELETE
+        post.save()
+        self.assertNotIn(reverse('post-detail', args=(post.id,)), self.get_shard(1))
+        self.assertEqual(self.client.get(reverse('sitemap-section', args=(9,))).status_code, 404)
+
+    def test_shard_zero(self):
+        self.assertEqual(self.client.get('/sitemap-0.xml').status_code, 404)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.post = create_post('conditional')
+
+    def test_feed_not_modified(self):
+        response = self.client.get('/rss/')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/rss/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            cached = self.client.get('/rss/')  # 没有条件请求头时返回缓存的内容
+        self.assertEqual(cached.content, response.content)
+        self.assertNotEqual(self.client.get('/feed/')['ETag'], etag)
+
+        updated_time = self.post.updated_time
+        self.post.title = 'changed'
+        self.post.save()
+        self.assertGreater(self.post.updated_time, updated_time)
+        response = self.client.get('/rss/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'changed', response.content)
+
+    def test_sitemap_if_modified_since(self):
+        response = self.client.get(reverse('sitemap'))
+        last_modified = response['Last-Modified']
+        self.assertEqual(self.client.get(reverse('sitemap'), HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        Post.objects.filter(pk=self.post.pk).update(pv=100)  # 访问量变化不影响sitemap
+        self.assertEqual(self.client.get(reverse('sitemap'), HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        with mock.patch('django.utils.timezone.now', return_value=Post.get_state()[0] + timedelta(seconds=5)):
+            create_post('another')
+        self.assertEqual(self.client.get(reverse('sitemap'), HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    @override_settings(POST_STATE_TIMEOUT=120)
+    def test_state_expires(self):
+        """版本号有过期时间：其他进程修改文章后（当前进程的缓存没有被更新），过期后重新生成"""
+        cache.delete(Post.STATE_KEY)
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add, mock.patch.object(cache, 'set') as set_:
+            Post.get_state()
+            Post._set_state()
+        add.assert_called_once_with(Post.STATE_KEY, mock.ANY, 120)
+        set_.assert_called_once_with(Post.STATE_KEY, mock.ANY, 120)
+
+        etag = self.client.get('/rss/')['ETag']
+        Post.objects.filter(pk=self.post.pk).update(title='changed elsewhere', updated_time=timezone.now())
+        self.assertEqual(self.client.get('/rss/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        cache.delete(Post.STATE_KEY)  # 过期
+        self.assertEqual(self.client.get('/rss/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_delete_newest_post(self):
+        """删除最新的文章后版本号过期重新生成时，Last-Modified不会倒退到剩下文章的修改时间"""
+        now = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(seconds=5)):
+            newest = create_post('newest')
+            last_modified = self.client.get(reverse('sitemap'))['Last-Modified']
+        newest.delete()
+        cache.delete(Post.STATE_KEY)  # 过期
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(seconds=10)):
+            response = self.client.get(reverse('sitemap'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+
+class FeedTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.posts = [create_post('feed %d' % i, desc='摘要 & %d' % i) for i in range(8)]
+        self.tag = Tag.objects.create(name='Python', owner=self.posts[0].owner)
+        self.posts[0].tag.add(self.tag)
+
+    def test_precomputed_items(self):
+        post = self.posts[-1]
+        self.assertEqual(post.feed_item, '')  # 新文章保存时还没有id
+        response = self.client.get('/rss/')
+        self.assertContains(response, '<item>', count=5)
+        self.assertContains(response, '<link>http://testserver/post/%s.html</link>' % post.id)
+        self.assertContains(response, '<description>摘要 &amp; 7</description>')
+        post.refresh_from_db()
+        self.assertIn('__FEED_BASE_URL__/post/%s.html' % post.id, post.feed_item)
+
+        cache.clear()
+        with self.assertNumQueries(1):  # 只查询feed_item，条目都已生成（版本号不查询数据库）
+            self.assertEqual(self.client.get('/rss/').content, response.content)
+
+        post.title = 'renamed'
+        post.save()
+        self.assertContains(self.client.get('/rss/'), '<title>renamed</title>')
+
+    def test_update_fields_refresh_feed_item(self):
+        post = Post.objects.get(pk=self.posts[0].pk)
+        post.save()
+        post.title = 'renamed'
+        post.save(update_fields=['title'])
+        self.assertIn('<title>renamed</title>', Post.objects.get(pk=post.pk).feed_item)
+        post.content = '# new body'
+        post.save(update_fields=['content'])
+        self.assertIn('&lt;h1&gt;new body&lt;/h1&gt;', Post.objects.get(pk=post.pk).feed_item)
+
+    def test_item_count(self):
+        self.assertContains(self.client.get('/rss/?count=8'), '<item>', count=8)
+        self.assertContains(self.client.get('/rss/?count=2'), '<item>', count=2)
+        cache.clear()  # 响应按ETag缓存
+        with override_settings(RSS_MAX_ITEM_COUNT=3):
+            self.assertContains(self.client.get('/rss/?count=8'), '<item>', count=3)
+
+    def test_category_and_tag_feeds(self):
+        category = self.posts[0].category
+        response = self.client.get(reverse('category-rss', args=(category.id,)))
+        self.assertContains(response, '<title>%s - Tech Daily System</title>' % category.name)
+        response = self.client.get(reverse('tag-rss', args=(self.tag.id,)))
+        self.assertContains(response, '<item>', count=1)
+        self.assertContains(response, '/post/%s.html' % self.posts[0].id)
+        self.assertEqual(self.client.get(reverse('tag-rss', args=(999,))).status_code, 404)
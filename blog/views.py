@@ -1,20 +1,19 @@
-import json
 import logging
-from datetime import date
-from json import JSONDecodeError
 
-import requests
 from django.contrib.auth.models import User
-from django.http import HttpResponse
+from django.http import JsonResponse
 from django.shortcuts import render
-from django.urls import reverse
 from django.views import View
 from django.views.generic import ListView, DetailView
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, F
 from django.core.cache import cache
 
+from .counter import visit_counter, unique_visitors
+from .crawler import CrawlJob
 from .models import Post, Tag, Category
+from .page_cache import PageCacheMixin
+from .paginator import KeysetPaginationMixin
+from .search import SearchResults
 from config.models import SideBar, Link
 from comment.models import Comment
 from comment.forms import CommentForm
@@ -34,7 +33,7 @@ class CommonViewMixin(object):
 
 
 # Create your views here.
-class IndexView(CommonViewMixin, ListView):
+class IndexView(PageCacheMixin, KeysetPaginationMixin, CommonViewMixin, ListView):
     queryset = Post.all_posts()
     paginate_by = 20
     context_object_name = 'post_list'
@@ -96,6 +95,9 @@ class TagView(IndexView):
 
 
 class SearchView(IndexView):
+    page_cache_enabled = False  # 搜索关键词无法穷举，不做整页缓存
+    pagination_mode = 'offset'  # 搜索结果按相关度排序，不能按id游标分页
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context.update({
@@ -104,14 +106,15 @@ class SearchView(IndexView):
         return context
 
     def get_queryset(self):
+        """使用全文索引搜索标题、摘要和正文，结果按相关度排序（原来是title、desc的icontains全表扫描）"""
         queryset = super().get_queryset()
         keyword = self.request.GET.get('keyword', '')
         if not keyword:
             return queryset
-        return queryset.filter(Q(title__icontains=keyword) | Q(desc__icontains=keyword))
+        return SearchResults(keyword, queryset)
 
 
-class PostDetailView(CommonViewMixin, DetailView):
+class PostDetailView(PageCacheMixin, CommonViewMixin, DetailView):
     # queryset = Post.latest_posts()  # TODO(Devin): model ???
     model = Post
     template_name = 'blog/detail.html'
@@ -139,34 +142,27 @@ class PostDetailView(CommonViewMixin, DetailView):
 
     def get(self, request, *args, **kwargs):
         response = super().get(request, *args, **kwargs)
-        self.handle_visited()
+        self.handle_visited(self.object.id)
         return response
 
-    def handle_visited(self):
+    def page_cache_hit(self, request, *args, **kwargs):
+        """命中整页缓存时同样需要统计PV/UV"""
+        self.handle_visited(int(kwargs[self.pk_url_kwarg]))
+
+    def handle_visited(self, post_id):
         """
         Django的缓存默认使用内存缓存（进程间独立），只适合单进程。
         在实际项目中推进使用memcached or redis，同时避免用户在请求数据过程中进行写操作，这时比较合理的方案就是：独立的统计服务
+        这里用cache.add代替get+set（一次缓存读写），PV/UV增量交给visit_counter缓冲后批量写库
         """
-        increase_pv = False
-        increase_uv = False
         uid = self.request.uid
         pv_key = 'pv:%s:%s' % (uid, self.request.path)
-        uv_key = 'uv:%s:%s:%s' % (uid, str(date.today()), self.request.path)
 
-        if not cache.get(pv_key):
-            increase_pv = True
-            cache.set(pv_key, 1, 1*60)
+        increase_pv = cache.add(pv_key, 1, 1*60)  # key不存在时写入并返回True
+        new_visitor = unique_visitors.add(post_id, uid)  # 进程内每篇文章每天一个HyperLogLog，flush时合并并计入UV
 
-        if not cache.get(uv_key):
-            increase_uv = True
-            cache.set(uv_key, 1, 24*60*60)
-
-        if increase_pv and increase_uv:
-            Post.objects.filter(pk=self.object.id).update(pv=F('pv')+1, uv=F('uv')+1)
-        elif increase_pv:
-            Post.objects.filter(pk=self.object.id).update(pv=F('pv')+1)
-        elif increase_uv:
-            Post.objects.filter(pk=self.object.id).update(uv=F('uv')+1)
+        if increase_pv or new_visitor:
+            visit_counter.incr(post_id, pv=int(increase_pv))
 
 
 class LinkListView(CommonViewMixin, ListView):
@@ -190,67 +186,17 @@ class CrawlingView(View):
 
 
 def crawl(request):
-    gank_api = 'http://gank.io/api/today'
-    data = {'num': -1, 'msg': 'failed'}
-    try:
-        response = requests.get(gank_api)
-    except requests.exceptions.RequestException:
-        msg = '干货集中营文章获取失败，Request Exception!'
-        logging.error(msg)
-        data['msg'] = msg
-    else:
-        try:
-            result = response.json()
-            if result['error']:
-                data['msg'] = '干货集中营API返回数据错误！'
-            else:
-                results = result.get('results', {})
-                android_list = results.get('Android', [])
-                android_num = gen_post_list(android_list, 'Android')
-                ios_list = results.get('iOS', [])
-                ios_num = gen_post_list(ios_list, 'iOS')
-
-                front_end_list = results.get('前端', [])
-                front_end_num = gen_post_list(front_end_list, '前端')
-                post_num = android_num + ios_num + front_end_num
-
-                data['num'] = post_num
-                data['msg'] = 'Android文章 %d 篇， iOS文章 %d 篇， 前端文章 %d 篇' % (android_num, ios_num, front_end_num)
-        except JSONDecodeError:
-            msg = '服务器响应异常，状态码：%s, 响应内容：%s' % (response.status_code, response.text)
-            logging.error(msg)
-            data['msg'] = msg
-        except Exception as e:
-            logging.error(e)
-            data['msg'] = '程序处理出现异常，请联系管理员查看错误日志，谢谢！'
-
-    return HttpResponse(json.dumps(data), content_type='application/json')
-
-
-def gen_post_list(data_list, data_type):
-    if data_type == 'Android':
-        category = Category.objects.get(name='Android')
-    elif data_type == 'iOS':
-        category = Category.objects.get(name='iOS')
-    elif data_type == '前端':
-        category = Category.objects.get(name='前端')
-    username = '干货集中营'
-    user = User.objects.get(username=username)
-    third_party_tag = Tag.objects.get(name='第三方')
-    num = 0
-    for item in data_list:
-        if not Post.objects.filter(title=item['desc']):
-            title = item.get('desc', '我是个标题')
-            url = item.get('url', reverse('index'))
-            content = "原文地址：[%s](%s)" % (title, url)
-            post = Post(title=title, desc=url, content=content, category=category, owner=user)
-            post.save()
-            post.tag.add(third_party_tag)
-            num += 1
-        else:
-            logging.debug('平台：' + username + ' 分类：' + data_type + '文章：' + item['desc'] + ' 已存在')
-
-    return num
+    """启动后台爬取任务，页面通过crawl-status轮询任务状态"""
+    job = CrawlJob()
+    job.start()
+    return JsonResponse(CrawlJob.get_status(job.id))
+
+
+def crawl_status(request, job_id):
+    data = CrawlJob.get_status(job_id)
+    if data is None:
+        return JsonResponse({'job_id': job_id, 'status': 'unknown', 'num': -1, 'msg': '任务不存在或已过期'}, status=404)
+    return JsonResponse(data)
 
 
 def post_list(request, category_id=None, tag_id=None):
@@ -0,0 +1,73 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class LatestComments:
+    """
+    最近评论的环形缓冲，保存在缓存中，侧边栏展示时不再查询评论表：
+    1、新评论写入后放到最前面，超过COMMENT_LATEST_SIZE条时丢弃最旧的；
+    2、评论被删除、修改状态或内容时整体清除，下次读取时用一次查询重建；
+    3、每条只保存展示需要的字段（dict），评论目标是文章时带上文章标题。
+    注意：多进程同时写入时get+set可能丢失一条；使用进程内缓存时写入和清除只影响当前进程，
+    所以缓存最多保存COMMENT_LATEST_TIMEOUT秒，过期后从数据库重建，不会长期不一致。
+    """
+    KEY = 'comment:latest'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return getattr(settings, 'COMMENT_LATEST_SIZE', 5)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'COMMENT_LATEST_TIMEOUT', 60)
+
+    @staticmethod
+    def to_item(comment, title=''):
+        return {
+            'id': comment.id,
+            'target': comment.target,
+            'title': title,
+            'nickname': comment.nickname,
+            'content': comment.content,
+        }
+
+    def get(self):
+        items = cache.get(self.KEY)
+        if items is None:
+            items = self.rebuild()
+        return items
+
+    def rebuild(self):
+        from blog.models import Post
+        from .models import Comment
+
+        comments = list(Comment.objects.filter(status=Comment.STATUS_NORMAL)[:self.size])
+        titles = dict(Post.objects.filter(id__in={comment.post_id for comment in comments} - {None})
+                      .values_list('id', 'title'))
+        items = [self.to_item(comment, titles.get(comment.post_id, '')) for comment in comments]
+        cache.set(self.KEY, items, self.timeout)
+        return items
+
+    def push(self, comment):
+        """新评论写入，缓存中还没有时不处理（读取时会重建，已经包含这条评论）"""
+        from blog.models import Post
+
+        post_id = comment.post_id
+        title = Post.objects.filter(pk=post_id).values_list('title', flat=True).first() if post_id else ''
+        with self._lock:
+            items = cache.get(self.KEY)
+            if items is None:
+                return
+            items = [self.to_item(comment, title or '')] + [item for item in items if item['id'] != comment.id]
+            cache.set(self.KEY, items[:self.size], self.timeout)
+
+    def invalidate(self):
+        cache.delete(self.KEY)
+
+
+latest_comments = LatestComments()
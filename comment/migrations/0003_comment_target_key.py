@@ -0,0 +1,52 @@
+# Generated by Django 2.2.28 on 2026-10-18 22:10
+
+import hashlib
+from urllib.parse import urlsplit
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def fill_target_key(apps, schema_editor):
+    """
+    已有评论的目标统一为路径，并计算target_key（与comment.models.make_target_key一致）；
+    按id分批读取、写入，不一次读入全部评论（SQLite边迭代边更新同一张表时结果不确定，所以不用iterator()）
+    """
+    Comment = apps.get_model('comment', 'Comment')
+    last_id = 0
+    while True:
+        comments = list(Comment.objects.filter(id__gt=last_id).order_by('id').only('id', 'target')[:BATCH_SIZE])
+        if not comments:
+            break
+        for comment in comments:
+            comment.target = urlsplit(comment.target or '').path or '/'
+            comment.target_key = hashlib.md5(comment.target.encode('utf-8')).hexdigest()
+        Comment.objects.bulk_update(comments, ['target', 'target_key'])
+        last_id = comments[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0002_auto_20190823_1427'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ['-id'], 'verbose_name': '评论', 'verbose_name_plural': '评论'},
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='target_key',
+            field=models.CharField(default='', editable=False, max_length=32, verbose_name='评论目标key'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_target_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['target_key', 'status', '-id'], name='comment_target_idx'),
+        ),
+    ]
@@ -1,7 +1,30 @@
+import hashlib
+from urllib.parse import urlsplit
+
 from django.db import models
+from django.urls import Resolver404, resolve
+
 from blog.models import Post
 
 
+def normalize_target(target):
+    """评论目标统一为不带域名、查询参数和锚点的路径，同一页面的不同写法对应同一组评论"""
+    return urlsplit(target or '').path or '/'
+
+
+def make_target_key(target):
+    return hashlib.md5(normalize_target(target).encode('utf-8')).hexdigest()
+
+
+def target_post_id(target):
+    """评论目标是文章详情页时返回文章id，其他页面（友链、爬取等）返回None"""
+    try:
+        match = resolve(normalize_target(target))
+    except Resolver404:
+        return None
+    return int(match.kwargs['post_id']) if match.url_name == 'post-detail' else None
+
+
 # Create your models here.
 class Comment(models.Model):
     STATUS_NORMAL = 1
@@ -13,6 +36,7 @@ class Comment(models.Model):
 
     # target = models.ForeignKey(Post, verbose_name='评论目标', on_delete=models.CASCADE)
     target = models.CharField(max_length=100, verbose_name='评论目标')
+    target_key = models.CharField(max_length=32, editable=False, verbose_name='评论目标key')  # 路径的md5，定长便于索引
     nickname = models.CharField(max_length=50, verbose_name='昵称')
     website = models.URLField(verbose_name='网站')
     email = models.EmailField(verbose_name='邮箱')
@@ -23,8 +47,19 @@ class Comment(models.Model):
     class Meta:
         verbose_name = verbose_name_plural = '评论'
         ordering = ['-id']
+        # 评论模块按(目标, 状态)过滤、按id倒序分页，联合索引可以直接按索引顺序读取一页
+        indexes = [models.Index(fields=['target_key', 'status', '-id'], name='comment_target_idx')]
+
+    def save(self, *args, **kwargs):
+        self.target = normalize_target(self.target)
+        self.target_key = make_target_key(self.target)
+        super().save(*args, **kwargs)
+
+    @property
+    def post_id(self):
+        return target_post_id(self.target)
 
     @classmethod
     def get_by_target(cls, target):
-        return cls.objects.filter(target=target, status=cls.STATUS_NORMAL)
+        return cls.objects.filter(target_key=make_target_key(target), status=cls.STATUS_NORMAL)
 
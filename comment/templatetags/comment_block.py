@@ -1,5 +1,7 @@
 from django import template
+from django.conf import settings
 
+from blog.paginator import KeysetPaginator
 from comment.forms import CommentForm
 from comment.models import Comment
 
@@ -7,8 +9,15 @@ from comment.models import Comment
 register = template.Library()
 
 
-@register.inclusion_tag('comment/block.html')
-def comment_block(target):
+def _int_param(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@register.inclusion_tag('comment/block.html', takes_context=True)
+def comment_block(context, target):
     """
     使用方式：
     1、模板最上面增加（extends下面）
@@ -16,9 +25,18 @@ def comment_block(target):
     2、在需要展示评论的地方增加
     {% comment_block request.path %}
 
+    评论按id倒序游标分页（每页COMMENT_PAGE_SIZE条，?comment_before=<id>/?comment_after=<id>翻页），
+    评论很多的文章也只读取一页，走(target_key, status, -id)联合索引
     """
+    request = context.get('request')
+    params = request.GET if request is not None else {}
+    paginator = KeysetPaginator(Comment.get_by_target(target), getattr(settings, 'COMMENT_PAGE_SIZE', 20))
+    page = paginator.page(before=_int_param(params.get('comment_before')),
+                          after=_int_param(params.get('comment_after')), number=0)
     return {
         'target': target,
         'comment_form': CommentForm(),
-        'comment_list': Comment.get_by_target(target)
+        'comment_list': page.object_list,
+        'older': page[-1].id if page.has_next() else None,
+        'newer': page[0].id if page.has_previous() else None,
     }
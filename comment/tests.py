@@ -1,3 +1,134 @@
-from django.test import TestCase
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from blog.models import Category, Post
+from .latest import latest_comments
+from .models import Comment, make_target_key
+
+
+class BaseCommentTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create(username='tester')
+        category = Category.objects.create(name='Python', owner=owner)
+        self.post = Post.objects.create(title='test', content='# test', category=category, owner=owner)
+        self.url = reverse('post-detail', args=(self.post.id,))
+
+    def create_comments(self, num, target=None):
+        return [Comment.objects.create(target=target or self.url, nickname='reader%d' % i, website='https://a.com',
+                                       email='a@a.com', content='comment-%d;' % i) for i in range(num)]
+
+
+class CommentTestCase(BaseCommentTestCase):
+    def test_target_normalized(self):
+        comment = self.create_comments(1, 'http://testserver%s?page=2#comments' % self.url)[0]
+        self.assertEqual(comment.target, self.url)
+        self.assertEqual(comment.target_key, make_target_key(self.url))
+        self.assertEqual(list(Comment.get_by_target(self.url + '?x=1')), [comment])
+
+    def test_post_comment(self):
+        response = self.client.post(reverse('comment'), {
+            'target': 'https://evil.com%s' % self.url, 'nickname': 'reader', 'email': 'a@a.com',
+            'website': 'https://a.com', 'content': 'nice post',
+        })
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertEqual(Comment.get_by_target(self.url).count(), 1)
+
+    @override_settings(COMMENT_PAGE_SIZE=3)
+    def test_paginated_block(self):
+        comments = self.create_comments(7)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        sql = [query['sql'] for query in queries if 'comment_comment' in query['sql']]
+        self.assertEqual(len(sql), 1)
+        self.assertIn('LIMIT 4', sql[0])
+        self.assertContains(response, 'comment-6;')
+        self.assertNotContains(response, 'comment-3;')
+        self.assertContains(response, '?comment_before=%s' % comments[4].id)
+        self.assertNotContains(response, '?comment_after=')
+
+        response = self.client.get(self.url, {'comment_before': comments[4].id})
+        self.assertContains(response, 'comment-3;')
+        self.assertNotContains(response, 'comment-4;')
+        self.assertContains(response, '?comment_after=%s' % comments[3].id)
+        response = self.client.get(self.url, {'comment_after': comments[3].id})
+        self.assertContains(response, 'comment-4;')
+        self.assertNotContains(response, 'comment-3;')
+
+
+class CommentCountTestCase(BaseCommentTestCase):
+    def count(self):
+        return Post.objects.values_list('comment_count', flat=True).get(pk=self.post.pk)
+
+    def test_incremental_count(self):
+        comments = self.create_comments(3)
+        self.create_comments(2, reverse('links'))
+        self.assertEqual(self.count(), 3)
+
+        comment = Comment.objects.get(pk=comments[0].pk)
+        comment.status = Comment.STATUS_DELETE
+        comment.save()
+        comment.save()
+        self.assertEqual(self.count(), 2)
+        comment.status = Comment.STATUS_NORMAL
+        comment.save()
+        self.assertEqual(self.count(), 3)
+
+        comments[1].delete()
+        Comment.objects.filter(pk=comments[2].pk).delete()
+        self.assertEqual(self.count(), 1)
+
+    def test_list_page_shows_count(self):
+        self.assertContains(self.client.get(reverse('index')), '评论：0')
+        self.create_comments(2)
+        self.assertContains(self.client.get(reverse('index')), '评论：2')
+
+    @override_settings(COMMENT_LATEST_SIZE=3)
+    def test_latest_comments(self):
+        self.create_comments(2, reverse('links'))
+        self.assertEqual([item['nickname'] for item in latest_comments.get()], ['reader1', 'reader0'])
+        comments = self.create_comments(2)
+        with self.assertNumQueries(0):
+            items = latest_comments.get()
+        self.assertEqual([item['nickname'] for item in items], ['reader1', 'reader0', 'reader1'])
+        self.assertEqual(items[0]['title'], 'test')
+        self.assertEqual(items[2]['title'], '')
+
+        comments[1].status = Comment.STATUS_DELETE
+        comments[1].save()
+        self.assertEqual([item['id'] for item in latest_comments.get()][0], comments[0].id)
+
+    @override_settings(COMMENT_LATEST_TIMEOUT=30)
+    def test_latest_comments_expire(self):
+        """其他进程写入的评论不会更新当前进程的缓存，过期后从数据库重建"""
+        cache.delete(latest_comments.KEY)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as set_:
+            latest_comments.get()  # 重建
+            self.create_comments(1)  # 写入
+        self.assertEqual([call[0][2] for call in set_.call_args_list if call[0][0] == latest_comments.KEY], [30, 30])
+
+    def test_migration_fill_target_key(self):
+        """迁移按id分批回填target_key"""
+        from django.apps import apps
+        migration = import_module('comment.migrations.0003_comment_target_key')
+        comments = self.create_comments(5, 'http://example.com%s?page=2' % self.url)
+        Comment.objects.update(target='http://example.com%s?page=2' % self.url, target_key='')
+        with mock.patch.object(migration, 'BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            migration.fill_target_key(apps, None)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT')]), 4)  # 3批 + 结束
+        for comment in Comment.objects.filter(id__in=[comment.id for comment in comments]):
+            self.assertEqual((comment.target, comment.target_key), (self.url, make_target_key(self.url)))
+
+    def test_migration_target_post_id(self):
+        """迁移中的副本与comment.models.target_post_id结果一致"""
+        from .models import target_post_id
+        migration = import_module('blog.migrations.0010_post_comment_count')
+        for target in ['/post/12.html', 'http://example.com/post/3.html?a=1#comment', '/links/', '/post/x.html', '']:
+            self.assertEqual(migration.target_post_id(target), target_post_id(target))
@@ -18,7 +18,7 @@ class CommentView(TemplateView):
             instance.target = target
             instance.save()
             succeed = True
-            return redirect(target)
+            return redirect(instance.target)  # 保存时已规范为本站路径
         else:
             succeed = False
 
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from mysite.profiling import request_stats, summarize
+
+COLUMNS = ('count', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+           'sampled', 'queries', 'query_ms', 'cache_hits', 'cache_misses', 'template_ms')
+
+
+class Command(BaseCommand):
+    help = '输出各URL名称的请求耗时分位数，以及抽样请求的平均查询次数/耗时、缓存命中、模板渲染耗时（所有进程合并）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', default='p95_ms', choices=COLUMNS, help='排序字段（倒序）')
+        parser.add_argument('--limit', type=int, default=30)
+        parser.add_argument('--json', action='store_true', help='输出JSON')
+        parser.add_argument('--reset', action='store_true', help='输出后清空统计')
+
+    def handle(self, *args, **options):
+        stats = summarize(request_stats.load())
+        rows = sorted(stats.items(), key=lambda item: -item[1][options['sort']])[:options['limit']]
+        if options['json']:
+            self.stdout.write(json.dumps(dict(rows), indent=2, ensure_ascii=False))
+        else:
+            width = max([len(name) for name, _ in rows] + [8])
+            self.stdout.write('%-*s %s' % (width, 'url_name', ' '.join('%12s' % column for column in COLUMNS)))
+            for name, item in rows:
+                self.stdout.write('%-*s %s' % (width, name, ' '.join('%12s' % item[column] for column in COLUMNS)))
+        if options['reset']:
+            request_stats.reset()
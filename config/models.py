@@ -1,8 +1,13 @@
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
 from django.template.loader import render_to_string
 from django.utils.safestring import mark_safe
 
+from mysite.cache import FragmentCache
+
+sidebar_cache = FragmentCache('sidebar', timeout=getattr(settings, 'SIDEBAR_CACHE_TIMEOUT', 5 * 60))
+
 
 # Create your models here.
 class Link(models.Model):
@@ -64,11 +69,27 @@ class SideBar(models.Model):
     def get_all(cls):
         return cls.objects.filter(status=cls.STATUS_SHOW)
 
+    @property
+    def cache_key(self):
+        return sidebar_cache.make_key(self.id, self.display_type)
+
     @property
     def content_html(self):
+        """渲染结果按侧边栏id和展示类型缓存，由config.signals在相关数据变化时清除"""
+        if self.display_type == self.DISPLAY_HTML:
+            return mark_safe(self.content)
+        return mark_safe(sidebar_cache.get_or_set(self.cache_key, self.render_content))
+
+    @classmethod
+    def invalidate(cls, *display_types):
+        """清除指定展示类型的侧边栏缓存"""
+        sidebars = cls.objects.filter(display_type__in=display_types).values_list('id', 'display_type')
+        sidebar_cache.delete_many(sidebar_cache.make_key(*sidebar) for sidebar in sidebars)
+
+    def render_content(self):
         """直接渲染模板"""
         from blog.models import Post
-        from comment.models import Comment
+        from comment.latest import latest_comments
 
         result = ''
         if self.display_type == self.DISPLAY_HTML:
@@ -85,7 +106,7 @@ class SideBar(models.Model):
             result = render_to_string('config/blocks/sidebar_posts.html', context)
         elif self.display_type == self.DISPLAY_COMMENT:
             context = {
-                'comments': Comment.objects.filter(status=Comment.STATUS_NORMAL)[:5]  # .select_related('target')
+                'comments': latest_comments.get()  # 最近评论的环形缓冲，不查询评论表
             }
             result = render_to_string('config/blocks/sidebar_comments.html', context)
         elif self.display_type == self.DISPLAY_LINK:
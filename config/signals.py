@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from blog.models import Post
+from comment.latest import latest_comments
+from comment.models import Comment
+from .models import Link, SideBar, sidebar_cache
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_sidebars(sender, **kwargs):
+    SideBar.invalidate(SideBar.DISPLAY_LATEST, SideBar.DISPLAY_HOT)
+
+
+@receiver(post_save, sender=Comment)
+def update_latest_comments(sender, instance, created, **kwargs):
+    if created and instance.status == Comment.STATUS_NORMAL:
+        latest_comments.push(instance)
+    else:
+        latest_comments.invalidate()
+
+
+@receiver(post_delete, sender=Comment)
+def remove_latest_comment(sender, **kwargs):
+    latest_comments.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_comment_sidebars(sender, **kwargs):
+    SideBar.invalidate(SideBar.DISPLAY_COMMENT)
+
+
+@receiver([post_save, post_delete], sender=Link)
+def invalidate_link_sidebars(sender, **kwargs):
+    SideBar.invalidate(SideBar.DISPLAY_LINK)
+
+
+@receiver([post_save, post_delete], sender=SideBar)
+def invalidate_sidebar(sender, instance, **kwargs):
+    """展示类型可能被修改，所以旧类型的缓存也要清除"""
+    keys = [sidebar_cache.make_key(instance.id, display_type) for display_type, _ in SideBar.SIDE_TYPE]
+    sidebar_cache.delete_many(keys)
@@ -1,4 +1,154 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.template import engines
+from django.template.loader import get_template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from blog.models import Category, Post
+from comment.models import Comment
+from mysite.profiling import ProfilingTemplate, new_stats, percentile, request_stats
+from .models import Link, SideBar, sidebar_cache
 
 
 # Create your tests here.
+class SideBarCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        sidebar_cache.reset_stats()
+        self.user = User.objects.create_superuser('admin', 'admin@mail.com', 'password')
+        self.category = Category.objects.create(name='Python', owner=self.user)
+        self.latest = SideBar.objects.create(title='最新文章', display_type=SideBar.DISPLAY_LATEST, owner=self.user)
+        self.comments = SideBar.objects.create(title='最近评论', display_type=SideBar.DISPLAY_COMMENT, owner=self.user)
+        self.links = SideBar.objects.create(title='友情链接', display_type=SideBar.DISPLAY_LINK, owner=self.user)
+
+    def create_post(self, title):
+        return Post.objects.create(title=title, content=title, category=self.category, owner=self.user)
+
+    def test_content_html_cached(self):
+        self.create_post('first post')
+        self.assertIn('first post', self.latest.content_html)
+        with self.assertNumQueries(0):
+            self.assertIn('first post', self.latest.content_html)
+        self.assertEqual((sidebar_cache.hits, sidebar_cache.misses), (1, 1))
+
+    def test_invalidated_by_related_model(self):
+        self.links.content_html
+        self.comments.content_html
+        self.create_post('second post')
+        self.assertIn('second post', self.latest.content_html)
+
+        Link.objects.create(title='django', href='https://www.djangoproject.com/', owner=self.user)
+        self.assertIn('django', self.links.content_html)
+        Comment.objects.create(target='/post/1.html', nickname='reader', website='https://a.com', email='a@a.com', content='nice post')
+        self.assertIn('nice post', self.comments.content_html)
+        self.assertEqual(sidebar_cache.misses, 5)
+
+    def test_invalidated_by_sidebar_change(self):
+        self.links.content_html
+        self.links.display_type = SideBar.DISPLAY_HTML
+        self.links.content = '<b>html</b>'
+        self.links.save()
+        self.assertEqual(self.links.content_html, '<b>html</b>')
+        self.assertIsNone(cache.get(sidebar_cache.make_key(self.links.id, SideBar.DISPLAY_LINK)))
+
+    def test_cache_stats(self):
+        self.latest.content_html
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.json()['sidebar']['misses'], 1)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_FLUSH_INTERVAL=3600)
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.stats_dir = tempfile.mkdtemp()
+        self.stats_settings = override_settings(PROFILING_STATS_DIR=self.stats_dir)
+        self.stats_settings.enable()
+        request_stats.reset()
+        self.user = User.objects.create_superuser('admin', 'admin@mail.com', 'password')
+        category = Category.objects.create(name='Python', owner=self.user)
+        Post.objects.create(title='post', content='post', category=category, owner=self.user)
+
+    def tearDown(self):
+        request_stats.reset()
+        self.stats_settings.disable()
+        shutil.rmtree(self.stats_dir)
+
+    def stats(self, name):
+        return request_stats.load()[name]
+
+    def test_sampled_requests(self):
+        for _ in range(3):
+            self.client.get(reverse('index'))
+        stats = self.stats('index')
+        self.assertEqual((stats['count'], stats['sampled'], stats['errors']), (3, 3, 0))
+        self.assertGreater(stats['queries'], 0)
+        self.assertGreater(stats['query_time'], 0)
+        self.assertGreater(stats['template_time'], 0)
+        self.assertGreaterEqual(stats['cache_hits'], 2)  # 后两次命中整页缓存
+        self.assertEqual(sum(stats['buckets']), 3)
+
+        with override_settings(PROFILING_SAMPLE_RATE=0):
+            self.client.get(reverse('student:index'))
+        stats = self.stats('student:index')
+        self.assertEqual((stats['count'], stats['sampled'], stats['queries']), (1, 0, 0))
+
+    def test_errors(self):
+        with mock.patch('student.views.IndexView.get', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.client.get(reverse('student:index'))
+        self.assertEqual(self.stats('student:index')['errors'], 1)
+        self.client.get('/not-found/')
+        self.assertEqual(self.stats('<unresolved>')['errors'], 0)
+
+    def test_percentile(self):
+        stats = new_stats()
+        stats.update(count=100, max=80.0, buckets=[0, 0, 0, 50, 0, 50] + [0] * 8)  # 5-10ms、20-50ms各50个
+        self.assertEqual(percentile(stats, 50), 10)
+        self.assertEqual(percentile(stats, 95), 47)
+        self.assertEqual(percentile(stats, 100), 50)
+
+    def test_endpoint_and_command(self):
+        self.client.get(reverse('index'))
+        self.assertEqual(self.client.get(reverse('profile-stats')).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('profile-stats')).json()['index']['count'], 1)
+
+        out = io.StringIO()
+        call_command('request_stats', '--json', '--reset', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['profile-stats']['count'], 2)  # 包括未登录时的302
+        self.assertEqual(request_stats.load(), {})
+
+    def test_other_processes(self):
+        """request_stats命令在单独的进程中运行，读取worker进程写入的快照文件"""
+        self.client.get(reverse('index'))
+        request_stats.flush()
+        with open(request_stats.filename) as f:
+            snapshot = json.load(f)
+        with open(os.path.join(self.stats_dir, '99999-1.json'), 'w') as f:  # 另一个worker进程
+            json.dump(snapshot, f)
+        with open(os.path.join(self.stats_dir, '99998-1.json'), 'w') as f:  # 已退出的进程
+            json.dump(snapshot, f)
+        os.utime(os.path.join(self.stats_dir, '99998-1.json'), (0, 0))
+
+        out = io.StringIO()
+        with mock.patch.object(request_stats, '_stats', {}):  # 命令所在的进程自己没有统计
+            call_command('request_stats', '--json', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['index']['count'], 2)  # 两个worker进程的快照
+        self.assertFalse(os.path.exists(os.path.join(self.stats_dir, '99998-1.json')))
+
+    def test_template_backend(self):
+        """模板后端代替替换Template.render，请求之外渲染模板不受影响"""
+        template = engines['django'].from_string('{{ name }}')
+        self.assertIsInstance(template, ProfilingTemplate)
+        self.assertEqual(template.render({'name': 'mysite'}), 'mysite')
+        self.assertIsInstance(get_template('blog/base.html'), ProfilingTemplate)
@@ -1,8 +1,23 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
-from django.http import HttpResponse
+
+from mysite.cache import fragment_caches
+from mysite.profiling import request_stats, summarize
 
 
 # Create your views here.
 def links(request):
     return HttpResponse('links')
 
+
+@staff_member_required
+def cache_stats(request):
+    """当前进程各个片段缓存的命中/未命中次数"""
+    return JsonResponse({prefix: fragment_cache.stats() for prefix, fragment_cache in fragment_caches.items()})
+
+
+@staff_member_required
+def profile_stats(request):
+    """各URL的请求耗时分位数及抽样请求的平均查询、缓存、模板统计（所有进程合并）"""
+    return JsonResponse(summarize(request_stats.load()))
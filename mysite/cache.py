@@ -0,0 +1,76 @@
+import threading
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from .profiling import record_cache
+
+
+fragment_caches = {}  # {prefix: FragmentCache}，用于查看各个缓存的命中情况
+
+
+class FragmentCache:
+    """
+    渲染结果（HTML片段等）缓存：
+    1、get_or_set按需生成，生成函数只在缓存未命中时调用；
+    2、记录当前进程的命中/未命中次数，方便确认缓存是否生效；
+    3、失效由调用方（一般是post_save/post_delete信号）通过delete/delete_many精确删除。
+    注意：默认的LocMemCache是进程内缓存，信号只能清除当前进程的缓存，多进程部署需要配合memcached/redis，或依赖timeout兜底。
+    """
+
+    def __init__(self, prefix, timeout=DEFAULT_TIMEOUT):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        fragment_caches[prefix] = self
+
+    def make_key(self, *parts):
+        return ':'.join([self.prefix] + [str(part) for part in parts])
+
+    def fetch(self, key):
+        """读取缓存并记录命中情况，未命中时返回None"""
+        value = cache.get(key)
+        self._record(hit=value is not None)
+        return value
+
+    def set(self, key, value):
+        cache.set(key, value, self.timeout)
+
+    def get_or_set(self, key, func):
+        value = self.fetch(key)
+        if value is not None:
+            return value
+
+        value = func()
+        self.set(key, value)
+        return value
+
+    def delete(self, key):
+        cache.delete(key)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        if keys:
+            cache.delete_many(keys)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def _record(self, hit):
+        record_cache(hit)  # 计入当前请求的统计（mysite.profiling）
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
@@ -0,0 +1,93 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.db import DatabaseError, close_old_connections, transaction
+
+
+class BufferedCounter:
+    """
+    写缓冲（write-behind）计数器的基类（blog.counter.VisitCounter、polls.counter.VoteCounter）：
+    1、请求线程只在进程内累加增量，后台线程每隔interval秒在一个事务中把增量写入数据库（write）；
+    2、写入失败的增量放回缓冲区（restore）等待下次写入，进程退出时做最后一次flush；
+    3、gunicorn等preload后fork出的子进程不会继承父进程的线程，丢弃父进程的缓冲（由父进程flush）并重新启动。
+    子类实现interval、reset（创建空的缓冲区）、take（取出增量，没有时返回None）、restore、write。
+    """
+    thread_name = 'counter-flusher'
+    error_message = '计数增量写入失败，等待下次重试'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self.reset()
+
+    @property
+    def logger(self):
+        return logging.getLogger(type(self).__module__)
+
+    @property
+    def interval(self):
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def take(self):
+        raise NotImplementedError
+
+    def restore(self, pending):
+        raise NotImplementedError
+
+    def write(self, pending):
+        """在事务中写入增量，返回更新的记录数"""
+        raise NotImplementedError
+
+    def flush(self):
+        """把缓冲区的增量写入数据库，返回本次更新的记录数"""
+        pending = self.take()
+        if not pending:
+            return 0
+        try:
+            with transaction.atomic():
+                return self.write(pending)
+        except DatabaseError:
+            self.logger.exception(self.error_message)
+            self.restore(pending)
+            return 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+            if self._pid is None:
+                atexit.register(self.stop)
+            self._pid = os.getpid()
+
+    def stop(self):
+        """停止后台线程，并把剩余增量写入数据库"""
+        self._stopped.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.interval or None)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            close_old_connections()
+            self.flush()
+        close_old_connections()
+
+    def _check_fork(self):
+        if self._pid is not None and self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._thread = None
+            self._pid = None
+            self.reset()
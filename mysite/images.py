@@ -0,0 +1,141 @@
+"""
+上传图片的多尺寸副本：按IMAGE_DERIVATIVE_WIDTHS中小于原图宽度的尺寸生成缩小的副本（原格式一份，支持时再生成一份WebP），
+保存在MEDIA_ROOT/IMAGE_DERIVATIVE_DIR下与原图相同的相对路径中，例如
+    article_images/2019/09/photo.jpg -> derivatives/article_images/2019/09/photo-480w.jpg、photo-480w.webp
+"""
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.utils.encoding import filepath_to_uri
+
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+
+def get_widths():
+    return tuple(sorted(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (480, 960, 1440))))
+
+
+def webp_enabled():
+    return getattr(settings, 'IMAGE_DERIVATIVE_WEBP', True) and features.check('webp')
+
+
+def derivative_name(name, width, extension):
+    """原图相对MEDIA_ROOT的路径 -> 副本相对MEDIA_ROOT的路径"""
+    root, _ = os.path.splitext(name)
+    return os.path.join(getattr(settings, 'IMAGE_DERIVATIVE_DIR', 'derivatives'), '%s-%dw%s' % (root, width, extension))
+
+
+def derivative_formats(image_format):
+    formats = [image_format]
+    if image_format != 'WEBP' and webp_enabled():
+        formats.append('WEBP')
+    return formats
+
+
+def save_derivative(image, path, image_format):
+    """写入临时文件后原子替换，并发生成同一副本时不会读到写了一半的文件"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as temp:
+            image.save(temp, format=image_format, quality=getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80))
+        os.chmod(temp_path, 0o644)  # mkstemp创建的文件权限为0600
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def generate_derivatives(root, name, force=False):
+    """
+    生成一张图片的全部副本，返回新生成的副本数；
+    副本已存在且不早于原图（原图被重新加水印后会更新）时跳过，重复执行是幂等的
+    """
+    source = os.path.join(root, name)
+    source_mtime = os.path.getmtime(source)
+    num = 0
+    with Image.open(source) as image:
+        if getattr(image, 'is_animated', False) or image.format not in EXTENSIONS:
+            return 0
+        image_format = image.format
+        width, height = image.size
+        todo = []
+        for target_width in get_widths():
+            if target_width >= width:
+                break
+            for derivative_format in derivative_formats(image_format):
+                path = os.path.join(root, derivative_name(name, target_width, EXTENSIONS[derivative_format]))
+                if force or not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+                    todo.append((target_width, derivative_format, path))
+        if not todo:
+            return 0
+
+        max_width = todo[-1][0]
+        image.draft(None, (max_width, max(round(height * max_width / width), 1)))  # JPEG解码时直接缩小，减少内存和耗时
+        if image.mode in ('P', '1'):
+            image = image.convert('RGBA')
+        else:
+            image.load()
+        # 从大到小依次缩小，每次在上一个结果上继续缩小
+        for target_width, derivative_format, path in sorted(todo, key=lambda item: -item[0]):
+            if image.size[0] != target_width:
+                target_height = max(round(height * target_width / width), 1)
+                image = image.resize((target_width, target_height), Image.LANCZOS)
+            save_derivative(image, path, derivative_format)
+            num += 1
+    return num
+
+
+def generate_derivatives_safely(root, name, force=False):
+    try:
+        return generate_derivatives(root, name, force)
+    except Exception as e:
+        logger.error('图片 %s 的副本生成失败：%s', name, e)
+        return 0
+
+
+def find_derivatives(root, name):
+    """
+    返回(原图格式, 原图宽度, {格式: [(宽度, 副本url), ...]})，只包含已经生成的副本；
+    原图不存在或无法识别时返回(None, None, {})
+    """
+    try:
+        with Image.open(os.path.join(root, name)) as image:
+            image_format, width = image.format, image.size[0]
+    except (OSError, ValueError):
+        return None, None, {}
+    if image_format not in EXTENSIONS:
+        return image_format, width, {}
+
+    result = {}
+    for derivative_format in derivative_formats(image_format):
+        for target_width in get_widths():
+            if target_width >= width:
+                break
+            derivative = derivative_name(name, target_width, EXTENSIONS[derivative_format])
+            if os.path.exists(os.path.join(root, derivative)):
+                result.setdefault(derivative_format, []).append(
+                    (target_width, settings.MEDIA_URL + filepath_to_uri(derivative))
+                )
+    return image_format, width, result
+
+
+def iter_images(root, directory):
+    """遍历目录下的原图（相对root的路径），跳过副本目录"""
+    derivative_dir = os.path.join(root, getattr(settings, 'IMAGE_DERIVATIVE_DIR', 'derivatives'))
+    for dirpath, dirnames, filenames in os.walk(os.path.join(root, directory)):
+        if os.path.abspath(dirpath).startswith(os.path.abspath(derivative_dir)):
+            dirnames[:] = []
+            continue
+        for filename in filenames:
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(dirpath, filename), root)
@@ -0,0 +1,290 @@
+"""
+请求耗时统计（代替student.middlewares.TimeItMiddleware）：
+1、每个请求按URL名称（如student:index、post-detail）记录耗时直方图，可以估算P50/P95/P99；
+2、按PROFILING_SAMPLE_RATE抽样的请求额外记录数据库查询次数和耗时（connection.execute_wrapper）、
+   片段缓存命中/未命中次数（mysite.cache.FragmentCache）以及模板渲染耗时（ProfilingTemplates模板后端），
+   未抽中的请求只多一次计时；
+3、统计保存在进程内，每隔PROFILING_FLUSH_INTERVAL秒把本进程的快照写入PROFILING_STATS_DIR下的文件，
+   config.views.profile_stats和request_stats命令（单独的进程）读取所有进程的文件合并后输出。
+流式响应（sitemap分片、SSE）只统计到视图返回响应为止。
+"""
+import bisect
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+# 耗时直方图的桶上界（毫秒），最后一个桶为无穷大
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+_local = threading.local()
+
+
+class RequestProfile:
+    """一个抽样请求的数据库、缓存、模板统计"""
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - start
+
+
+def current_profile():
+    return getattr(_local, 'profile', None)
+
+
+def record_cache(hit):
+    """由FragmentCache在读取缓存时调用"""
+    profile = current_profile()
+    if profile is not None:
+        if hit:
+            profile.cache_hits += 1
+        else:
+            profile.cache_misses += 1
+
+
+def new_stats():
+    return {
+        'count': 0, 'errors': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(BUCKETS) + 1),
+        'sampled': 0, 'queries': 0, 'query_time': 0.0, 'cache_hits': 0, 'cache_misses': 0, 'template_time': 0.0,
+    }
+
+
+def merge_stats(target, source):
+    for key, value in source.items():
+        if key == 'buckets':
+            target[key] = [a + b for a, b in zip(target[key], value)]
+        elif key == 'max':
+            target[key] = max(target[key], value)
+        else:
+            target[key] += value
+    return target
+
+
+def percentile(stats, q):
+    """按直方图估算分位数（桶内线性插值），单位毫秒"""
+    total = stats['count']
+    if not total:
+        return 0.0
+    rank = q / 100.0 * total
+    seen = 0
+    for index, num in enumerate(stats['buckets']):
+        if num and seen + num >= rank:
+            lower = BUCKETS[index - 1] if index else 0
+            upper = BUCKETS[index] if index < len(BUCKETS) else max(stats['max'], lower)
+            return min(lower + (upper - lower) * (rank - seen) / num, stats['max'])
+        seen += num
+    return stats['max']
+
+
+def summarize(stats):
+    """{URL名称: 原始统计} -> {URL名称: 次数、平均值、分位数及抽样请求的平均查询数等}"""
+    result = {}
+    for name, item in stats.items():
+        sampled = item['sampled'] or 1
+        result[name] = {
+            'count': item['count'],
+            'errors': item['errors'],
+            'mean_ms': round(item['sum'] / item['count'], 2) if item['count'] else 0.0,
+            'p50_ms': round(percentile(item, 50), 2),
+            'p95_ms': round(percentile(item, 95), 2),
+            'p99_ms': round(percentile(item, 99), 2),
+            'max_ms': round(item['max'], 2),
+            'sampled': item['sampled'],
+            'queries': round(item['queries'] / sampled, 2),
+            'query_ms': round(item['query_time'] * 1000 / sampled, 2),
+            'cache_hits': round(item['cache_hits'] / sampled, 2),
+            'cache_misses': round(item['cache_misses'] / sampled, 2),
+            'template_ms': round(item['template_time'] * 1000 / sampled, 2),
+        }
+    return result
+
+
+class RequestStats:
+    """
+    进程内的统计，以及与PROFILING_STATS_DIR下快照文件的同步：
+    每个进程一个文件（进程id加启动时间，进程id被复用时不会覆盖已退出进程的快照），先写临时文件再os.replace，
+    读取时不会读到写了一半的内容；超过PROFILING_STATS_TIMEOUT秒没有更新的文件（已退出的进程）不再合并并被删除
+    """
+    SUFFIX = '.json'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # 全部统计，用于本进程的快照
+        self._last_flush = time.monotonic()
+        self._pid = None
+        self._name = None
+
+    @property
+    def directory(self):
+        return getattr(settings, 'PROFILING_STATS_DIR', os.path.join(tempfile.gettempdir(), 'mysite-profiling'))
+
+    @property
+    def filename(self):
+        if self._pid != os.getpid():  # fork出的子进程使用自己的文件
+            self._pid = os.getpid()
+            self._name = '%d-%d%s' % (self._pid, time.time() * 1000, self.SUFFIX)
+        return os.path.join(self.directory, self._name)
+
+    def record(self, name, elapsed, error=False, profile=None):
+        ms = elapsed * 1000
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = new_stats()
+            stats['count'] += 1
+            stats['errors'] += int(error)
+            stats['sum'] += ms
+            stats['max'] = max(stats['max'], ms)
+            stats['buckets'][bisect.bisect_left(BUCKETS, ms)] += 1
+            if profile is not None:
+                stats['sampled'] += 1
+                stats['queries'] += profile.queries
+                stats['query_time'] += profile.query_time
+                stats['cache_hits'] += profile.cache_hits
+                stats['cache_misses'] += profile.cache_misses
+                stats['template_time'] += profile.template_time
+            flush = time.monotonic() - self._last_flush >= getattr(settings, 'PROFILING_FLUSH_INTERVAL', 30)
+        if flush:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {name: merge_stats(new_stats(), stats) for name, stats in self._stats.items()}
+
+    def flush(self):
+        """把本进程的统计写入快照文件（按进程保存，进程之间不会互相覆盖）"""
+        self._last_flush = time.monotonic()
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        filename = self.filename
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        temp = '%s.%d.tmp' % (filename, threading.get_ident())
+        with open(temp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temp, filename)
+
+    def files(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if name.endswith(self.SUFFIX)]
+
+    def load(self):
+        """合并所有进程的快照"""
+        self.flush()
+        expired = time.time() - getattr(settings, 'PROFILING_STATS_TIMEOUT', 24 * 60 * 60)
+        result = {}
+        for filename in self.files():
+            try:
+                if os.path.getmtime(filename) < expired:
+                    os.remove(filename)
+                    continue
+                with open(filename) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):  # 其他进程刚好删除了文件
+                continue
+            for name, stats in snapshot.items():
+                merge_stats(result.setdefault(name, new_stats()), stats)
+        return result
+
+    def reset(self):
+        """清空本进程的统计和所有进程的快照文件（其他进程的统计在下次写入时恢复）"""
+        with self._lock:
+            self._stats = {}
+        for filename in self.files():
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+
+request_stats = RequestStats()
+
+
+class ProfilingTemplate(Template):
+    """统计最外层模板的渲染耗时（include、extends以及渲染期间render_to_string的模板包含在内，不重复计算）"""
+
+    def render(self, context=None, request=None):
+        profile = current_profile()
+        if profile is None:
+            return super().render(context, request)
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_time += time.perf_counter() - start
+
+
+class ProfilingTemplates(DjangoTemplates):
+    """
+    模板后端（TEMPLATES的BACKEND），render、TemplateResponse、render_to_string等通过它得到的模板
+    在抽样请求中记录渲染耗时，代替替换django.template.base.Template.render（会影响整个进程的所有模板）
+    """
+
+    def from_string(self, template_code):
+        return ProfilingTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return ProfilingTemplate(super().get_template(template_name).template, self)
+
+
+def url_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match._func_path
+
+
+class ProfilingMiddleware:
+    """
+    放在MIDDLEWARE的第一个，统计包括其他中间件在内的整个请求耗时；
+    视图由Django调用，异常由后续的process_exception和Django的异常处理正常处理
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'PROFILING_ENABLED', True):
+            return self.get_response(request)
+
+        profile = None
+        if random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 0.1):
+            profile = _local.profile = RequestProfile()
+        start = time.perf_counter()
+        error = True
+        try:
+            with ExitStack() as stack:
+                if profile is not None:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+            error = response.status_code >= 500
+            return response
+        finally:
+            _local.profile = None
+            request_stats.record(url_name(request), time.perf_counter() - start, error, profile)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mysite.profiling.ProfilingMiddleware',  # 请求耗时统计，放在第一个
     'blog.middleware.user_id.UserIDMiddleware',  # 用户标识
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,7 +67,8 @@ THEME = 'bootstrap'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'mysite.profiling.ProfilingTemplates',  # DjangoTemplates，请求耗时统计时记录模板渲染耗时
+        'NAME': 'django',
         'DIRS': [os.path.join(BASE_DIR, 'mysite', 'themes', THEME, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -140,4 +143,120 @@ CKEDITOR_CONFIGS = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 CKEDITOR_UPLOAD_PATH = 'article_images'
-DEFAULT_FILE_STORAGE = 'mysite.storage.WatermarkStorage'
+DEFAULT_FILE_STORAGE = 'mysite.storage.DedupStorage'
+# DedupStorage按内容哈希保存上传文件的目录（MEDIA_ROOT下）
+DEDUP_STORAGE_DIR = 'blobs'
+
+# PV/UV写缓冲的刷新间隔（秒），为0时每次访问同步写库
+VISIT_FLUSH_INTERVAL = 10
+
+# UV使用HyperLogLog估计：标准误差（0.02时每篇文章每天约4KB，调整后新旧sketch按较低的精度合并），
+# 以及数据库中每天的sketch保留天数（用于合并周、月UV）
+UV_ERROR_RATE = 0.02
+UV_SKETCH_DAYS = 31
+
+# 侧边栏渲染结果的缓存时间（秒），数据变化时由信号主动清除
+SIDEBAR_CACHE_TIMEOUT = 5 * 60
+
+# 导航快照版本号的过期时间（秒），分类变化时由信号更新；多进程使用进程内缓存时，其他进程最多这么久后看到变化
+NAVS_VERSION_TIMEOUT = 5 * 60
+
+# Markdown渲染：结果缓存时间（秒）；正文超过该长度时保存后在后台线程渲染，0表示总是同步渲染
+MARKDOWN_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+MARKDOWN_ASYNC_THRESHOLD = 100 * 1024
+MARKDOWN_RENDER_WORKERS = 2
+
+# 匿名用户整页缓存时间（秒），0表示关闭；数据变化时由blog.signals主动清除
+PAGE_CACHE_TIMEOUT = 10 * 60
+# 整页缓存全局、路径版本号的过期时间（秒），不应小于PAGE_CACHE_TIMEOUT，否则页面缓存还没过期就不会再被读取
+PAGE_CACHE_VERSION_TIMEOUT = 10 * 60
+
+# 文章列表分页方式：keyset（游标分页）或offset（偏移分页），以及游标分页展示总页数时使用的文章总数缓存时间（秒）
+POST_LIST_PAGINATION = 'keyset'
+POST_COUNT_CACHE_TIMEOUT = 5 * 60
+
+# 文章爬取：数据源（名称: 适配器及参数，适配器见blog/sources.py）、单次请求超时（秒）、失败重试次数，
+# CRAWL_ASYNC为False时在请求中同步执行爬取任务
+CRAWL_SOURCES = {
+    'gank': {'adapter': 'gank', 'url': 'http://gank.io/api/today'},
+}
+CRAWL_TIMEOUT = 10
+CRAWL_RETRIES = 2
+CRAWL_ASYNC = True
+
+# 上传图片的文字水印：文字、颜色、字体文件（None为Pillow默认字体），
+# WATERMARK_ASYNC为True时在进程池中处理（WATERMARK_WORKERS个进程），上传请求不等待水印完成
+WATERMARK_TEXT = 'zhangchuzhao.site'
+WATERMARK_COLOR = 'red'
+WATERMARK_FONT = None
+WATERMARK_ASYNC = True
+WATERMARK_WORKERS = 2
+
+# 上传图片的多尺寸副本：宽度、是否同时生成WebP、编码质量、保存目录（MEDIA_ROOT下），
+# 以及正文图片srcset的sizes属性（正文栏最宽约730px）
+IMAGE_DERIVATIVE_WIDTHS = (480, 960, 1440)
+IMAGE_DERIVATIVE_WEBP = True
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_DERIVATIVE_DIR = 'derivatives'
+IMAGE_SRCSET_SIZES = '(max-width: 768px) 100vw, 730px'
+# 正文图片改写为srcset的结果缓存时间（秒），之后才生成的副本最多这么久后出现在页面中
+IMAGE_SRCSET_CACHE_TIMEOUT = 60 * 60
+
+# sitemap每个分片的文章数（缓存整片内容，memcached默认单个值不超过1MB），以及分片缓存时间（秒）
+SITEMAP_SHARD_SIZE = 2000
+SITEMAP_CACHE_TIMEOUT = 60 * 60
+
+# 文章整体版本号（RSS、sitemap的ETag/Last-Modified）的过期时间（秒），过期后按数据库重新生成，
+# 多进程使用进程内缓存时，其他进程最多这么久后看到变化
+POST_STATE_TIMEOUT = 5 * 60
+
+# RSS响应内容缓存时间（秒），缓存key带文章整体版本号，文章变化后自动失效
+FEED_CACHE_TIMEOUT = 60 * 60
+
+# RSS默认条目数，以及?count=N可以指定的最大条目数
+RSS_ITEM_COUNT = 5
+RSS_MAX_ITEM_COUNT = 50
+
+# 评论模块每页评论数，以及侧边栏最近评论（缓存中的环形缓冲）的条数和缓存时间（秒），
+# 多进程使用进程内缓存时，其他进程最多这么久后看到新评论
+COMMENT_PAGE_SIZE = 20
+COMMENT_LATEST_SIZE = 5
+COMMENT_LATEST_TIMEOUT = 60
+
+# 投票写缓冲的刷新间隔（秒），0表示每票直接UPDATE votes=votes+1；缓冲时进程内的分片数
+POLL_VOTE_FLUSH_INTERVAL = 0
+POLL_VOTE_SHARDS = 8
+
+# 投票结果快照的缓存时间（秒），以及结果页SSE推送读取快照的间隔、保活间隔、单个连接的最长时间（秒）
+# 和每个进程同时保持的连接数；SSE连接一直占用worker，需要gevent等异步worker，
+# 多进程部署时快照要放在共享缓存（memcached、redis）中，其他进程的投票才能推送
+POLL_RESULTS_CACHE_TIMEOUT = 5 * 60
+POLL_SSE_MIN_INTERVAL = 1
+POLL_SSE_KEEPALIVE = 15
+POLL_SSE_MAX_DURATION = 30
+POLL_SSE_MAX_STREAMS = 4
+
+# 投票防刷（polls.guard）：是否开启；每个IP的令牌桶（每秒补充的令牌数、最多令牌数、进程内最多记录的IP数），
+# 部署在反向代理之后时设置可信代理的层数，从X-Forwarded-For取客户端IP；
+# 每个问题已投票uid的Bloom过滤器（投票人数容量、误判率、与数据库同步的间隔秒数、进程内最多保留的问题数）
+POLL_VOTE_GUARD = True
+POLL_VOTE_RATE = 1.0
+POLL_VOTE_BURST = 5
+POLL_RATE_LIMIT_CLIENTS = 10000
+POLL_TRUSTED_PROXIES = 0
+POLL_DEDUP_CAPACITY = 100000
+POLL_DEDUP_ERROR_RATE = 0.001
+POLL_DEDUP_SYNC_INTERVAL = 10
+POLL_DEDUP_MAX_QUESTIONS = 50
+
+# 学员列表每页人数
+STUDENT_PAGE_SIZE = 50
+
+# 请求耗时统计（mysite.profiling）：是否开启、记录数据库/缓存/模板明细的抽样比例，
+# 以及进程内统计写入快照文件的间隔和保留时间（秒）、快照文件目录（同一台机器上的所有进程和request_stats命令共用，
+# 默认在临时目录中，不写入源码目录）
+PROFILING_ENABLED = True
+PROFILING_SAMPLE_RATE = 0.1
+PROFILING_FLUSH_INTERVAL = 30
+PROFILING_STATS_TIMEOUT = 24 * 60 * 60
+PROFILING_STATS_DIR = os.path.join(tempfile.gettempdir(), 'mysite-profiling')
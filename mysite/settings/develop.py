@@ -14,3 +14,6 @@ DATABASES = {
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
+
+# 开发环境PV/UV同步写库，方便调试
+VISIT_FLUSH_INTERVAL = 0
@@ -1,36 +1,204 @@
-from io import BytesIO
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
+import django
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
 from django.core.files.storage import FileSystemStorage
-from django.core.files.uploadedfile import InMemoryUploadedFile
 
 from PIL import Image, ImageDraw, ImageFont
 
+from .images import generate_derivatives
+
+logger = logging.getLogger(__name__)
+
+# 可以直接绘制的图片模式，其他模式（如调色板P）先转换为RGBA
+DRAWABLE_MODES = ('RGB', 'RGBA', 'L', 'LA', 'CMYK')
+
+_executor = None
+
+
+@lru_cache(maxsize=64)
+def load_font(fontfamily=None, size=None):
+    """字体文件加载较慢，同一进程内按(字体, 字号)复用"""
+    if fontfamily:
+        return ImageFont.truetype(fontfamily, size)
+    return ImageFont.load_default()
+
+
+def text_size(draw, text, font):
+    if hasattr(draw, 'textbbox'):  # Pillow 8.0+，10.0起移除了textsize
+        left, top, right, bottom = draw.textbbox((0, 0), text, font)
+        return right - left, bottom - top
+    return draw.textsize(text, font)
 
-class WatermarkStorage(FileSystemStorage):
-    def save(self, name, content, max_length=None):
-        if 'image' in content.content_type:
-            image = self.watermark_with_text(content, 'zhangchuzhao.site', 'red')
-            content = self.convert_image_to_file(image, name)
 
-        return super().save(name, content, max_length=max_length)
+def save_options(image):
+    """按原图格式保存：JPEG沿用原图的量化表和色度抽样（质量不变），同时保留EXIF和ICC信息"""
+    options = {key: image.info[key] for key in ('exif', 'icc_profile', 'dpi') if image.info.get(key)}
+    if image.format == 'JPEG':
+        options.update(quality='keep', subsampling='keep')
+    elif image.format == 'WEBP':
+        options.update(quality=90)
+    return options
+
+
+def watermark_file(path, text, color, fontfamily=None):
+    """
+    在图片文件上添加文字水印，按原格式写入同目录的临时文件后原子替换：
+    图片直接从文件读取、写回文件，内存中只保留一份解码后的图片；动图不处理
+    """
+    with Image.open(path) as image:
+        if getattr(image, 'is_animated', False):
+            return False
+        image_format = image.format
+        options = save_options(image)
+        if image.mode not in DRAWABLE_MODES:
+            image = image.convert('RGBA')
+            options.pop('quality', None)
+            options.pop('subsampling', None)
+        else:
+            image.load()
 
-    def watermark_with_text(self, file_obj, text, color, fontfamily=None):
-        image = Image.open(file_obj).convert('RGBA')
         draw = ImageDraw.Draw(image)
         width, height = image.size
-        margin = 10
-        if fontfamily:
-            font = ImageFont.truetype(fontfamily, int(height / 20))
-        else:
-            font = None
-        textWidth, textHeight = draw.textsize(text, font)
-        x = (width - textWidth) / 2
-        y = (height - textHeight) / 2
-        draw.text((x, y), text, color, font)
-        return image
-
-    def convert_image_to_file(self, image, name):
-        temp = BytesIO()
-        image.save(temp, format='PNG')
-        file_size = temp.tell()
-        return InMemoryUploadedFile(temp, None, name, 'image/png', file_size, None)
\ No newline at end of file
+        font = load_font(fontfamily, int(height / 20) if fontfamily else None)
+        text_width, text_height = text_size(draw, text, font)
+        draw.text(((width - text_width) / 2, (height - text_height) / 2), text, color, font)
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                image.save(temp, format=image_format, **options)
+            shutil.copymode(path, temp_path)  # mkstemp创建的文件权限为0600
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+    return True
+
+
+def process_image(root, name, text, color, fontfamily=None):
+    """添加水印，再按水印后的图片生成多尺寸副本"""
+    watermark_file(os.path.join(root, name), text, color, fontfamily)
+    generate_derivatives(root, name)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # 子进程以spawn/forkserver方式启动时需要重新初始化Django才能读取settings
+        _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'WATERMARK_WORKERS', 2), initializer=django.setup)
+    return _executor
+
+
+def _log_error(future):
+    error = future.exception()
+    if error is not None:
+        logger.error('图片处理失败：%s', error)
+
+
+class WatermarkStorage(FileSystemStorage):
+    """
+    上传的图片先原样写入磁盘（按块写入，不在内存中复制），再添加水印、生成多尺寸副本（mysite.images）：
+    WATERMARK_ASYNC为True时交给进程池处理，上传请求不需要等待解码、绘制、编码完成，
+    处理完成前短时间内访问到的是没有水印的原图
+    """
+
+    def save(self, name, content, max_length=None):
+        name = super().save(name, content, max_length=max_length)
+        if self.is_image(content):
+            self.process(name)
+        return name
+
+    @staticmethod
+    def is_image(content):
+        return 'image' in (getattr(content, 'content_type', None) or '')
+
+    def process(self, name):
+        args = (self.location, name, getattr(settings, 'WATERMARK_TEXT', 'zhangchuzhao.site'),
+                getattr(settings, 'WATERMARK_COLOR', 'red'), getattr(settings, 'WATERMARK_FONT', None))
+        if getattr(settings, 'WATERMARK_ASYNC', True):
+            get_executor().submit(process_image, *args).add_done_callback(_log_error)
+            return
+        try:
+            process_image(*args)
+        except Exception as e:
+            logger.error('图片处理失败：%s', e)
+
+
+class DedupStorage(WatermarkStorage):
+    """
+    按内容寻址的存储：文件名为上传内容的SHA-256，保存在BLOB_DIR/ab/<sha256><扩展名>，
+    同样的内容（如重复上传的截图）只保存一份，再次上传直接返回已有文件名。
+    上传内容按块写入临时文件的同时计算哈希（只读一遍，不在内存中缓存整个文件），
+    再用os.link原子地创建最终文件，并发上传同一内容时只有一个请求会写入并添加水印。
+    不再被文章引用的文件由gc_media命令清理。
+    """
+    BLOB_DIR = 'blobs'
+
+    def blob_name(self, name, digest):
+        extension = os.path.splitext(name)[1].lower()
+        return '%s/%s/%s%s' % (getattr(settings, 'DEDUP_STORAGE_DIR', self.BLOB_DIR), digest[:2], digest, extension)
+
+    def spool(self, content):
+        """写入临时文件并计算哈希，返回(哈希, 临时文件路径)"""
+        directory = self.path(getattr(settings, 'DEDUP_STORAGE_DIR', self.BLOB_DIR))
+        os.makedirs(directory, exist_ok=True)
+        sha256 = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    temp.write(chunk)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return sha256.hexdigest(), temp_path
+
+    @staticmethod
+    def link(temp_path, path):
+        """
+        创建最终文件，返回True；内容已存在时更新它的修改时间并返回False，
+        gc_media按修改时间保护最近上传的文件，重新上传的旧文件在被文章引用之前不会被清理
+        """
+        while True:
+            try:
+                os.link(temp_path, path)
+                return True
+            except FileExistsError:
+                try:
+                    os.utime(path)
+                    return False
+                except FileNotFoundError:  # 刚好被gc_media删除，重新创建
+                    continue
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest, temp_path = self.spool(content)
+        try:
+            name = self.blob_name(name, digest)
+            if max_length is not None and len(name) > max_length:
+                raise SuspiciousFileOperation('文件名"%s"超过了%d个字符的长度限制' % (name, max_length))
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not self.link(temp_path, path):
+                return name  # 内容已存在
+        finally:
+            os.remove(temp_path)
+
+        os.chmod(path, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+        if self.is_image(content):
+            self.process(name)
+        return name
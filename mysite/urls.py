@@ -15,29 +15,36 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, re_path, include
-from django.contrib.sitemaps import views as sitemap_views
 from django.conf.urls.static import static
 
-from blog.views import (IndexView, CategoryView, TagView, PostDetailView, SearchView, AuthorView, LinkListView, CrawlingView, crawl)
-from blog.rss import LatestPostFeed
-from blog.sitemap import PostSitemap
+from blog.views import (IndexView, CategoryView, TagView, PostDetailView, SearchView, AuthorView, LinkListView, CrawlingView, crawl,
+                        crawl_status)
+from blog.rss import CategoryFeed, LatestPostFeed, TagFeed
+from blog.sitemap import sitemap_index, sitemap_section
 from comment.views import CommentView
+from config.views import cache_stats, profile_stats
 from .custom_site import custom_site
 from mysite.settings import base
 
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
     re_path(r'^category/(?P<category_id>\d+)/$', CategoryView.as_view(), name='category-list'),
+    re_path(r'^category/(?P<category_id>\d+)/rss/$', CategoryFeed(), name='category-rss'),
     re_path(r'^tag/(?P<tag_id>\d+)/$', TagView.as_view(), name='tag-list'),
+    re_path(r'^tag/(?P<tag_id>\d+)/rss/$', TagFeed(), name='tag-rss'),
     re_path(r'^post/(?P<post_id>\d+).html$', PostDetailView.as_view(), name='post-detail'),
     re_path(r'author/(?P<owner_id>\d+)/$', AuthorView.as_view(), name='author'),
     path('search/', SearchView.as_view(), name='search'),
     path('comment/', CommentView.as_view(), name='comment'),
     path('links/', LinkListView.as_view(), name='links'),
     re_path(r'^rss/|feed/$', LatestPostFeed(), name='rss'),
-    path('sitemap.xml', sitemap_views.sitemap, {'sitemaps': {'posts': PostSitemap}}),
+    path('sitemap.xml', sitemap_index, name='sitemap'),
+    path('sitemap-<int:page>.xml', sitemap_section, name='sitemap-section'),
     path('crawling/', CrawlingView.as_view(), name='crawling'),
     path('crawl/', crawl, name='crawl'),
+    path('crawl/<str:job_id>/', crawl_status, name='crawl-status'),
+    path('cache/stats/', cache_stats, name='cache-stats'),
+    path('profile/stats/', profile_stats, name='profile-stats'),
 
     path('ckeditor/', include('ckeditor_uploader.urls')),
 
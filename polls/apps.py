@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PollsConfig(AppConfig):
     name = 'polls'
+
+    def ready(self):
+        from . import signals  # NOQA 注册投票结果快照失效的信号
@@ -0,0 +1,61 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Bloom过滤器：
+    1、m个bit（bytearray）、k个哈希位置，按容量n和误判率p计算 m = -n*ln(p)/ln(2)^2，k = m/n*ln(2)；
+    2、不会漏判（添加过的元素一定返回True），未添加的元素以约p的概率误判为已添加；
+    3、按位或即可合并，所以多个进程的过滤器可以合并后保存。
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001, bits=None):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError('capacity必须大于0，error_rate必须在(0, 1)之间')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.m = max(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.k = max(round(self.m / capacity * math.log(2)), 1)
+        size = (self.m + 7) // 8
+        if bits is None:
+            self.bits = bytearray(size)
+        else:
+            if len(bits) != size:
+                raise ValueError('位数组长度(%d)与容量、误判率不匹配' % len(bits))
+            self.bits = bytearray(bits)
+
+    def _positions(self, value):
+        """双重哈希：h1 + i*h2 生成k个位置"""
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        digest = hashlib.blake2b(value, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def add(self, value):
+        """添加一个元素，之前不存在（有bit从0变为1）时返回True"""
+        added = False
+        for position in self._positions(value):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                added = True
+        return added
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def merge(self, other):
+        if (other.m, other.k) != (self.m, self.k):
+            raise ValueError('只能合并参数相同的Bloom过滤器')
+        self.bits = bytearray(a | b for a, b in zip(self.bits, other.bits))
+        return self
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data, capacity=100000, error_rate=0.001):
+        return cls(capacity, error_rate, bits=data)
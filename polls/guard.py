@@ -0,0 +1,206 @@
+"""
+投票防刷：
+1、每个客户端（IP）一个令牌桶，超过频率的投票在查询数据库之前直接拒绝（429）；
+2、每个问题一个Bloom过滤器记录已经投过票的uid（UserIDMiddleware的cookie），重复投票不再写库。
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .bloom import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    令牌桶：每个客户端最多POLL_VOTE_BURST个令牌，每秒补充POLL_VOTE_RATE个，每票消耗一个；
+    桶保存在进程内（LRU，最多POLL_RATE_LIMIT_CLIENTS个客户端），多进程部署时每个进程各自限流。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # {client: (令牌数, 上次补充时间)}
+
+    @property
+    def rate(self):
+        return getattr(settings, 'POLL_VOTE_RATE', 1.0)
+
+    @property
+    def burst(self):
+        return getattr(settings, 'POLL_VOTE_BURST', 5)
+
+    def allow(self, client, now=None):
+        """返回(是否允许, 需要等待的秒数)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > getattr(settings, 'POLL_RATE_LIMIT_CLIENTS', 10000):
+                self._buckets.popitem(last=False)
+        wait = 0 if allowed else (1 - tokens) / self.rate if self.rate else None
+        return allowed, wait
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class Voters:
+    """一个问题的过滤器，加载、同步数据库时只锁定这一个问题"""
+    __slots__ = ('lock', 'bloom', 'synced', 'dirty', 'evicted')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None  # 第一次使用时从数据库加载
+        self.synced = 0  # 上次同步时间
+        self.dirty = False  # 是否有未同步的修改
+        self.evicted = False  # 已经被LRU淘汰
+
+
+class VoterFilter:
+    """
+    每个问题已投票uid的Bloom过滤器：
+    1、判断、记录都在进程内完成，只有同步时才查询数据库；
+    2、每隔POLL_DEDUP_SYNC_INTERVAL秒在事务中锁定数据库中的过滤器（polls.models.QuestionVoters），
+       与进程内的按位或合并后写回（进程第一次使用时从数据库加载，进程退出时再同步一次），
+       多进程共享已投票的记录，重启后也不会丢失；同步间隔内同一uid最多在每个进程各投一票；
+    3、进程内最多保留POLL_DEDUP_MAX_QUESTIONS个问题的过滤器（LRU），淘汰前先同步；
+    4、全局锁只保护LRU，加载、同步数据库时只持有该问题的锁，不同问题的投票不会互相等待；
+    5、误判率POLL_DEDUP_ERROR_RATE（按每个问题POLL_DEDUP_CAPACITY个投票人计算），误判的用户会被当作已经投过票。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filters = OrderedDict()  # {question_id: Voters}
+        self._registered = False
+
+    @property
+    def capacity(self):
+        return getattr(settings, 'POLL_DEDUP_CAPACITY', 100000)
+
+    @property
+    def error_rate(self):
+        return getattr(settings, 'POLL_DEDUP_ERROR_RATE', 0.001)
+
+    def _from_bytes(self, data):
+        if data is not None:
+            try:
+                return BloomFilter.from_bytes(data, self.capacity, self.error_rate)
+            except ValueError:  # 容量、误判率配置修改过，重新开始记录
+                pass
+        return BloomFilter(self.capacity, self.error_rate)
+
+    def _load(self, question_id):
+        from .models import QuestionVoters
+
+        try:
+            data = QuestionVoters.objects.filter(question_id=question_id).values_list('bits', flat=True).first()
+        except DatabaseError:
+            logger.exception('问题 %s 的投票记录加载失败', question_id)
+            data = None
+        return self._from_bytes(data)
+
+    @contextmanager
+    def _voters(self, question_id):
+        """持有该问题的锁返回它的过滤器，需要时加载或同步"""
+        with self._lock:
+            voters = self._filters.pop(question_id, None) or Voters()
+            self._filters[question_id] = voters
+            evicted = []
+            while len(self._filters) > getattr(settings, 'POLL_DEDUP_MAX_QUESTIONS', 50):
+                evicted.append(self._filters.popitem(last=False))
+
+        for evicted_id, evicted_voters in evicted:
+            with evicted_voters.lock:
+                if evicted_voters.bloom is not None:
+                    self._sync(evicted_id, evicted_voters)
+                evicted_voters.evicted = True
+
+        with voters.lock:
+            if voters.bloom is None:
+                voters.bloom = self._load(question_id)
+                voters.synced = time.monotonic()
+            elif time.monotonic() - voters.synced >= getattr(settings, 'POLL_DEDUP_SYNC_INTERVAL', 10):
+                self._sync(question_id, voters)
+            yield voters
+
+    def _sync(self, question_id, voters):
+        """有未同步的修改时合并写回数据库，否则只加载其他进程的记录；写入失败时保留修改，下次再同步"""
+        from .models import QuestionVoters
+
+        if not voters.dirty:
+            voters.bloom.merge(self._load(question_id))
+            voters.synced = time.monotonic()
+            return
+        try:
+            with transaction.atomic():
+                row = QuestionVoters.objects.select_for_update().filter(question_id=question_id).first()
+                if row is None:
+                    row = QuestionVoters(question_id=question_id)
+                else:
+                    voters.bloom.merge(self._from_bytes(row.bits))
+                row.bits = voters.bloom.to_bytes()
+                row.save()
+        except DatabaseError:
+            logger.exception('问题 %s 的投票记录保存失败，等待下次同步', question_id)
+        else:
+            voters.dirty = False
+        voters.synced = time.monotonic()
+
+    def has_voted(self, question_id, uid):
+        with self._voters(question_id) as voters:
+            return uid in voters.bloom
+
+    def mark_voted(self, question_id, uid):
+        with self._voters(question_id) as voters:
+            if voters.bloom.add(uid):
+                voters.dirty = True
+                if voters.evicted:  # 等待锁期间被淘汰，之后不会再同步
+                    self._sync(question_id, voters)
+        with self._lock:
+            if not self._registered:
+                atexit.register(self.sync, dirty_only=True)
+                self._registered = True
+
+    def sync(self, dirty_only=False):
+        """立即把所有问题的过滤器与数据库合并写回，dirty_only为True时只写回有未同步修改的（进程退出时）"""
+        with self._lock:
+            filters = list(self._filters.items())
+        for question_id, voters in filters:
+            with voters.lock:
+                if voters.bloom is not None and (voters.dirty or not dirty_only):
+                    self._sync(question_id, voters)
+
+    def reset(self):
+        with self._lock:
+            self._filters.clear()
+
+
+def client_ip(request):
+    """
+    客户端IP：部署在POLL_TRUSTED_PROXIES层反向代理（nginx等追加X-Forwarded-For）之后时，
+    取X-Forwarded-For从右往左第N个地址（最外层可信代理看到的地址，客户端自己伪造的部分在它左边）；
+    否则取REMOTE_ADDR，部署在代理之后却没有配置时所有客户端共用代理的地址，会被当作同一个客户端限流
+    """
+    proxies = getattr(settings, 'POLL_TRUSTED_PROXIES', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    if proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',') if address.strip()]
+        if addresses:
+            return addresses[-min(proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+rate_limiter = RateLimiter()
+voter_filter = VoterFilter()
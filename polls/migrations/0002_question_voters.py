@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionVoters',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='polls.Question')),
+                ('bits', models.BinaryField()),
+                ('updated_time', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
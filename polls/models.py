@@ -28,3 +28,9 @@ class Choice(models.Model):
     def __str__(self):
         return self.choice_text
 
+
+class QuestionVoters(models.Model):
+    """每个问题已投票uid的Bloom过滤器（polls.guard.VoterFilter），多个进程合并后保存在这里"""
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True)
+    bits = models.BinaryField()
+    updated_time = models.DateTimeField(auto_now=True)
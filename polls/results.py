@@ -0,0 +1,77 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .counter import vote_counter
+from .models import Choice, Question
+
+
+class PollResults:
+    """
+    每个问题的投票结果快照（总票数、各选项票数和百分比）保存在缓存中：
+    1、结果页、SSE推送都读取快照，不再每次查询问题和选项；
+    2、每记录一票直接在快照上累加并重新计算百分比，不需要重新查询数据库，SSE连接定时读取快照推送变化；
+    3、问题、选项在后台被修改时由polls.signals清除快照，下次读取时重建（包含当前进程还没有写库的缓冲票数）。
+    注意：多进程同时累加同一个快照时get+set可能丢失一次更新，快照过期（POLL_RESULTS_CACHE_TIMEOUT）后按数据库重建。
+    """
+    KEY = 'poll:results:%s'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'POLL_RESULTS_CACHE_TIMEOUT', 5 * 60)
+
+    @staticmethod
+    def with_percents(results):
+        total = sum(choice['votes'] for choice in results['choices'])
+        results['total'] = total
+        for choice in results['choices']:
+            choice['percent'] = round(choice['votes'] * 100.0 / total, 1) if total else 0.0
+        return results
+
+    def build(self, question_id):
+        question = Question.objects.filter(pk=question_id).values('id', 'question_text').first()
+        if question is None:
+            return None
+        choices = list(Choice.objects.filter(question_id=question_id).order_by('id').values('id', 'choice_text', 'votes'))
+        pending = vote_counter.pending(choice['id'] for choice in choices)
+        for choice in choices:
+            choice['votes'] += pending.get(choice['id'], 0)
+        return self.with_percents({'id': question['id'], 'question_text': question['question_text'],
+                                   'choices': choices})
+
+    def get(self, question_id):
+        """返回快照，问题不存在时返回None"""
+        results = cache.get(self.KEY % question_id)
+        if results is None:
+            results = self.build(question_id)
+            if results is not None:
+                cache.set(self.KEY % question_id, results, self.timeout)
+        return results
+
+    def record_vote(self, question_id, choice_id, num=1):
+        """
+        在快照上累加票数（调用时票数已经写入数据库或投票缓冲）；
+        快照不存在或没有这个选项（刚添加）时按数据库重建，重建结果已经包含这一票
+        """
+        with self._lock:
+            results = cache.get(self.KEY % question_id)
+            choice = next((choice for choice in results['choices'] if choice['id'] == choice_id), None) if results else None
+            if choice is None:
+                results = self.build(question_id)
+                if results is None:
+                    return None
+            else:
+                choice['votes'] += num
+                self.with_percents(results)
+            cache.set(self.KEY % question_id, results, self.timeout)
+        return results
+
+    def invalidate(self, question_id):
+        cache.delete(self.KEY % question_id)
+
+
+poll_results = PollResults()
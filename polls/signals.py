@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .counter import vote_counter
+from .models import Choice, Question
+from .results import poll_results
+
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_question_results(sender, instance, **kwargs):
+    poll_results.invalidate(instance.id)
+    vote_counter.invalidate(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def invalidate_choice_results(sender, instance, **kwargs):
+    """后台修改选项（投票计数走UPDATE语句，不会触发这里）"""
+    poll_results.invalidate(instance.question_id)
+    vote_counter.invalidate(instance.question_id)
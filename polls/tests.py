@@ -1,8 +1,18 @@
 import datetime
-from django.test import TestCase
+import json
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
 from django.urls import reverse
-from .models import Question
+from .bloom import BloomFilter
+from .counter import VoteCounter, vote_counter
+from .guard import RateLimiter, VoterFilter, client_ip, rate_limiter, voter_filter
+from .models import Choice, Question, QuestionVoters
+from .results import poll_results
 
 
 # Create your tests here.
@@ -71,3 +81,284 @@ class QuestionDetailViewTests(TestCase):
         url = reverse('polls:detail', args=(past_question.id,))
         response = self.client.get(url)
         self.assertContains(response, past_question.question_text)
+
+
+@override_settings(POLL_VOTE_GUARD=False)  # 同一客户端反复投票，测试计数本身
+class VoteTests(TransactionTestCase):
+    """多个线程同时投票，最终票数必须与投票次数完全一致"""
+    THREADS = 8
+    VOTES = 25
+
+    def setUp(self):
+        self.question = create_question('Concurrent question', days=-1)
+        self.choices = [self.question.choice_set.create(choice_text='choice %d' % i) for i in range(2)]
+        self.url = reverse('polls:vote', args=(self.question.id,))
+        self.addCleanup(vote_counter.invalidate, self.question.id)
+
+    def vote_concurrently(self):
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def worker(index):
+            client = Client()
+            barrier.wait()
+            try:
+                for i in range(self.VOTES):
+                    choice = self.choices[(index + i) % 2]
+                    response = client.post(self.url, {'choice': choice.id})
+                    if response.status_code != 302:
+                        errors.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def tallies(self):
+        return sorted(Choice.objects.filter(question=self.question).values_list('votes', flat=True))
+
+    def test_atomic_votes(self):
+        self.vote_concurrently()
+        total = self.THREADS * self.VOTES
+        self.assertEqual(self.tallies(), [total // 2, total // 2])
+
+    @override_settings(POLL_VOTE_FLUSH_INTERVAL=60)
+    def test_buffered_votes(self):
+        with mock.patch.object(vote_counter, 'start'):
+            self.vote_concurrently()
+            total = self.THREADS * self.VOTES
+            self.assertEqual(self.tallies(), [0, 0])
+            self.assertEqual(sum(vote_counter.pending().values()), total)
+            self.assertEqual(vote_counter.flush(), 2)
+        self.assertEqual(self.tallies(), [total // 2, total // 2])
+        self.assertEqual(vote_counter.pending(), {})
+
+    @override_settings(POLL_VOTE_FLUSH_INTERVAL=60)
+    def test_buffered_vote_choices_cached(self):
+        with mock.patch.object(vote_counter, 'start'):
+            with self.assertNumQueries(1):
+                self.assertTrue(vote_counter.vote(self.question.id, self.choices[0].id))
+            with self.assertNumQueries(0):
+                self.assertTrue(vote_counter.vote(self.question.id, self.choices[1].id))
+            added = self.question.choice_set.create(choice_text='added')
+            self.assertTrue(vote_counter.vote(self.question.id, added.id))
+            with self.assertNumQueries(1):  # 不属于该问题的选项重新查询一次
+                self.assertFalse(vote_counter.vote(self.question.id, 0))
+            vote_counter.flush()
+        self.assertEqual(self.tallies(), [1, 1, 1])
+
+    def test_invalid_choice(self):
+        other = create_question('Other question', days=-1).choice_set.create(choice_text='other')
+        for data in ({}, {'choice': 'abc'}, {'choice': other.id}):
+            response = self.client.post(self.url, data)
+            self.assertContains(response, 'select a choice.')
+        self.assertEqual(self.tallies(), [0, 0])
+
+    def test_flush_failure_restores_votes(self):
+        counter = VoteCounter(shards=4)
+        with override_settings(POLL_VOTE_FLUSH_INTERVAL=60), mock.patch.object(counter, 'start'):
+            for _ in range(3):
+                counter.vote(self.question.id, self.choices[0].id)
+            with mock.patch.object(Choice.objects, 'filter', side_effect=DatabaseError), \
+                    self.assertLogs('polls.counter', 'ERROR'):
+                self.assertEqual(counter.flush(), 0)
+            self.assertEqual(counter.pending(), {self.choices[0].id: 3})
+            self.assertEqual(counter.flush(), 1)
+        self.assertEqual(self.tallies(), [0, 3])
+
+
+@override_settings(POLL_VOTE_GUARD=False)
+class ResultsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = create_question('Live question', days=-1)
+        self.choices = [self.question.choice_set.create(choice_text='choice %d' % i) for i in range(2)]
+
+    def vote(self, choice):
+        return self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': choice.id})
+
+    def test_snapshot_updated_on_vote(self):
+        url = reverse('polls:results', args=(self.question.id,))
+        self.client.get(url)
+        for choice in (self.choices[0], self.choices[0], self.choices[0], self.choices[1]):
+            self.vote(choice)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual([(choice['votes'], choice['percent']) for choice in response.context['results']['choices']],
+                         [(3, 75.0), (1, 25.0)])
+        self.assertEqual(poll_results.build(self.question.id), poll_results.get(self.question.id))
+
+        self.question.choice_set.create(choice_text='choice 2')
+        self.assertContains(self.client.get(url), 'choice 2')
+        self.assertEqual(self.client.get(reverse('polls:results', args=(999,))).status_code, 404)
+
+    @override_settings(POLL_SSE_MIN_INTERVAL=0, POLL_SSE_KEEPALIVE=0, POLL_SSE_MAX_DURATION=0.5)
+    def test_stream(self):
+        response = self.client.get(reverse('polls:results-stream', args=(self.question.id,)))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = iter(response.streaming_content)
+
+        def next_event():
+            chunk = next(chunks).decode()
+            while not chunk.startswith('event:'):
+                chunk = next(chunks).decode()
+            data = chunk.split('data: ', 1)[1]
+            return [choice['votes'] for choice in json.loads(data)['choices']]
+
+        next(chunks)  # retry
+        self.assertEqual(next_event(), [0, 0])
+        self.vote(self.choices[1])
+        self.vote(self.choices[1])
+        self.assertEqual(next_event(), [0, 2])  # 两次投票合并为一次推送
+        self.assertEqual(next(chunks), b': keepalive\n\n')
+
+        # 其他进程的投票：写入数据库后共享缓存中的快照被重建
+        Choice.objects.filter(pk=self.choices[0].pk).update(votes=5)
+        poll_results.invalidate(self.question.id)
+        self.assertEqual(next_event(), [5, 2])
+        for _ in chunks:  # 超过最长时间后结束
+            pass
+
+    @override_settings(POLL_SSE_MAX_STREAMS=1, POLL_SSE_MIN_INTERVAL=0, POLL_SSE_MAX_DURATION=0)
+    def test_stream_limit(self):
+        url = reverse('polls:results-stream', args=(self.question.id,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        busy = self.client.get(url)
+        self.assertEqual(busy.status_code, 503)
+        self.assertIn('Retry-After', busy)
+
+        response.close()  # 客户端在第一次输出前断开也会释放
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        list(response.streaming_content)  # 结束后释放
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+
+class BloomFilterTests(TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add('uid-%d' % i)
+        self.assertTrue(all('uid-%d' % i in bloom for i in range(1000)))
+        false_positives = sum('other-%d' % i in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_merge_and_serialize(self):
+        a, b = BloomFilter(100, 0.01), BloomFilter(100, 0.01)
+        a.add('a')
+        b.add('b')
+        merged = BloomFilter.from_bytes(a.merge(b).to_bytes(), 100, 0.01)
+        self.assertIn('a', merged)
+        self.assertIn('b', merged)
+        with self.assertRaises(ValueError):
+            BloomFilter.from_bytes(merged.to_bytes(), 1000, 0.01)
+
+
+class VoteGuardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        rate_limiter.reset()
+        voter_filter.reset()
+        self.addCleanup(voter_filter.reset)
+        self.question = create_question('Guarded question', days=-1)
+        self.choice = self.question.choice_set.create(choice_text='choice')
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def votes(self):
+        return Choice.objects.get(pk=self.choice.pk).votes
+
+    def test_duplicate_vote(self):
+        self.client.get(reverse('polls:detail', args=(self.question.id,)))  # 投票页设置uid cookie
+        self.client.post(self.url, {'choice': self.choice.id})
+        with self.assertNumQueries(1):  # 只查询问题
+            response = self.client.post(self.url, {'choice': self.choice.id})
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(self.votes(), 1)
+
+        Client().post(self.url, {'choice': 'abc'})  # 无效的投票不记录uid
+        self.client.cookies.clear()
+        self.client.post(self.url, {'choice': self.choice.id})
+        self.assertEqual(self.votes(), 2)
+
+    def test_cookieless_votes_not_recorded(self):
+        """没有cookie的请求每次都生成新uid，不记录到过滤器中"""
+        with mock.patch.object(voter_filter, 'mark_voted') as mark_voted:
+            response = Client().post(self.url, {'choice': self.choice.id})
+        mark_voted.assert_not_called()
+        self.assertFalse(voter_filter.has_voted(self.question.id, response.cookies['uid'].value))
+        self.assertEqual(self.votes(), 1)
+
+    def test_voters_persisted(self):
+        self.client.get(reverse('polls:detail', args=(self.question.id,)))
+        self.client.post(self.url, {'choice': self.choice.id})
+        uid = self.client.cookies['uid'].value
+        voter_filter.sync()
+        voter_filter.reset()  # 相当于另一个进程或重启后
+        self.assertTrue(QuestionVoters.objects.filter(question=self.question).exists())
+        self.assertTrue(voter_filter.has_voted(self.question.id, uid))
+        self.assertFalse(voter_filter.has_voted(self.question.id, 'other'))
+
+        voter_filter.mark_voted(self.question.id, 'other')  # 两个进程各自记录，同步时合并
+        voter = VoterFilter()
+        voter.mark_voted(self.question.id, 'third')
+        voter_filter.sync()
+        voter.sync()
+        voter_filter.reset()
+        self.assertTrue(all(voter_filter.has_voted(self.question.id, uid) for uid in (uid, 'other', 'third')))
+
+    @override_settings(POLL_DEDUP_MAX_QUESTIONS=1)
+    def test_filters_bounded(self):
+        other = create_question('Other question', days=-1)
+        voter_filter.mark_voted(self.question.id, 'uid')
+        voter_filter.has_voted(other.id, 'uid')  # 淘汰第一个问题的过滤器，淘汰前写入数据库
+        self.assertEqual(list(voter_filter._filters), [other.id])
+        self.assertTrue(voter_filter.has_voted(self.question.id, 'uid'))
+
+    def test_unknown_question(self):
+        self.client.get(reverse('polls:detail', args=(self.question.id,)))
+        response = self.client.post(reverse('polls:vote', args=(self.question.id + 100,)), {'choice': self.choice.id})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(list(voter_filter._filters), [])  # 不存在的问题不创建过滤器
+
+    def test_questions_locked_separately(self):
+        """一个问题加载、同步数据库时，其他问题的投票不需要等待"""
+        other = create_question('Other question', days=-1)
+        voter_filter.has_voted(other.id, 'uid')  # 先加载，线程中不访问数据库
+        results = []
+        with voter_filter._voters(self.question.id):
+            thread = threading.Thread(target=lambda: results.append(voter_filter.has_voted(other.id, 'uid')))
+            thread.start()
+            thread.join(timeout=5)
+        self.assertEqual(results, [False])
+
+    @override_settings(POLL_TRUSTED_PROXIES=1)
+    def test_client_ip_behind_proxy(self):
+        factory = RequestFactory()
+        request = factory.post(self.url, HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(client_ip(request), '2.2.2.2')  # 客户端伪造的1.1.1.1不可信
+        self.assertEqual(client_ip(factory.post(self.url, REMOTE_ADDR='10.0.0.1')), '10.0.0.1')
+        with override_settings(POLL_TRUSTED_PROXIES=0):
+            self.assertEqual(client_ip(request), '10.0.0.1')
+
+        statuses = [Client(HTTP_X_FORWARDED_FOR='3.3.3.%d' % (i % 2)).post(self.url, {'choice': self.choice.id})
+                    .status_code for i in range(12)]
+        self.assertEqual(statuses.count(429), 2)  # 每个客户端各自5票
+
+    @override_settings(POLL_VOTE_BURST=3, POLL_VOTE_RATE=0.5)
+    def test_rate_limit(self):
+        statuses = [Client().post(self.url, {'choice': self.choice.id}).status_code for _ in range(5)]
+        self.assertEqual(statuses, [302, 302, 302, 429, 429])
+        self.assertEqual(self.votes(), 3)
+
+        limiter = RateLimiter()
+        self.assertEqual([limiter.allow('ip', now=0)[0] for _ in range(4)], [True, True, True, False])
+        self.assertEqual(limiter.allow('ip', now=0)[1], 2)
+        self.assertTrue(limiter.allow('ip', now=2)[0])
+        self.assertTrue(limiter.allow('other', now=2)[0])
@@ -13,6 +13,8 @@ urlpatterns = [
     # ex: /polls/5/results/
     # path('<int:question_id>/results/', views.results, name='results'),
     path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
+    # ex: /polls/5/results/stream/
+    path('<int:pk>/results/stream/', views.results_stream, name='results-stream'),
     # ex: /polls/5/vote/
     path('<int:question_id>/vote/', views.vote, name='vote'),
 ]
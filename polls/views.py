@@ -1,11 +1,20 @@
-from django.http import HttpResponse, Http404, HttpResponseRedirect
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, Http404, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
 from django.shortcuts import get_object_or_404
 from django.template import loader
 from django.urls import reverse
 from django.views import generic
 from django.utils import timezone
-from .models import Question, Choice
+from blog.middleware.user_id import USER_KEY
+from .counter import vote_counter
+from .guard import client_ip, rate_limiter, voter_filter
+from .models import Question
+from .results import poll_results
 
 
 # Create your views here.
@@ -30,15 +39,28 @@ def detail(request, question_id):
 
 
 def vote(request, question_id):
-    question = get_object_or_404(Question, pk=question_id)
-    try:
-        selected_choice = question.choice_set.get(pk=request.POST['choice'])
-    except (KeyError, Choice.DoesNotExist):
+    guarded = getattr(settings, 'POLL_VOTE_GUARD', True)
+    # 只对cookie中已有的uid去重：没有cookie的请求每次都是新uid，记录下来只会填满过滤器、提高误判率
+    voter = request.COOKIES.get(USER_KEY)
+    if guarded:  # 限流在内存中完成，被拒绝的请求不会查询数据库
+        allowed, wait = rate_limiter.allow(client_ip(request))
+        if not allowed:
+            response = HttpResponse('Too many votes, please try again later.', status=429)
+            if wait is not None:
+                response['Retry-After'] = max(int(wait + 0.999), 1)
+            return response
+
+    question = get_object_or_404(Question, pk=question_id)  # 不存在的问题不创建过滤器
+    if guarded and voter and voter_filter.has_voted(question.id, voter):  # 重复投票不计票，直接查看结果
+        return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
+    choice_id = request.POST.get('choice', '')
+    # 原来的votes += 1; save()是先读后写，并发投票会丢票，改为由vote_counter原子累加
+    if not (choice_id.isdigit() and vote_counter.vote(question.id, int(choice_id))):
         return render(request, 'polls/detail.html', {'question': question, 'error_message': "You didn't select a choice."})
-    else:
-        selected_choice.votes += 1
-        selected_choice.save()
-        return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))  # POST后重定向避免用户多次提交
+    if guarded and voter:
+        voter_filter.mark_voted(question.id, voter)
+    poll_results.record_vote(question.id, int(choice_id))
+    return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))  # POST后重定向避免用户多次提交
 
 
 def results(request, question_id):
@@ -72,6 +94,111 @@ class DetailView(generic.DetailView):
         return Question.objects.filter(pub_date__lte=timezone.now())
 
 
-class ResultsView(generic.DetailView):
-    model = Question
+class ResultsView(generic.TemplateView):
+    """结果页读取缓存的结果快照（polls.results），页面打开后通过SSE接收更新，不需要反复刷新"""
     template_name = 'polls/results.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        results = poll_results.get(self.kwargs['pk'])
+        if results is None:
+            raise Http404('Question does not exist')
+        context['results'] = results
+        return context
+
+
+def format_event(results):
+    return 'event: results\ndata: %s\n\n' % json.dumps(results)
+
+
+class StreamSlots:
+    """
+    每个进程同时保持的SSE连接数不超过POLL_SSE_MAX_STREAMS，超过时返回503，
+    避免投票高峰时结果页的长连接占满worker，投票和其他页面反而无法响应
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count = 0
+
+    @property
+    def limit(self):
+        return getattr(settings, 'POLL_SSE_MAX_STREAMS', 4)
+
+    def acquire(self):
+        with self._lock:
+            if self._count >= self.limit:
+                return False
+            self._count += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._count -= 1
+
+
+stream_slots = StreamSlots()
+
+
+class ResultsStream:
+    """响应关闭时（正常结束或客户端断开）释放连接数，生成器还没有开始迭代时也能释放"""
+
+    def __init__(self, events):
+        self._events = events
+        self._closed = False
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        self._events.close()
+        if not self._closed:
+            self._closed = True
+            stream_slots.release()
+
+
+def stream_results(question_id, results):
+    """
+    先推送当前结果，之后每隔POLL_SSE_MIN_INTERVAL秒读取一次缓存中的结果快照（polls.results），有变化时推送：
+    1、快照保存在共享缓存中，其他进程记录的投票也能推送；期间的多次投票合并为一次推送；
+    2、POLL_SSE_KEEPALIVE秒没有更新时发送注释行保持连接；
+    3、连接最长保持POLL_SSE_MAX_DURATION秒后结束，浏览器的EventSource会自动重连。
+    注意：推送期间一直占用一个worker（线程），生产环境需要使用gevent等异步worker，
+    并把POLL_SSE_MAX_STREAMS设置为小于每个进程能同时处理的请求数。
+    """
+    min_interval = getattr(settings, 'POLL_SSE_MIN_INTERVAL', 1)
+    keepalive = getattr(settings, 'POLL_SSE_KEEPALIVE', 15)
+    deadline = time.monotonic() + getattr(settings, 'POLL_SSE_MAX_DURATION', 30)
+
+    yield 'retry: %d\n' % (min_interval * 1000 or 1000)
+    yield format_event(results)
+    last_sent = time.monotonic()
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(min_interval, remaining))
+        latest = poll_results.get(question_id)
+        if latest is None:  # 问题已被删除
+            return
+        if latest != results:
+            results = latest
+            yield format_event(results)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= keepalive:
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+
+
+def results_stream(request, pk):
+    results = poll_results.get(pk)
+    if results is None:
+        raise Http404('Question does not exist')
+    if not stream_slots.acquire():  # EventSource收到503后不再重连，结果页退回为定时重连
+        response = HttpResponse('Too many live result streams, please try again later.', status=503)
+        response['Retry-After'] = 30
+        return response
+    response = StreamingHttpResponse(ResultsStream(stream_results(pk, results)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx不缓冲，事件立即发给客户端
+    return response
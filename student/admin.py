@@ -7,6 +7,7 @@ class StudentAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'sex', 'profession', 'email', 'qq', 'phone', 'status', 'created_time')
     list_filter = ('sex', 'status', 'created_time')
     search_fields = ('name', 'profession')
+    show_full_result_count = False  # 过滤、搜索时不再额外COUNT整张表
     fieldsets = (
         (None, {
             'fields': (
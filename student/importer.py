@@ -0,0 +1,122 @@
+"""
+学员批量导入：每行按StudentForm的规则校验，校验通过的行攒够batch_size条后bulk_create一次写入，
+不再每个学员一条INSERT；校验失败的行记录行号和错误信息，不影响其他行。
+支持CSV（utf-8，可带BOM）和Excel（.xlsx，需要安装openpyxl），表头可以是字段名或中文名（如name或姓名），
+性别、审核状态可以填数字或中文（如1或男）。
+"""
+import csv
+import io
+import os
+
+from django.db import transaction
+
+from .forms import StudentForm
+from .models import Student
+
+FIELDS = StudentForm._meta.fields + ('status',)
+HEADERS = {str(Student._meta.get_field(name).verbose_name): name for name in FIELDS}
+CHOICES = {
+    'sex': {label: value for value, label in Student.SEX_ITEMS},
+    'status': {label: value for value, label in Student.STATUS_ITEMS},
+}
+
+
+def normalize_row(row):
+    """表头转为字段名，选项的中文转为数字，忽略无关的列"""
+    data = {}
+    for header, value in row.items():
+        header = (header or '').strip()
+        name = HEADERS.get(header, header)
+        if name not in FIELDS:
+            continue
+        value = '' if value is None else str(value).strip()
+        if value.endswith('.0') and value[:-2].isdigit():  # Excel中的数字单元格，如QQ号
+            value = value[:-2]
+        data[name] = CHOICES.get(name, {}).get(value, value)
+    return data
+
+
+def read_csv(stream):
+    if isinstance(stream, (bytes, bytearray)):
+        stream = io.BytesIO(stream)
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    return csv.DictReader(stream)
+
+
+def read_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError('导入Excel需要安装openpyxl：pip install openpyxl')
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    headers = [str(cell or '') for cell in next(rows, ())]
+    for values in rows:
+        yield dict(zip(headers, values))
+    workbook.close()
+
+
+def read_rows(path):
+    if os.path.splitext(path)[1].lower() in ('.xlsx', '.xlsm'):
+        yield from read_xlsx(path)
+    else:
+        with open(path, 'rb') as f:
+            yield from read_csv(f)
+
+
+class RowValidator:
+    """
+    按StudentForm的规则校验每一行：表单实例化时会深拷贝全部字段（逐行新建表单时约占一半耗时），
+    这里复用同一个表单，每行只重新绑定数据和instance
+    """
+
+    def __init__(self):
+        self.form = StudentForm(data={})
+
+    def build(self, data):
+        """返回(Student, None)或(None, 错误信息)"""
+        form = self.form
+        form.data, form.instance, form._errors = data, Student(), None
+        if not form.is_valid():
+            errors = '；'.join('%s: %s' % (field, '，'.join(messages)) for field, messages in form.errors.items())
+            return None, errors
+        student = form.save(commit=False)
+        status = data.get('status', '')
+        if status != '':
+            if str(status) not in {str(value) for value, _ in Student.STATUS_ITEMS}:
+                return None, 'status: 无效的审核状态'
+            student.status = int(status)
+        return student, None
+
+
+def import_students(rows, batch_size=1000, dry_run=False):
+    """
+    返回(导入数量, [(行号, 错误信息), ...])，行号从2开始（第1行为表头）；
+    每批在一个事务中写入，dry_run时只校验不写入
+    """
+    created, errors, batch = 0, [], []
+    validator = RowValidator()
+
+    def flush():
+        nonlocal created
+        if batch and not dry_run:
+            with transaction.atomic():
+                Student.objects.bulk_create(batch)  # 单条INSERT的行数由数据库后端按参数个数上限拆分
+        created += len(batch)
+        batch.clear()
+
+    for line, row in enumerate(rows, start=2):
+        data = normalize_row(row)
+        if not any(data.values()):  # 空行
+            continue
+        student, error = validator.build(data)
+        if error:
+            errors.append((line, error))
+            continue
+        batch.append(student)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return created, errors
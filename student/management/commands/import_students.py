@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from student.importer import import_students, read_rows
+
+
+class Command(BaseCommand):
+    help = '从CSV或Excel（.xlsx）批量导入学员：按StudentForm校验，分批bulk_create写入'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV或.xlsx文件路径，第一行为表头（字段名或中文名）')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的学员数')
+        parser.add_argument('--dry-run', action='store_true', help='只校验，不写入数据库')
+        parser.add_argument('--max-errors', type=int, default=20, help='最多输出的错误行数')
+
+    def handle(self, *args, **options):
+        start = time.time()
+        try:
+            created, errors = import_students(read_rows(options['path']), options['batch_size'], options['dry_run'])
+        except (OSError, ImportError) as e:
+            raise CommandError(e)
+
+        for line, error in errors[:options['max_errors']]:
+            self.stderr.write('第 %d 行：%s' % (line, error))
+        if len(errors) > options['max_errors']:
+            self.stderr.write('……共 %d 行校验失败' % len(errors))
+        self.stdout.write(self.style.SUCCESS('%s学员 %d 名，失败 %d 行，耗时 %.2fs' % (
+            '校验通过' if options['dry_run'] else '导入', created, len(errors), time.time() - start)))
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student', '0002_auto_20190810_1159'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='student',
+            options={'ordering': ['-id'], 'verbose_name': '学员信息', 'verbose_name_plural': '学员信息'},
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='created_time',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='创建时间'),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='status',
+            field=models.IntegerField(choices=[(0, '申请'), (1, '通过'), (2, '拒绝')], db_index=True, default=0, verbose_name='审核状态'),
+        ),
+    ]
@@ -21,8 +21,9 @@ class Student(models.Model):
     qq = models.CharField(max_length=128, verbose_name="QQ")
     phone = models.CharField(max_length=128, verbose_name="电话")
 
-    status = models.IntegerField(choices=STATUS_ITEMS, default=0, verbose_name="审核状态")
-    created_time = models.DateTimeField(auto_now_add=True, editable=False, verbose_name="创建时间")
+    # 列表页、后台按审核状态和创建时间过滤（二级索引中包含主键，status索引同时满足按id倒序分页）
+    status = models.IntegerField(choices=STATUS_ITEMS, default=0, db_index=True, verbose_name="审核状态")
+    created_time = models.DateTimeField(auto_now_add=True, editable=False, db_index=True, verbose_name="创建时间")
 
     def __str__(self):
         return '<Student: {}>'.format(self.name)
@@ -33,3 +34,4 @@ class Student(models.Model):
 
     class Meta:
         verbose_name = verbose_name_plural = "学员信息"
+        ordering = ['-id']
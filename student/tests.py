@@ -1,5 +1,13 @@
-from django.test import TestCase
+import io
+import os
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from .importer import import_students, read_csv
 from .models import Student
 
 
@@ -40,4 +48,76 @@ class StudentTestCase(TestCase):
         response = self.client.post(reverse('student:index'), data)
         self.assertEqual(response.status_code, 302)
         response = self.client.get(reverse('student:index'))
-        self.assertTrue(b'tester' in response.content)
\ No newline at end of file
+        self.assertTrue(b'tester' in response.content)
+
+
+class StudentListTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Student.objects.bulk_create([
+            Student(name='student%02d' % i, sex=i % 2 + 1, email='s%d@mail.com' % i, profession='Coder' if i % 3 else 'Tester',
+                    qq='1000%d' % i, phone='138000%d' % i, status=i % 3)
+            for i in range(30)
+        ])
+
+    def names(self, response):
+        return [student.name for student in response.context['students']]
+
+    @override_settings(STUDENT_PAGE_SIZE=4)
+    def test_paginated(self):
+        response = self.client.get(reverse('student:index'))
+        self.assertEqual(self.names(response)[:2], ['student29', 'student28'])
+        self.assertEqual(len(self.names(response)), 4)
+        self.assertContains(response, 'Page 1 of 8.')
+
+        response = self.client.get(reverse('student:index'), {'status': 1})
+        self.assertEqual(self.names(response), ['student28', 'student25', 'student22', 'student19'])
+        self.assertTrue(all(student.status == 1 for student in response.context['students']))
+        self.assertContains(response, '?before=%s&amp;page=2&status=1' % Student.objects.get(name='student19').id)
+
+        response = self.client.get(reverse('student:index'), {'q': 'tester'})
+        self.assertEqual(len(self.names(response)), 4)
+        self.assertContains(response, 'Page 1 of 3.')
+        response = self.client.get(reverse('student:index'), {'q': 'student05'})
+        self.assertEqual(self.names(response), ['student05'])
+
+
+class StudentImportTestCase(TestCase):
+    CSV = (
+        '姓名,性别,专业,Email,QQ,电话,备注\n'
+        'Alice,女,Coder,alice@mail.com,10001,13800000001,x\n'
+        'Bob,1,Tester,bob@mail.com,10002,13800000002,\n'
+        ',,,,,,\n'
+        'Carol,男,Coder,not-an-email,qq,13800000003,\n'
+        'Dave,未知,Coder,dave@mail.com,10004,13800000004,\n'
+    )
+
+    def test_import(self):
+        created, errors = import_students(read_csv(io.StringIO(self.CSV)), batch_size=2)
+        self.assertEqual(created, 3)
+        self.assertEqual([line for line, _ in errors], [5])
+        self.assertIn('email', errors[0][1])
+        self.assertIn('qq', errors[0][1])
+        alice = Student.objects.get(name='Alice')
+        self.assertEqual((alice.sex, alice.qq, alice.status), (2, '10001', 0))
+        self.assertIsNotNone(alice.created_time)
+        self.assertEqual(Student.objects.get(name='Dave').sex, 0)
+
+    def test_dry_run(self):
+        created, errors = import_students(read_csv(io.StringIO(self.CSV)), dry_run=True)
+        self.assertEqual((created, len(errors)), (3, 1))
+        self.assertFalse(Student.objects.filter(name='Alice').exists())
+
+    def test_command(self):
+        path = self.id().replace('.', '_') + '.csv'
+        with open(path, 'w', encoding='utf-8-sig') as f:
+            f.write(self.CSV)
+        try:
+            out, err = io.StringIO(), io.StringIO()
+            with CaptureQueriesContext(connection) as queries:
+                call_command('import_students', path, batch_size=2, stdout=out, stderr=err)
+            self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT')]), 2)  # 校验不查询数据库
+            self.assertIn('导入学员 3 名，失败 1 行', out.getvalue())
+            self.assertIn('第 5 行', err.getvalue())
+        finally:
+            os.remove(path)
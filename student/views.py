@@ -1,7 +1,12 @@
+from django.conf import settings
+from django.db.models import Q
 from django.shortcuts import render
 from django.http import HttpResponseRedirect
 from django.urls import reverse
-from django.views import View
+from django.utils.http import urlencode
+from django.views.generic import ListView
+
+from blog.paginator import KeysetPaginationMixin
 from .models import Student
 from .forms import StudentForm
 
@@ -33,39 +38,51 @@ def index(request):
     return render(request, 'student/index.html', context=context)
 
 
-class IndexView(View):
+class IndexView(KeysetPaginationMixin, ListView):
+    """
+    学员列表：按id倒序游标分页（见blog/paginator.py），可以按审核状态、性别过滤，按姓名、专业搜索；
+    原来一次查出并渲染全部学员，学员多了以后页面越来越慢
+    """
     template_name = 'student/index.html'
+    context_object_name = 'students'
+    FILTERS = ('status', 'sex')
 
-    def get_context(self):
-        students = Student.get_all()
-        context = {
-            'students': students
-        }
-        return context
+    def get_paginate_by(self, queryset):
+        return getattr(settings, 'STUDENT_PAGE_SIZE', 50)  # 每次请求读取，override_settings等修改后生效
 
-    def get(self, request):
-        context = self.get_context()
-        form = StudentForm()
+    def get_filters(self):
+        filters = {}
+        for name in self.FILTERS:
+            value = self.request.GET.get(name, '')
+            if value.lstrip('-').isdigit():
+                filters[name] = int(value)
+        return filters
+
+    def get_queryset(self):
+        queryset = Student.get_all().filter(**self.get_filters())
+        keyword = self.request.GET.get('q', '').strip()
+        if keyword:
+            queryset = queryset.filter(Q(name__icontains=keyword) | Q(profession__icontains=keyword))
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        params = dict(self.get_filters())
+        if self.request.GET.get('q', '').strip():
+            params['q'] = self.request.GET['q'].strip()
         context.update({
-            'form': form
+            'form': kwargs.get('form') or StudentForm(),
+            'filters': params,
+            'filter_query': urlencode(params),
+            'status_items': Student.STATUS_ITEMS,
+            'sex_items': Student.SEX_ITEMS,
         })
-        return render(request, self.template_name, context=context)
+        return context
 
     def post(self, request):
         form = StudentForm(request.POST)
         if form.is_valid():
-            cleaned_data = form.cleaned_data
-            student = Student()
-            student.name = cleaned_data['name']
-            student.sex = cleaned_data['sex']
-            student.email = cleaned_data['email']
-            student.profession = cleaned_data['profession']
-            student.qq = cleaned_data['qq']
-            student.phone = cleaned_data['phone']
-            student.save()
+            form.save()
             return HttpResponseRedirect(reverse('student:index'))
-        context = self.get_context()
-        context.update({
-            'form': form
-        })
-        return render(request, self.template_name, context=context)
\ No newline at end of file
+        self.object_list = self.get_queryset()
+        return self.render_to_response(self.get_context_data(form=form))